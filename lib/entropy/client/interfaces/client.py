@@ -87,6 +87,8 @@ class Client(Singleton, TextInterface, CalculatorsMixin,
         self._repo_error_messages_cache = set()
         self._repodb_cache = {}
         self._repodb_cache_mutex = threading.RLock()
+        self._repository_snapshots = None
+        self._repository_snapshots_count = 0
         self._memory_db_instances = {}
         self._real_installed_repository = None
         self._real_installed_repository_lock = threading.RLock()
@@ -26,7 +26,7 @@ from entropy.output import blue, darkred, red, darkgreen, purple, teal, brown, \
     bold, TextInterface
 from entropy.dump import dumpobj, loadobj
 from entropy.cache import EntropyCacher
-from entropy.db import EntropyRepository
+from entropy.db import EntropyRepository, changeset
 from entropy.exceptions import RepositoryError, SystemDatabaseError, \
     PermissionDenied
 from entropy.security import Repository as RepositorySecurity
@@ -174,7 +174,7 @@ class AvailablePackagesRepositoryUpdater(object):
         self._supported_download_items = (
             "db", "dbck", "dblight", "ck", "cklight", "compck",
             "lock", "dbdump", "dbdumplight", "dbdumplightck", "dbdumpck",
-            "meta_file", "meta_file_gpg", "notice_board"
+            "meta_file", "meta_file_gpg", "notice_board", "changesets"
         )
         self._developer_repo = \
             self._settings['repositories']['developer_repo']
@@ -868,9 +868,21 @@ class AvailablePackagesRepositoryUpdater(object):
             level = "info",
             header = "\t"
         )
-        dbconn = self._entropy.open_repository(self._repository_id)
-        dbconn.createAllIndexes()
-        dbconn.commit(force = True)
+        # cached instances are opened read-only (and possibly through
+        # a read-only URI), use a dedicated writable one.
+        self._entropy.close_repositories(mask_clear = False)
+        repo_data = self._settings['repositories']['available'][
+            self._repository_id]
+        dbfile = os.path.join(repo_data['dbpath'],
+            etpConst['etpdatabasefile'])
+        dbconn = self._entropy.open_generic_repository(
+            dbfile, name = self._repository_id, xcache = False,
+            indexing_override = True)
+        try:
+            dbconn.createAllIndexes()
+            dbconn.commit()
+        finally:
+            dbconn.close()
 
         inst_repo = self._entropy.installed_repository()
         if inst_repo is not None:
@@ -907,6 +919,7 @@ class AvailablePackagesRepositoryUpdater(object):
         meta_file_gpg = etpConst['etpdatabasemetafilesfile'] + \
             etpConst['etpgpgextension']
         md5_ext = etpConst['packagesmd5fileext']
+        changesets_file = etpConst['etpdatabasechangesetsfile']
         ec_cm2 = None
         ec_cm3 = None
         ec_cm4 = None
@@ -982,6 +995,10 @@ class AvailablePackagesRepositoryUpdater(object):
                 "%s/%s" % (uri, meta_file_gpg,),
                 "%s/%s" % (repo_dbpath, meta_file_gpg,),
             ),
+            'changesets': (
+                "%s/%s" % (uri, changesets_file,),
+                "%s/%s" % (repo_dbpath, changesets_file,),
+            ),
         }
 
         url, path = mymap.get(item)
@@ -994,6 +1011,16 @@ class AvailablePackagesRepositoryUpdater(object):
     def _download_item(self, uri, item, cmethod = None,
                        disallow_redirect = True, get_signature = False):
 
+        url, filepath = self._construct_paths(
+            uri, item, cmethod, get_signature = get_signature)
+        return self._download_url(url, filepath,
+            disallow_redirect = disallow_redirect)
+
+    def _download_url(self, url, filepath, disallow_redirect = True):
+        """
+        Download the given repository URL to filepath, using the
+        repository credentials, if any.
+        """
         my_repos = self._settings['repositories']
         avail_data = my_repos['available']
         repo_data = avail_data[self._repository_id]
@@ -1002,9 +1029,6 @@ class AvailablePackagesRepositoryUpdater(object):
         basic_pwd = repo_data.get('password')
         https_validate_cert = not repo_data.get('https_validate_cert') == "false"
 
-        url, filepath = self._construct_paths(
-            uri, item, cmethod, get_signature = get_signature)
-
         # See bug #3495, download the file to
         # a temporary location and then move it
         # if we are successful
@@ -1621,6 +1645,148 @@ class AvailablePackagesRepositoryUpdater(object):
 
         return False
 
+    def _changeset_database_sync(self, uri, revision):
+        """
+        Update the local repository database applying the changesets
+        published on the mirror, from the local revision to the remote
+        one, in a single transaction. If the repository GPG key is
+        available, the changeset index and every changeset must carry
+        a valid signature.
+        Return True if the repository has been updated.
+        """
+        if self.__force or self._developer_repo or \
+                not self._differential_update:
+            return False
+        if os.getenv("FORCE_EAPI") is not None:
+            return False
+
+        local_revision = AvailablePackagesRepository.revision(
+            self._repository_id)
+        if local_revision == -1 or local_revision >= revision:
+            return False
+
+        avail_data = self._settings['repositories']['available']
+        repo_dbpath = avail_data[self._repository_id]['dbpath']
+        dbfile = os.path.join(repo_dbpath, etpConst['etpdatabasefile'])
+        if not const_file_writable(dbfile):
+            return False
+
+        index_url, index_path = self._construct_paths(
+            uri, "changesets", None)
+        paths = []
+        sign_paths = []
+        repo_sec = None
+        if self._gpg_feature and self._install_gpg_key_if_available():
+            try:
+                repo_sec = self._entropy.RepositorySecurity()
+            except RepositorySecurity.GPGServiceNotAvailable:
+                repo_sec = None
+
+        def _verify(url, path):
+            # changesets are applied in place, they must carry the
+            # same guarantees of the full repository download.
+            if repo_sec is None:
+                return True
+            sign_path = self.__append_gpg_signature_to_path(path)
+            sign_paths.append(sign_path)
+            if not self._download_url(
+                    self.__append_gpg_signature_to_path(url), sign_path):
+                const_debug_write(__name__,
+                    "_changeset_database_sync: missing signature: %s" % (
+                        url,))
+                return False
+            is_valid, err_msg = repo_sec.verify_file(
+                self._repository_id, path, sign_path)
+            if not is_valid:
+                mytxt = "%s: %s, %s" % (
+                    darkred(_("Error during GPG verification of")),
+                    os.path.basename(path), err_msg,
+                )
+                self._entropy.output(
+                    mytxt, level = "error",
+                    header = "\t%s " % (bold("!!!"),)
+                )
+            return is_valid
+
+        try:
+            if not self._download_item(uri, "changesets"):
+                return False
+            if not _verify(index_url, index_path):
+                return False
+            try:
+                entries = changeset.read_changeset_index(index_path)
+            except (changeset.ChangesetError, IOError, OSError,) as err:
+                const_debug_write(__name__,
+                    "_changeset_database_sync: error: %s" % (err,))
+                return False
+
+            chain = changeset.changeset_chain(
+                entries, local_revision, revision)
+            if chain is None:
+                const_debug_write(__name__,
+                    "_changeset_database_sync: no changesets from %s to %s" % (
+                        local_revision, revision,))
+                return False
+
+            count = 0
+            for from_revision, to_revision, name, md5 in chain:
+                count += 1
+                mytxt = "%s: %s -> %s" % (
+                    blue(_("Fetching changeset")),
+                    darkgreen(str(from_revision)),
+                    darkgreen(str(to_revision)),
+                )
+                self._entropy.output(
+                    mytxt, importance = 0, level = "info",
+                    header = "\t", back = True,
+                    count = (count, len(chain),)
+                )
+                path = os.path.join(repo_dbpath, name)
+                paths.append(path)
+                if not self._download_url("%s/%s" % (uri, name), path):
+                    return False
+                if not entropy.tools.compare_md5(path, md5):
+                    return False
+                if not _verify("%s/%s" % (uri, name), path):
+                    return False
+
+            repo_db = self.__get_webserv_local_database()
+            if repo_db is None:
+                return False
+            try:
+                changeset.apply_changesets(repo_db, self._repository_id,
+                    paths, local_revision)
+            except (changeset.ChangesetError, Error, KeyError,
+                    TypeError,) as err:
+                mytxt = "%s: %s" % (
+                    blue(_("cannot apply repository changesets")),
+                    err,
+                )
+                self._entropy.output(
+                    mytxt, importance = 0, level = "info",
+                    header = blue("  # "),
+                )
+                return False
+            finally:
+                repo_db.close()
+
+            mytxt = "%s: %s" % (
+                blue(_("Applied repository changesets")),
+                darkgreen(str(len(chain))),
+            )
+            self._entropy.output(
+                mytxt, importance = 0, level = "info",
+                header = "\t",
+            )
+            return True
+
+        finally:
+            for path in paths + sign_paths + [index_path]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+
     def __handle_webserv_database_sync(self, mydbconn):
 
         try:
@@ -2064,6 +2230,8 @@ class AvailablePackagesRepositoryUpdater(object):
 
         # dealing with EAPI
         # setting some vars
+        downloaded_db_item = None
+        sig_down_status = False
         db_checksum_down_status = False
         do_db_update_transfer = False
         rc = 0
@@ -2081,7 +2249,10 @@ class AvailablePackagesRepositoryUpdater(object):
         cmethod = etpConst['etpdatabasecompressclasses'].get(
             cformat)
 
-        while True:
+        # changesets, if available, are the cheapest way to update
+        changeset_updated = self._changeset_database_sync(uri, revision)
+
+        while not changeset_updated:
 
             downloaded_db_item = None
             sig_down_status = False
@@ -2154,7 +2325,7 @@ class AvailablePackagesRepositoryUpdater(object):
 
         # Now we can unpack
         files_to_remove = []
-        if self._repo_eapi in (1, 2,):
+        if not changeset_updated and self._repo_eapi in (1, 2,):
 
             # if do_db_update_transfer == False and not None
             if (do_db_update_transfer is not None) and not \
@@ -2261,6 +2432,95 @@ class AvailablePackagesRepositoryUpdater(object):
         return EntropyRepositoryBase.REPOSITORY_UPDATED_OK
 
 
+class PackageMaskBitmap(object):
+    """
+    Result of the masking rules evaluation for all the packages of a
+    repository, see MaskableRepository.maskFilterBitmap(). Package
+    visibility is stored as a bitmap indexed by package identifier and
+    masking reasons as one byte per package identifier.
+    """
+
+    # masking reason value of package identifiers not evaluated
+    NOT_EVALUATED = 255
+
+    def __init__(self, key, visible, reasons):
+        """
+        PackageMaskBitmap constructor.
+
+        @param key: cache key the bitmap has been evaluated for
+        @type key: string
+        @param visible: visibility bitmap, bit n is set if package
+            identifier n is visible
+        @type visible: bytearray
+        @param reasons: masking reason identifiers, one per package
+            identifier
+        @type reasons: bytearray
+        """
+        self.key = key
+        self._visible = visible
+        self._reasons = reasons
+
+    @classmethod
+    def evaluate(cls, key, results):
+        """
+        Build a PackageMaskBitmap from maskFilter() results.
+
+        @param key: cache key the bitmap is evaluated for
+        @type key: string
+        @param results: dict composed by package identifier as key and
+            maskFilter() result as value
+        @type results: dict
+        @return: a new PackageMaskBitmap
+        @rtype: PackageMaskBitmap
+        """
+        size = 0
+        if results:
+            size = max(results) + 1
+        visible = bytearray((size + 7) // 8)
+        reasons = bytearray([cls.NOT_EVALUATED]) * size
+        for package_id, (result_id, reason) in results.items():
+            reasons[package_id] = reason
+            if result_id != -1:
+                visible[package_id >> 3] |= 1 << (package_id & 7)
+        return cls(key, visible, reasons)
+
+    def dump(self):
+        """
+        Return a picklable representation of the bitmap, see load().
+        """
+        return (self.key, bytes(self._visible), bytes(self._reasons))
+
+    @classmethod
+    def load(cls, data):
+        """
+        Rebuild a PackageMaskBitmap from its dump() representation.
+        """
+        key, visible, reasons = data
+        return cls(key, bytearray(visible), bytearray(reasons))
+
+    def is_visible(self, package_id):
+        """
+        Return whether the given package identifier is visible.
+        """
+        if package_id < 0 or package_id >= len(self._reasons):
+            return False
+        return bool(self._visible[package_id >> 3] & (1 << (package_id & 7)))
+
+    def result(self, package_id):
+        """
+        Return the maskFilter() result for the given package identifier
+        or None, if it has not been evaluated.
+        """
+        if package_id < 0 or package_id >= len(self._reasons):
+            return None
+        reason = self._reasons[package_id]
+        if reason == self.NOT_EVALUATED:
+            return None
+        if self.is_visible(package_id):
+            return package_id, reason
+        return -1, reason
+
+
 class MaskableRepository(EntropyRepositoryBase):
     """
     Objects inheriting from this class support package masking.
@@ -2273,6 +2533,9 @@ class MaskableRepository(EntropyRepositoryBase):
     _real_client_settings = None
     _real_client_settings_lock = threading.Lock()
 
+    _mask_bitmap = None
+    _mask_bitmap_lock = threading.RLock()
+
     def __init__(self, *args, **kwargs):
         super(MaskableRepository, self).__init__(*args, **kwargs)
 
@@ -2298,25 +2561,73 @@ class MaskableRepository(EntropyRepositoryBase):
         from entropy.client.interfaces import Client
         return Client()._settings_client_plugin
 
-    def _mask_filter_fetch_cache(self, package_id):
-        if self._caching:
-            return loadobj(
-                "MaskableRepositoryFilter/%s_%s/%s" % (
-                    self.name,
-                    self.atomMatchCacheKey(),
-                    package_id,
-                    )
-                )
+    def _mask_bitmap_key(self):
+        """
+        Return the cache key of the mask bitmap for the current packages
+        configuration and repository state.
+        """
+        return "%s_%s_%s" % (
+            self.name, self.atomMatchCacheKey(), self.checksum())
 
-    def _mask_filter_store_cache(self, package_id, value):
-        if self._caching:
-            dumpobj(
-                "MaskableRepositoryFilter/%s_%s/%s" % (
-                    self.name,
-                    self.atomMatchCacheKey(),
-                    package_id,
-                    ),
-                value)
+    def maskFilterBitmap(self):
+        """
+        Return the masking rules evaluation (live masking excluded) for
+        all the packages in the repository, for the current packages
+        configuration (see atomMatchCacheKey()) and repository checksum.
+        The bitmap is evaluated at once, kept in memory and stored in the
+        on-disk cache, so that other processes can reuse it.
+
+        @return: the mask bitmap
+        @rtype: PackageMaskBitmap
+        """
+        key = self._mask_bitmap_key()
+        bitmap = self._mask_bitmap
+        if bitmap is not None and bitmap.key == key:
+            return bitmap
+
+        with self._mask_bitmap_lock:
+            bitmap = self._mask_bitmap
+            if bitmap is not None and bitmap.key == key:
+                return bitmap
+
+            bitmap = None
+            cache_key = "MaskableRepositoryBitmap/%s" % (key,)
+            if self._caching:
+                data = loadobj(cache_key)
+                if data is not None:
+                    try:
+                        bitmap = PackageMaskBitmap.load(data)
+                    except (TypeError, ValueError):
+                        bitmap = None
+                    if bitmap is not None and bitmap.key != key:
+                        bitmap = None
+
+            if bitmap is None:
+                bitmap = self._maskFilter_evaluate_all(key)
+                if self._caching:
+                    dumpobj(cache_key, bitmap.dump())
+
+            self._mask_bitmap = bitmap
+            return bitmap
+
+    def _maskFilter_evaluate_all(self, key):
+        """
+        Evaluate the masking rules for all the packages in the repository,
+        retrieving the needed metadata with bulk queries.
+        """
+        package_ids = self.listAllPackageIds()
+        licenses = {}
+        if self._settings['license_mask']:
+            licenses = self.retrieveLicenseMany(package_ids)
+        keywords = self.retrieveKeywordsMany(package_ids)
+
+        results = {}
+        for package_id in package_ids:
+            results[package_id] = self._maskFilter_evaluate(
+                package_id, False,
+                license = licenses.get(package_id, ""),
+                keywords = keywords.get(package_id, frozenset()))
+        return PackageMaskBitmap.evaluate(key, results)
 
     def _maskFilter_live(self, package_id):
 
@@ -2455,13 +2766,15 @@ class MaskableRepository(EntropyRepositoryBase):
 
                 return -1, myr
 
-    def _maskFilter_package_license_mask(self, package_id, live):
+    def _maskFilter_package_license_mask(self, package_id, live,
+                                         license = None):
 
         if not self._settings['license_mask']:
             return
 
-        mylicenses = self.retrieveLicense(package_id)
-        mylicenses = mylicenses.strip().split()
+        if license is None:
+            license = self.retrieveLicense(package_id)
+        mylicenses = license.strip().split()
         lic_mask = self._settings['license_mask']
         for mylicense in mylicenses:
 
@@ -2479,12 +2792,14 @@ class MaskableRepository(EntropyRepositoryBase):
 
             return -1, myr
 
-    def _maskFilter_keyword_mask(self, package_id, live):
+    def _maskFilter_keyword_mask(self, package_id, live, keywords = None):
 
         # WORKAROUND for buggy entries
         # ** is fine then
         # TODO: remove this before 31-12-2011
-        mykeywords = self.retrieveKeywords(package_id)
+        mykeywords = keywords
+        if mykeywords is None:
+            mykeywords = self.retrieveKeywords(package_id)
         if mykeywords == set([""]):
             mykeywords = set(['**'])
 
@@ -2669,62 +2984,92 @@ class MaskableRepository(EntropyRepositoryBase):
                 package_id, myr
             return package_id, myr
 
-    def maskFilter(self, package_id, live = True):
+    def _maskFilter_evaluate(self, package_id, live, license = None,
+                             keywords = None):
         """
-        Reimplemented from EntropyRepositoryBase
+        Evaluate the masking rules, live masking excluded, for the given
+        package identifier. License and keywords metadata can be passed
+        if already retrieved.
         """
-        validator_cache = self._client_settings.get(
-            'masking_validation', {}).get('cache', {})
-
-        cached = validator_cache.get((package_id, self.name, live))
-        if cached is not None:
-            return cached
-
-        # use on-disk cache?
-        cached = self._mask_filter_fetch_cache(package_id)
-        if cached is not None:
-            return cached
-
-        # avoid memleaks
-        if len(validator_cache) > 100000:
-            validator_cache.clear()
-
-        if live:
-            data = self._maskFilter_live(package_id)
-            if data:
-                return data
-
         data = self._maskFilter_user_package_mask(package_id, live)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
         data = self._maskFilter_user_package_unmask(package_id, live)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
         data = self._maskFilter_packages_db_mask(package_id, live)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
-        data = self._maskFilter_package_license_mask(package_id, live)
+        data = self._maskFilter_package_license_mask(package_id, live,
+            license = license)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
-        data = self._maskFilter_keyword_mask(package_id, live)
+        data = self._maskFilter_keyword_mask(package_id, live,
+            keywords = keywords)
         if data:
-            self._mask_filter_store_cache(package_id, data)
             return data
 
         # holy crap, can't validate
         myr = self._settings['pkg_masking_reference']['completely_masked']
+        validator_cache = self._client_settings.get(
+            'masking_validation', {}).get('cache', {})
         validator_cache[(package_id, self.name, live)] = -1, myr
-        self._mask_filter_store_cache(package_id, data)
         return -1, myr
 
+    def maskFilter(self, package_id, live = True):
+        """
+        Reimplemented from EntropyRepositoryBase
+        """
+        validator_cache = self._client_settings.get(
+            'masking_validation', {}).get('cache', {})
+
+        cached = validator_cache.get((package_id, self.name, live))
+        if cached is not None:
+            return cached
+
+        # avoid memleaks
+        if len(validator_cache) > 100000:
+            validator_cache.clear()
+
+        if live:
+            data = self._maskFilter_live(package_id)
+            if data:
+                return data
+
+        data = self.maskFilterBitmap().result(package_id)
+        if data is not None:
+            return data
+
+        return self._maskFilter_evaluate(package_id, live)
+
+    def maskFilterMany(self, package_ids, live = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        bitmap = self.maskFilterBitmap()
+        live_masking = None
+        if live:
+            live_masking = self._settings['live_packagemasking']
+            if not live_masking['mask_matches'] and \
+                    not live_masking['unmask_matches']:
+                live_masking = None
+
+        results = []
+        for package_id in package_ids:
+            data = None
+            if live_masking is not None:
+                data = self._maskFilter_live(package_id)
+            if not data:
+                data = bitmap.result(package_id)
+            if data is None:
+                data = self._maskFilter_evaluate(package_id, live)
+            results.append(data)
+        return results
+
     def atomMatchCacheKey(self):
         """
         Reimplemented from EntropyRepositoryBase.
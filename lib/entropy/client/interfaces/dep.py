@@ -10,8 +10,11 @@
 
 """
 import os
-import collections
 import hashlib
+import itertools
+import multiprocessing
+import threading
+import time
 
 from entropy.const import etpConst, const_debug_write, \
     const_isnumber, const_convert_to_rawstring, const_convert_to_unicode, \
@@ -24,13 +27,139 @@ from entropy.output import bold, darkgreen, darkred, blue, purple, teal, brown
 from entropy.i18n import _
 from entropy.db.exceptions import IntegrityError, OperationalError, \
     DatabaseError, InterfaceError, Error as EntropyRepositoryError
+from entropy.db.cache import EntropyRepositoryCacher, \
+    EntropyRepositoryMatchCache
 from entropy.db.skel import EntropyRepositoryBase
+from entropy.db.snapshot import EntropyRepositorySnapshot
+from entropy.db.sql import SQLConnectionReaper
 from entropy.client.interfaces.db import InstalledPackagesRepository
-from entropy.client.misc import sharedinstlock
+from entropy.client.misc import sharedinstlock, repositorysnapshots
 
 import entropy.dep
 
 
+# calculate_updates() process pool state, inherited by the forked workers
+_CALCULATE_UPDATES_WORKER_STATE = {}
+
+def _calculate_updates_worker_init():
+    """
+    calculate_updates() process pool worker initializer. Errors are
+    not raised, the pool would keep replacing the failing workers.
+    """
+    state = _CALCULATE_UPDATES_WORKER_STATE
+    try:
+        state['client']._calculate_updates_worker_setup()
+    except Exception as err:
+        state['setup_error'] = err
+
+def _calculate_updates_worker(package_ids):
+    """
+    calculate_updates() process pool worker, see
+    CalculatorsMixin._calculate_updates_parallel().
+    """
+    state = _CALCULATE_UPDATES_WORKER_STATE
+    if 'setup_error' in state:
+        return None
+    return state['client']._calculate_updates_packages(
+        package_ids, state['strict_data'], **state['kwargs'])
+
+
+class _DependencySolverSession(object):
+    """
+    In-memory caches shared by the dependency solver for the whole
+    duration of a get_install_queue() call, across all the
+    _generate_dependency_tree() runs. Repositories are not supposed to
+    change while the session is alive.
+    """
+
+    def __init__(self, entropy_client):
+        self._entropy = entropy_client
+        self._unsatisfied = {}
+        self._key_slots = {}
+        self._atom_matches = {}
+        self._stats = {
+            'unsatisfied': [0, 0],
+            'keyslot': [0, 0],
+            'atom_match': [0, 0],
+        }
+
+    def _count(self, cache_name, hit):
+        """
+        Update the hit (or miss) counter of the given cache.
+        """
+        self._stats[cache_name][int(not hit)] += 1
+
+    def unsatisfied_cache(self, deep_deps, relaxed_deps, match_repo):
+        """
+        Return the unsatisfied dependencies cache for the given
+        _get_unsatisfied_dependencies() arguments. The cache maps
+        dependency strings to the (possibly rewritten) unsatisfied
+        dependency, or None, if satisfied.
+        """
+        if isinstance(match_repo, list):
+            match_repo = tuple(match_repo)
+        return self._unsatisfied.setdefault(
+            (deep_deps, relaxed_deps, match_repo), {})
+
+    def unsatisfied_hit(self, hit):
+        """
+        Account an unsatisfied dependencies cache lookup.
+        """
+        self._count('unsatisfied', hit)
+
+    def retrieve_key_slot(self, package_id, repository_id):
+        """
+        Cached version of EntropyRepositoryBase.retrieveKeySlot().
+        """
+        match = (package_id, repository_id)
+        try:
+            key_slot = self._key_slots[match]
+        except KeyError:
+            self._count('keyslot', False)
+            key_slot = self._entropy.open_repository(
+                repository_id).retrieveKeySlot(package_id)
+            self._key_slots[match] = key_slot
+            return key_slot
+
+        self._count('keyslot', True)
+        return key_slot
+
+    def atom_match(self, atom, **kwargs):
+        """
+        Cached version of Client.atom_match().
+        """
+        match_repo = kwargs.get('match_repo')
+        if isinstance(match_repo, (list, set)):
+            kwargs['match_repo'] = tuple(match_repo)
+
+        cache_key = (atom, tuple(sorted(kwargs.items())))
+        try:
+            match = self._atom_matches[cache_key]
+        except KeyError:
+            self._count('atom_match', False)
+            match = self._entropy.atom_match(atom, **kwargs)
+            self._atom_matches[cache_key] = match
+            return match
+
+        self._count('atom_match', True)
+        return match
+
+    def stats(self):
+        """
+        Return a human readable description of the caches hit rates.
+        """
+        data = []
+        for cache_name in sorted(self._stats):
+            hits, misses = self._stats[cache_name]
+            lookups = hits + misses
+            rate = 0.0
+            if lookups:
+                rate = hits * 100.0 / lookups
+            data.append("%s: %d/%d hits (%.1f%%)" % (
+                    cache_name, hits, lookups, rate))
+        return ", ".join(data)
+
+
 class CalculatorsMixin:
 
     @sharedinstlock
@@ -107,7 +236,7 @@ class CalculatorsMixin:
                 version_duplicates.add(version)
             versions.add(version)
 
-        newer_ver = entropy.dep.get_newer_version(list(versions))[0]
+        newer_ver = max(versions, key = entropy.dep.version_key)
         # if no duplicates are found or newer version is not in
         # duplicates we're done
         if (not version_duplicates) or (newer_ver not in version_duplicates):
@@ -174,40 +303,161 @@ class CalculatorsMixin:
         """
         Match one or more packages inside all the available repositories.
         """
-        # support match in repository from shell
-        # atom@repo1,repo2,repo3
+        return self._atom_match(atom, match_slot, mask_filter, multi_match,
+            multi_repo, match_repo, extended_results, use_cache)
+
+    def atom_match_many(self, atoms, match_slot = None, mask_filter = True,
+            multi_match = False, multi_repo = False, match_repo = None,
+            extended_results = False, use_cache = True):
+        """
+        Vectorized version of atom_match(). The atoms are matched against
+        each repository at once, through
+        EntropyRepositoryBase.atomMatchMany(). Results are identical to
+        the ones returned by atom_match().
+
+        @param atoms: list of atoms or dependencies
+        @type atoms: iterable
+        @return: list of atom_match() results, in atoms order
+        @rtype: list
+        """
+        atoms = list(atoms)
+        results = {}
+        repo_atoms = {}
+
+        for atom in atoms:
+            if atom in results:
+                continue
+            s_atom, s_match_repo = self._atom_match_repositories(
+                atom, match_repo)
+
+            cache_key = self._atom_match_cache_key(
+                s_atom, match_slot, mask_filter, multi_match, multi_repo,
+                s_match_repo, extended_results, use_cache)
+            if cache_key is not None:
+                cached = self._cacher.pop(cache_key)
+                if cached is not None:
+                    results[atom] = cached
+                    continue
+
+            sub_atoms = [s_atom]
+            if s_atom.endswith(etpConst['entropyordepquestion']):
+                sub_atoms = s_atom[:-1].split(etpConst['entropyordepsep'])
+
+            valid_repos = self._enabled_repos
+            if s_match_repo and (type(s_match_repo) in (list, tuple, set)):
+                valid_repos = list(s_match_repo)
+            for repo in valid_repos:
+                repo_atoms.setdefault(repo, set()).update(sub_atoms)
+            results[atom] = None
+
+        prefetched = {}
+        for repo, r_atoms in repo_atoms.items():
+            try:
+                dbconn = self.open_repository(repo)
+            except (RepositoryError, SystemDatabaseError):
+                continue
+
+            try:
+                matches = dbconn.atomMatchMany(
+                    r_atoms,
+                    matchSlot = match_slot,
+                    maskFilter = mask_filter,
+                    extendedResults = extended_results,
+                    useCache = use_cache)
+                for atom, match in matches.items():
+                    prefetched[(repo, atom, False, use_cache)] = match
+
+                if multi_match:
+                    matches = dbconn.atomMatchMany(
+                        r_atoms,
+                        matchSlot = match_slot,
+                        maskFilter = mask_filter,
+                        multiMatch = True,
+                        extendedResults = extended_results)
+                    for atom, match in matches.items():
+                        prefetched[(repo, atom, True, True)] = match
+            except (OperationalError, DatabaseError):
+                # let atom_match() deal with it
+                continue
+
+        for atom in atoms:
+            if results[atom] is None:
+                results[atom] = self._atom_match(
+                    atom, match_slot, mask_filter, multi_match,
+                    multi_repo, match_repo, extended_results, use_cache,
+                    prefetched = prefetched)
+
+        return [results[x] for x in atoms]
+
+    def _atom_match_repositories(self, atom, match_repo):
+        """
+        Split the repositories an atom shall be matched in
+        (atom@repo1,repo2,repo3) from the atom itself and return them.
+        """
         atom, repos = entropy.dep.dep_get_match_in_repos(atom)
         if (match_repo is None) and (repos is not None):
             match_repo = repos
         if match_repo is None:
             match_repo = tuple()
+        return atom, match_repo
 
-        cache_key = None
-        if self.xcache and use_cache:
-            sha = hashlib.sha1()
+    def _atom_match_cache_key(self, atom, match_slot, mask_filter,
+            multi_match, multi_repo, match_repo, extended_results,
+            use_cache):
+        """
+        Return the atom_match() on-disk cache key, or None if caching
+        is disabled.
+        """
+        if not (self.xcache and use_cache):
+            return None
 
-            cache_fmt = "a{%s}mr{%s}ms{%s}rh{%s}mf{%s}"
-            cache_fmt += "ar{%s}m{%s}cm{%s}s{%s;%s;%s}"
-            cache_s = cache_fmt % (
-                atom,
-                ";".join(match_repo),
-                match_slot,
-                self.repositories_checksum(),
-                mask_filter,
-                ";".join(sorted(self._settings['repositories']['available'])),
-                self._settings.packages_configuration_hash(),
-                self._settings_client_plugin.packages_configuration_hash(),
-                multi_match,
-                multi_repo,
-                extended_results)
-            sha.update(const_convert_to_rawstring(cache_s))
+        sha = hashlib.sha1()
 
-            cache_key = "atom_match/atom_match_%s" % (sha.hexdigest(),)
+        cache_fmt = "a{%s}mr{%s}ms{%s}rh{%s}mf{%s}"
+        cache_fmt += "ar{%s}m{%s}cm{%s}s{%s;%s;%s}"
+        cache_s = cache_fmt % (
+            atom,
+            ";".join(match_repo),
+            match_slot,
+            self.repositories_checksum(),
+            mask_filter,
+            ";".join(sorted(self._settings['repositories']['available'])),
+            self._settings.packages_configuration_hash(),
+            self._settings_client_plugin.packages_configuration_hash(),
+            multi_match,
+            multi_repo,
+            extended_results)
+        sha.update(const_convert_to_rawstring(cache_s))
+
+        return "atom_match/atom_match_%s" % (sha.hexdigest(),)
+
+    def _atom_match(self, atom, match_slot, mask_filter, multi_match,
+            multi_repo, match_repo, extended_results, use_cache,
+            prefetched = None):
+        """
+        atom_match() implementation. If prefetched is given, it contains
+        the EntropyRepositoryBase.atomMatchMany() results, keyed by
+        (repository, atom, multiMatch, useCache) tuples, and the on-disk
+        cache has already been looked up by the caller.
+        """
+        atom, match_repo = self._atom_match_repositories(atom, match_repo)
 
+        cache_key = self._atom_match_cache_key(
+            atom, match_slot, mask_filter, multi_match, multi_repo,
+            match_repo, extended_results, use_cache)
+        if cache_key is not None and prefetched is None:
             cached = self._cacher.pop(cache_key)
             if cached is not None:
                 return cached
 
+        def _repo_atom_match(dbconn, repo, multi, query_use_cache, **kwargs):
+            if prefetched is not None:
+                match = prefetched.get((repo, atom, multi, query_use_cache))
+                if match is not None:
+                    return match
+            return dbconn.atomMatch(atom, useCache = query_use_cache,
+                                    **kwargs)
+
         valid_repos = self._enabled_repos
         if match_repo and (type(match_repo) in (list, tuple, set)):
             valid_repos = list(match_repo)
@@ -221,11 +471,10 @@ class CalculatorsMixin:
             atoms = atom[:-1].split(etpConst['entropyordepsep'])
             for s_atom in atoms:
                 for repo in valid_repos:
-                    data, rc = self.atom_match(s_atom, match_slot = match_slot,
-                        mask_filter = mask_filter, multi_match = multi_match,
-                        multi_repo = multi_repo, match_repo = match_repo,
-                        extended_results = extended_results,
-                        use_cache = use_cache)
+                    data, rc = self._atom_match(s_atom, match_slot,
+                        mask_filter, multi_match, multi_repo, match_repo,
+                        extended_results, use_cache,
+                        prefetched = prefetched)
                     if rc != 1:
                         # checking against 1 works in any case here
                         # for simple, multi and extended match
@@ -243,12 +492,11 @@ class CalculatorsMixin:
 
                 while True:
                     try:
-                        query_data, query_rc = dbconn.atomMatch(
-                            atom,
+                        query_data, query_rc = _repo_atom_match(
+                            dbconn, repo, False, xuse_cache,
                             matchSlot = match_slot,
                             maskFilter = mask_filter,
-                            extendedResults = extended_results,
-                            useCache = xuse_cache
+                            extendedResults = extended_results
                         )
                         if query_rc == 0:
                             # package found, add to our dictionary
@@ -304,8 +552,8 @@ class CalculatorsMixin:
                     data = set()
                     for q_id, q_repo in dbpkginfo[0]:
                         dbconn = self.open_repository(q_repo)
-                        query_data, query_rc = dbconn.atomMatch(
-                            atom,
+                        query_data, query_rc = _repo_atom_match(
+                            dbconn, q_repo, True, True,
                             matchSlot = match_slot,
                             maskFilter = mask_filter,
                             multiMatch = True,
@@ -321,8 +569,8 @@ class CalculatorsMixin:
                     dbpkginfo = (data, 0)
                 else:
                     dbconn = self.open_repository(dbpkginfo[1])
-                    query_data, query_rc = dbconn.atomMatch(
-                        atom,
+                    query_data, query_rc = _repo_atom_match(
+                        dbconn, dbpkginfo[1], True, True,
                         matchSlot = match_slot,
                         maskFilter = mask_filter,
                         multiMatch = True,
@@ -460,13 +708,21 @@ class CalculatorsMixin:
         def _generate_keyslot_cache():
             keyslot_map = {}
             keyslot_set = set()
+
+            repo_package_ids = {}
             for package_id, repository_id in selected_matches:
+                obj = repo_package_ids.setdefault(repository_id, set())
+                obj.add(package_id)
+
+            for repository_id, package_ids in repo_package_ids.items():
                 repo = self.open_repository(repository_id)
-                keyslot = repo.retrieveKeySlot(package_id)
-                keyslot_set.add(keyslot)
+                keyslots = repo.retrieveKeySlotMany(package_ids)
+                for package_id in package_ids:
+                    keyslot = keyslots.get(package_id)
+                    keyslot_set.add(keyslot)
 
-                obj = keyslot_map.setdefault(keyslot, set())
-                obj.add((package_id, repository_id))
+                    obj = keyslot_map.setdefault(keyslot, set())
+                    obj.add((package_id, repository_id))
             cache['map'] = keyslot_map
             cache['set'] = keyslot_set
 
@@ -529,10 +785,10 @@ class CalculatorsMixin:
             if not cache:
                 _generate_keyslot_cache()
 
+            dep_keyslots = inst_repo.retrieveKeySlotMany(package_ids)
             dep_keyslot_set = set()
             for package_id in package_ids:
-                dep_keyslot_set.add(
-                    inst_repo.retrieveKeySlot(package_id))
+                dep_keyslot_set.add(dep_keyslots.get(package_id))
             common = cache['set'] & dep_keyslot_set
 
             if not common:
@@ -633,7 +889,7 @@ class CalculatorsMixin:
     DISABLE_SLOT_INTERSECTION = os.getenv("ETP_DISABLE_SLOT_INTERSECTION")
 
     def _get_unsatisfied_dependencies(self, dependencies, deep_deps = False,
-                                      relaxed_deps = False, depcache = None,
+                                      relaxed_deps = False, session = None,
                                       match_repo = None):
 
         inst_repo = self.installed_repository()
@@ -671,18 +927,28 @@ class CalculatorsMixin:
                 deep_deps, dependencies,))
 
         etp_cmp = entropy.dep.entropy_compare_versions
-        etp_get_rev = entropy.dep.dep_get_entropy_revision
+        parse_atom = entropy.dep.Atom.parse
 
-        if depcache is None:
+        atom_match = self.atom_match
+        if session is not None:
+            atom_match = session.atom_match
+            depcache = session.unsatisfied_cache(
+                deep_deps, relaxed_deps, match_repo)
+        else:
             depcache = {}
 
-        def push_to_cache(dependency, is_unsat):
-            # push to cache
-            depcache[dependency] = is_unsat
+        def push_to_cache(dependency_key, dependency, is_unsat):
+            # push to cache, the original dependency string maps to
+            # the (possibly rewritten) unsatisfied one
+            unsat_dependency = None
+            if is_unsat:
+                unsat_dependency = dependency
+            depcache[dependency_key] = unsat_dependency
+            depcache[dependency] = unsat_dependency
 
         def _my_get_available_tags(dependency, installed_tags):
             available_tags = set()
-            matches, t_rc = self.atom_match(dependency, multi_match = True,
+            matches, t_rc = atom_match(dependency, multi_match = True,
                 multi_repo = True, match_repo = match_repo)
             for pkg_id, repo_id in matches:
                 dbconn = self.open_repository(repo_id)
@@ -697,27 +963,44 @@ class CalculatorsMixin:
             for c_id in c_ids:
                 c_slot = inst_repo.retrieveSlot(c_id)
                 # pkg_dep already contains the tag part
-                a_id, a_repo_id = self.atom_match(pkg_dep,
+                a_id, a_repo_id = atom_match(pkg_dep,
                     match_slot = c_slot, match_repo = match_repo)
                 if a_repo_id == 1:
                     continue
                 return True
             return False
 
+        # match the dependencies at once, both in the installed packages
+        # repository and, unless they are going to be considered
+        # satisfied anyway, in the available repositories.
+        pending = [x for x in dependencies if x not in depcache
+                   and not x.startswith("!")]
+        installed_matches = inst_repo.atomMatchMany(
+            pending, multiMatch = True)
+        repo_matches = {}
+        if deep_deps or not relaxed_deps:
+            repo_matches = dict(zip(pending, self.atom_match_many(
+                        pending, match_repo = match_repo)))
+
         unsatisfied = set()
         for dependency in dependencies:
 
+            dependency_key = dependency
             if dependency in depcache:
                 # already analized ?
-                is_unsat = depcache[dependency]
-                if is_unsat:
-                    unsatisfied.add(dependency)
+                if session is not None:
+                    session.unsatisfied_hit(True)
+                unsat_dependency = depcache[dependency]
+                if unsat_dependency is not None:
+                    unsatisfied.add(unsat_dependency)
                 if const_debug_enabled():
                     const_debug_write(__name__,
                     "_get_unsatisfied_dependencies control cached for => %s" % (
                         dependency,))
                     const_debug_write(__name__, "...")
                 continue
+            if session is not None:
+                session.unsatisfied_hit(False)
 
             ### conflict
             if dependency.startswith("!"):
@@ -731,22 +1014,24 @@ class CalculatorsMixin:
                             "found on system for => %s" % (dependency,))
                         const_debug_write(__name__, "...")
                     unsatisfied.add(dependency)
-                    push_to_cache(dependency, True)
+                    push_to_cache(dependency_key, dependency, True)
                     continue
 
                 if const_debug_enabled():
                     const_debug_write(__name__, "...")
-                push_to_cache(dependency, False)
+                push_to_cache(dependency_key, dependency, False)
                 continue
 
-            c_ids, c_rc = inst_repo.atomMatch(dependency,
-                multiMatch = True)
+            c_ids, c_rc = installed_matches.get(dependency, (None, None))
+            if c_ids is None:
+                c_ids, c_rc = inst_repo.atomMatch(dependency,
+                    multiMatch = True)
             if c_rc != 0:
 
                 # check if dependency can be matched in available repos and
                 # if it is a tagged package, in this case, we need to rewrite
                 # the dependency string to restrict its scope
-                dependency_tag = entropy.dep.dep_gettag(dependency)
+                dependency_tag = parse_atom(dependency).tag
                 if not dependency_tag:
                     # also filter out empty tags (pkgs without tags)
                     av_tags = [x for x in \
@@ -778,14 +1063,14 @@ class CalculatorsMixin:
                             dependency,))
                     const_debug_write(__name__, "...")
                 unsatisfied.add(dependency)
-                push_to_cache(dependency, True)
+                push_to_cache(dependency_key, dependency, True)
                 continue
 
             # support for app-foo/foo-123~-1
             # -1 revision means, always pull the latest
             do_rev_deep = False
             if not deep_deps:
-                string_rev = etp_get_rev(dependency)
+                string_rev = parse_atom(dependency).revision
                 if string_rev == -1:
                     do_rev_deep = True
 
@@ -800,7 +1085,7 @@ class CalculatorsMixin:
                         "(force unsat) SATISFIED => %s" % (
                             dependency,))
                     const_debug_write(__name__, "...")
-                push_to_cache(dependency, False)
+                push_to_cache(dependency_key, dependency, False)
                 continue
 
             # WARN: unfortunately, need to deal with Portage (and other
@@ -820,20 +1105,23 @@ class CalculatorsMixin:
                                 "provide, satisfied => %s" % (
                                     dependency,))
                             const_debug_write(__name__, "...")
-                        push_to_cache(dependency, False)
+                        push_to_cache(dependency_key, dependency, False)
                         provide_stop = True
                         break
                 if provide_stop:
                     continue
 
-            r_id, r_repo = self.atom_match(dependency, match_repo = match_repo)
+            r_id, r_repo = repo_matches.get(dependency, (None, None))
+            if r_id is None:
+                r_id, r_repo = atom_match(
+                    dependency, match_repo = match_repo)
             if r_id == -1:
                 if const_debug_enabled():
                     const_debug_write(__name__,
                     "_get_unsatisfied_dependencies repository match "
                     "not found for => %s, CONSIDER SATISFIED !" % (dependency,))
                     const_debug_write(__name__, "...")
-                push_to_cache(dependency, False)
+                push_to_cache(dependency_key, dependency, False)
                 continue
 
             # Slot intersection support:
@@ -853,7 +1141,7 @@ class CalculatorsMixin:
 
             available_slots = set()
             if not self.DISABLE_SLOT_INTERSECTION:
-                r_matches, r_rcs = self.atom_match(
+                r_matches, r_rcs = atom_match(
                     dependency, match_repo = match_repo,
                     multi_match = True, multi_repo = multi_repo)
                 available_slots |= set(self.open_repository(x[1]).retrieveSlot(
@@ -875,7 +1163,7 @@ class CalculatorsMixin:
                     # same dep is expressed without slot.
                     old_r_id = r_id
                     old_r_repo = r_repo
-                    r_id, r_repo = self.atom_match(
+                    r_id, r_repo = atom_match(
                         dependency, match_slot = installed_slot)
                     if r_id != -1:
                         # append slot to dependency
@@ -913,7 +1201,7 @@ class CalculatorsMixin:
                             (r_id, r_repo),))
                     const_debug_write(__name__, "...")
                 unsatisfied.add(dependency)
-                push_to_cache(dependency, True)
+                push_to_cache(dependency_key, dependency, True)
                 continue
 
             client_data = set()
@@ -935,7 +1223,7 @@ class CalculatorsMixin:
             # restrict dependency matching scope inside mutually available
             # package tags. Equals to tags available in both installed and
             # available repositories.
-            dependency_tag = entropy.dep.dep_gettag(dependency)
+            dependency_tag = parse_atom(dependency).tag
             installed_tags = [x[1] for x in client_data if x[1]]
             if installed_tags and not dependency_tag:
 
@@ -955,7 +1243,7 @@ class CalculatorsMixin:
                     # stricter set of possible matches.
                     dependency = dependency + \
                         etpConst['entropytagprefix'] + best_tag
-                    r_id, r_repo = self.atom_match(dependency,
+                    r_id, r_repo = atom_match(dependency,
                         match_repo = match_repo)
                     dbconn = self.open_repository(r_repo)
                     repo_pkgver, repo_pkgtag, repo_pkgrev = \
@@ -999,7 +1287,7 @@ class CalculatorsMixin:
                                 deep_deps, dependency,))
                         const_debug_write(__name__, "...")
                     do_cont = True
-                    push_to_cache(dependency, False)
+                    push_to_cache(dependency_key, dependency, False)
                     break
 
                 ver_tag_repo = (repo_pkgver, repo_pkgtag,)
@@ -1023,7 +1311,7 @@ class CalculatorsMixin:
                                 deep_deps, dependency,))
                         const_debug_write(__name__, "...")
                     do_cont = True
-                    push_to_cache(dependency, False)
+                    push_to_cache(dependency_key, dependency, False)
                     break
 
             if do_cont:
@@ -1039,7 +1327,7 @@ class CalculatorsMixin:
                 const_debug_write(__name__, "...")
 
             unsatisfied.add(dependency)
-            push_to_cache(dependency, True)
+            push_to_cache(dependency_key, dependency, True)
 
         if self.xcache:
             self._cacher.push(cache_key, unsatisfied)
@@ -1161,7 +1449,8 @@ class CalculatorsMixin:
     DISABLE_REWRITE_SELECTED_MATCHES = os.getenv(
         "ETP_DISABLE_REWRITE_SELECTED_MATCHES")
 
-    def __rewrite_selected_matches(self, unsatisfied_deps, selected_matches):
+    def __rewrite_selected_matches(self, unsatisfied_deps, selected_matches,
+                                   session):
         """
         This function scans the unsatisfied dependencies and tries to rewrite
         them if they are in the "selected_matches" set. This set contains the
@@ -1175,7 +1464,7 @@ class CalculatorsMixin:
             return unsatisfied_deps
 
         def _in_selected_matches(dep):
-            matches, m_rc = self.atom_match(
+            matches, m_rc = session.atom_match(
                 dep, multi_match = True, multi_repo = True)
             common = selected_matches & matches
             if common:
@@ -1199,7 +1488,7 @@ class CalculatorsMixin:
     DISABLE_AUTOCONFLICT = os.getenv("ETP_DISABLE_AUTOCONFLICT")
 
     def __generate_dependency_tree_analyze_deplist(self, pkg_match, repo_db,
-        stack, graph, deps_not_found, conflicts, unsat_cache, relaxed_deps,
+        stack, graph, deps_not_found, conflicts, session, relaxed_deps,
         build_deps, deep_deps, empty_deps, recursive, selected_matches,
         elements_cache, selected_matches_cache):
 
@@ -1252,9 +1541,9 @@ class CalculatorsMixin:
 
             myundeps = self._get_unsatisfied_dependencies(myundeps,
                 deep_deps = deep_deps, relaxed_deps = relaxed_deps,
-                depcache = unsat_cache)
+                session = session)
             myundeps = self.__rewrite_selected_matches(
-                myundeps, selected_matches)
+                myundeps, selected_matches, session)
 
             if const_debug_enabled():
                 const_debug_write(__name__,
@@ -1262,7 +1551,7 @@ class CalculatorsMixin:
                         "filtered UNSATISFIED dependencies => %s" % (myundeps,))
 
         def _post_deps_filter(post_dep):
-            pkg_matches, rc = self.atom_match(post_dep,
+            pkg_matches, rc = session.atom_match(post_dep,
                 multi_match = True, multi_repo = True)
             commons = pkg_matches & elements_cache
             if commons:
@@ -1283,7 +1572,7 @@ class CalculatorsMixin:
                 post_deps, selected_matches, selected_matches_cache)
             post_deps = self._get_unsatisfied_dependencies(post_deps,
                 deep_deps = deep_deps, relaxed_deps = relaxed_deps,
-                depcache = unsat_cache)
+                session = session)
 
         if const_debug_enabled():
             const_debug_write(__name__,
@@ -1292,7 +1581,7 @@ class CalculatorsMixin:
 
         deps = set()
         for unsat_dep in myundeps:
-            match_pkg_id, match_repo_id = self.atom_match(unsat_dep)
+            match_pkg_id, match_repo_id = session.atom_match(unsat_dep)
             if match_pkg_id == -1:
                 # dependency not found !
                 deps_not_found.add(unsat_dep)
@@ -1305,7 +1594,7 @@ class CalculatorsMixin:
 
         post_deps_matches = set()
         for post_dep in post_deps:
-            match_pkg_id, match_repo_id = self.atom_match(post_dep)
+            match_pkg_id, match_repo_id = session.atom_match(post_dep)
             # if post dependency is not found, we can happily ignore the fact
             if match_pkg_id == -1:
                 # not adding to deps_not_found
@@ -1377,9 +1666,9 @@ class CalculatorsMixin:
 
     def _generate_dependency_tree(self, matched_atom, graph,
         empty_deps = False, relaxed_deps = False, build_deps = False,
-        only_deps = False, deep_deps = False, unsatisfied_deps_cache = None,
-        elements_cache = None, post_deps_cache = None, recursive = True,
-        selected_matches = None, selected_matches_cache = None, ldpaths = None):
+        only_deps = False, deep_deps = False, elements_cache = None,
+        post_deps_cache = None, recursive = True, selected_matches = None,
+        selected_matches_cache = None, ldpaths = None, session = None):
 
         pkg_id, pkg_repo = matched_atom
         if (pkg_id == -1) or (pkg_repo == 1):
@@ -1389,8 +1678,8 @@ class CalculatorsMixin:
         # several times, when it is supposed to be already handled
         if elements_cache is None:
             elements_cache = set()
-        if unsatisfied_deps_cache is None:
-            unsatisfied_deps_cache = {}
+        if session is None:
+            session = _DependencySolverSession(self)
         if post_deps_cache is None:
             post_deps_cache = {}
 
@@ -1447,7 +1736,7 @@ class CalculatorsMixin:
             # search inside installed packages repository if there's something
             # in the same slot, if so, do some extra checks first.
             try:
-                pkg_key, pkg_slot = repo_db.retrieveKeySlot(pkg_id)
+                pkg_key, pkg_slot = session.retrieve_key_slot(pkg_id, repo_id)
             except TypeError:
                 deps_not_found.add("unknown_%s_%s" % (pkg_id, repo_id,))
                 continue
@@ -1492,7 +1781,7 @@ class CalculatorsMixin:
             dep_matches, post_dep_matches = \
                 self.__generate_dependency_tree_analyze_deplist(
                     pkg_match, repo_db, stack, graph, deps_not_found,
-                    conflicts, unsatisfied_deps_cache, relaxed_deps,
+                    conflicts, session, relaxed_deps,
                     build_deps, deep_deps, empty_deps, recursive,
                     selected_matches, elements_cache, selected_matches_cache)
 
@@ -2167,7 +2456,7 @@ class CalculatorsMixin:
 
     def _get_required_packages(self, package_matches, empty_deps = False,
         deep_deps = False, relaxed_deps = False, build_deps = False,
-        only_deps = False, quiet = False, recursive = True):
+        only_deps = False, quiet = False, recursive = True, session = None):
 
         ldpaths = frozenset(entropy.tools.collect_linker_paths())
         inst_repo = self.installed_repository()
@@ -2223,7 +2512,8 @@ class CalculatorsMixin:
                 raise AttributeError("unsupported package_matches type")
 
         sort_dep_text = _("Sorting dependencies")
-        unsat_deps_cache = {}
+        if session is None:
+            session = _DependencySolverSession(self)
         elements_cache = set()
         selected_matches_cache = {}
         selected_matches_set = set(package_matches)
@@ -2259,12 +2549,12 @@ class CalculatorsMixin:
                     deep_deps = deep_deps, relaxed_deps = relaxed_deps,
                     build_deps = build_deps, only_deps = only_deps,
                     elements_cache = elements_cache,
-                    unsatisfied_deps_cache = unsat_deps_cache,
                     post_deps_cache = post_deps_cache,
                     recursive = recursive,
                     selected_matches = selected_matches_set,
                     selected_matches_cache = selected_matches_cache,
-                    ldpaths = ldpaths
+                    ldpaths = ldpaths,
+                    session = session
                 )
             except DependenciesNotFound as err:
                 deps_not_found |= err.value
@@ -2290,7 +2580,7 @@ class CalculatorsMixin:
         _dup_deps_collisions = {}
         for _level, _deps in deptree.items():
             for pkg_id, pkg_repo in _deps:
-                keyslot = self.open_repository(pkg_repo).retrieveKeySlot(pkg_id)
+                keyslot = session.retrieve_key_slot(pkg_id, pkg_repo)
                 ks_set = _dup_deps_collisions.setdefault(keyslot, set())
                 ks_set.add((pkg_id, pkg_repo))
         _colliding_deps = [x for x in _dup_deps_collisions.values() if \
@@ -2966,8 +3256,9 @@ class CalculatorsMixin:
             repo = self.open_repository(repository_id)
             try:
                 # db may be corrupted, we cannot deal with it here
-                package_ids = [x for x in repo.listAllPackageIds(
-                    order_by = 'atom') if repo.maskFilter(x)[0] != -1]
+                package_ids = [x for x, _reason in repo.maskFilterMany(
+                    repo.listAllPackageIds(order_by = 'atom')) if x != -1]
+                key_slots = repo.retrieveKeySlotMany(package_ids)
             except OperationalError:
                 continue
             myavailable = []
@@ -2977,7 +3268,7 @@ class CalculatorsMixin:
                     break
                 # get key + slot
                 try:
-                    key_slot = repo.retrieveKeySlot(package_id)
+                    key_slot = key_slots.get(package_id)
                     if key_slot is None:
                         # mmh... invalid entry, ignore
                         continue
@@ -3103,136 +3394,45 @@ class CalculatorsMixin:
 
         return sec_updates
 
-    @sharedinstlock
-    def calculate_updates(self, empty = False, use_cache = True,
-        critical_updates = True, quiet = False):
-        """
-        Calculate package updates. By default, this method also handles critical
-        updates priority. Updates (as well as other objects here) are returned
-        in alphabetical order. To generate a valid installation queue, have a
-        look at Client.get_install_queue().
-
-        @keyword empty: consider the installed packages repository
-            empty. Mark every package as update.
-        @type empty: bool
-        @keyword use_cache: use Entropy cache
-        @type use_cache: bool
-        @keyword critical_updates: if False, disable critical updates check
-            priority.
-        @type critical_updates: bool
-        @keyword quiet: do not print any status info if True
-        @type quiet: bool
-        @return: dict composed by (list of package matches ("update" key),
-            list of installed package identifiers ("remove" key), list of
-            package names already up-to-date ("fine" key), list of package names
-            already up-to-date when user enabled "ignore-spm-downgrades",
-            "spm_fine" key), if critical updates were found ("critical_found"
-            key). If critical_found is True, relaxed dependencies calculation
-            must be enforced.
-        @rtype: tuple
-        """
-        cl_settings = self.ClientSettings()
-        misc_settings = cl_settings['misc']
-
-        # critical updates hook, if enabled
-        # this will force callers to receive only critical updates
-        if misc_settings.get('forcedupdates') and critical_updates:
-            _atoms, update = self.calculate_critical_updates(
-                use_cache = use_cache)
-            if update:
-                return {
-                    'update': update,
-                    'remove': [],
-                    'fine': [],
-                    'spm_fine': [],
-                    'critical_found': True,
-                    }
-
-        inst_repo = self.installed_repository()
-        ignore_spm_downgrades = misc_settings['ignore_spm_downgrades']
-        enabled_repos = self.filter_repositories(self.repositories())
-        repo_order = [x for x in self._settings['repositories']['order'] if
-                      x in enabled_repos]
-
-        cache_s = "%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|v7" % (
-            empty,
-            enabled_repos,
-            inst_repo.checksum(),
-            self.repositories_checksum(),
-            self._settings.packages_configuration_hash(),
-            self._settings_client_plugin.packages_configuration_hash(),
-            ";".join(sorted(self._settings['repositories']['available'])),
-            repo_order,
-            ignore_spm_downgrades,
-            # needed when users do bogus things like editing config files
-            # manually (branch setting)
-            self._settings['repositories']['branch'],
-        )
-
-        sha = hashlib.sha1()
-        sha.update(const_convert_to_rawstring(cache_s))
-        cache_key = "updates/%s_v1" % (sha.hexdigest(),)
+    ENABLE_REPOSITORY_SNAPSHOTS = os.getenv("ETP_SOLVER_SNAPSHOTS")
 
-        if use_cache and self.xcache:
-            cached = self._cacher.pop(cache_key)
-            if cached is not None:
-                return cached
+    # minimum number of installed packages for which the
+    # calculate_updates() process pool is worth its setup cost
+    _PARALLEL_UPDATES_MIN_PACKAGES = 256
 
-        # do not match package repositories, never consider them in updates!
-        # that would be a nonsense, since package repos are temporary.
-        enabled_repos = self.filter_repositories(self.repositories())
-        match_repos = tuple([x for x in \
-            self._settings['repositories']['order'] if x in enabled_repos])
-
-        # get all the installed packages
-        try:
-            package_ids = collections.deque(
-                self.installed_repository().listAllPackageIds())
-        except OperationalError:
-            # client db is broken!
-            raise SystemDatabaseError("installed packages repository is broken")
-
-        count = 0
-        total = len(package_ids)
-        last_count = 0
-        remove = collections.deque()
-        fine = collections.deque()
-        spm_fine = collections.deque()
-        update = set()
-
-        while True:
-            try:
-                package_id = package_ids.pop()
-            except IndexError:
-                break
-            count += 1
+    def _calculate_updates_packages(self, package_ids, strict_data,
+        match_repos = None, empty = False, ignore_spm_downgrades = False,
+        progress = None):
+        """
+        Calculate the updates of the given installed packages, this is
+        the calculate_updates() workhorse.
+
+        @param package_ids: list of installed package identifiers
+        @type package_ids: list
+        @param strict_data: getStrictDataMany() output of the installed
+            packages repository
+        @type strict_data: dict
+        @keyword progress: callable called once per processed package
+        @type progress: callable
+        @return: dict composed by "update", "remove", "fine" and
+            "spm_fine" lists, in processing order
+        @rtype: dict
+        """
+        update = []
+        remove = []
+        fine = []
+        spm_fine = []
 
-            if not quiet:
+        for package_id in package_ids:
 
-                avg = int(float(count) / total * 100)
-                execute = avg % 10 == 9 and last_count < count
-                if not execute:
-                    execute = (count == total) or (count == 1)
-
-                if execute:
-                    last_count = count
-                    self.output(
-                        _("Calculating updates"),
-                        importance = 0,
-                        level = "info",
-                        back = True,
-                        header = ":: ",
-                        count = (count, total),
-                        percent = True,
-                        footer = " ::"
-                    )
+            if progress is not None:
+                progress(1)
 
             try:
                 cl_pkgkey, cl_slot, cl_version, \
                     cl_tag, cl_revision, \
-                    cl_atom = self.installed_repository().getStrictData(
-                        package_id)
-            except TypeError:
+                    cl_atom = strict_data[package_id]
+            except KeyError:
                 # check against broken entries, or removed during iteration
                 continue
             use_match_cache = True
@@ -3304,7 +3504,7 @@ class CalculatorsMixin:
                 tag = match[0][2]
                 revision = match[0][3]
                 if empty:
-                    update.add((m_package_id, repoid))
+                    update.append((m_package_id, repoid))
                     continue
                 if cl_revision != revision:
                     # different revision
@@ -3315,15 +3515,15 @@ class CalculatorsMixin:
                         spm_fine.append((m_package_id, repoid))
                         continue
                     else:
-                        update.add((m_package_id, repoid))
+                        update.append((m_package_id, repoid))
                         continue
                 elif (cl_version != version):
                     # different versions
-                    update.add((m_package_id, repoid))
+                    update.append((m_package_id, repoid))
                     continue
                 elif (cl_tag != tag):
                     # different tags
-                    update.add((m_package_id, repoid))
+                    update.append((m_package_id, repoid))
                     continue
                 else:
 
@@ -3344,7 +3544,7 @@ class CalculatorsMixin:
                             if (r_digest != c_digest) and \
                                (r_digest is not None) \
                                and (c_digest is not None):
-                                update.add((m_package_id, repoid))
+                                update.append((m_package_id, repoid))
                                 continue
 
                     # no difference
@@ -3358,6 +3558,438 @@ class CalculatorsMixin:
             if maskedresults[0] == -1:
                 remove.append(package_id)
 
+        return {
+            'update': update,
+            'remove': remove,
+            'fine': fine,
+            'spm_fine': spm_fine,
+            }
+
+    DISABLE_UPDATES_FAST_PATH = os.getenv("ETP_DISABLE_UPDATES_FAST_PATH")
+
+    def _calculate_updates_fast(self, package_ids, strict_data,
+        match_repos = None, empty = False, ignore_spm_downgrades = False):
+        """
+        Calculate the updates of the installed packages that do not need
+        atom_match(): untagged, non-injected, packages having exactly one
+        visible and untagged package with the same key and slot in the
+        repositories, or none at all. Candidates are looked up at once
+        through EntropyRepositoryBase.searchKeySlotCandidates().
+        Results are identical to the ones of _calculate_updates_packages().
+
+        @param package_ids: list of installed package identifiers
+        @type package_ids: list
+        @param strict_data: getStrictDataMany() output of the installed
+            packages repository
+        @type strict_data: dict
+        @return: tuple composed by a _calculate_updates_packages() alike
+            dict and the list of package identifiers left to it
+        @rtype: tuple
+        """
+        inst_repo = self.installed_repository()
+        update = []
+        remove = []
+        fine = []
+        spm_fine = []
+        outcome = {
+            'update': update,
+            'remove': remove,
+            'fine': fine,
+            'spm_fine': spm_fine,
+            }
+
+        repositories = {}
+        for repository_id in match_repos:
+            try:
+                repo = self.open_repository(repository_id)
+            except (RepositoryError, SystemDatabaseError):
+                continue
+            if isinstance(repo, EntropyRepositorySnapshot):
+                repo = repo.repository()
+            repositories[repository_id] = repo
+
+        try:
+            candidates = inst_repo.searchKeySlotCandidates(repositories)
+            injected = inst_repo.listAllInjectedPackageIds()
+
+            # evaluate package masking at once
+            repo_candidates = {}
+            for pkg_candidates in candidates.values():
+                if len(pkg_candidates) == 1:
+                    repository_id, m_package_id = pkg_candidates[0][:2]
+                    repo_candidates.setdefault(
+                        repository_id, set()).add(m_package_id)
+            visible = set()
+            for repository_id, m_package_ids in repo_candidates.items():
+                m_package_ids = list(m_package_ids)
+                masks = repositories[repository_id].maskFilterMany(
+                    m_package_ids)
+                visible.update(
+                    (m_package_id, repository_id) for m_package_id, mask in
+                    zip(m_package_ids, masks) if mask[0] != -1)
+        except (OperationalError, DatabaseError):
+            return outcome, package_ids
+
+        slow_package_ids = []
+        for package_id in package_ids:
+            data = strict_data.get(package_id)
+            if data is None:
+                # broken entry, skipped by the slow path as well
+                continue
+            cl_pkgkey, cl_slot, cl_version, \
+                cl_tag, cl_revision, cl_atom = data
+
+            parsed_key = entropy.dep.Atom.parse(cl_pkgkey)
+            if cl_tag or (package_id in injected) or \
+                    (parsed_key.key != cl_pkgkey) or \
+                    not parsed_key.justname:
+                slow_package_ids.append(package_id)
+                continue
+
+            pkg_candidates = candidates.get(package_id)
+            if not pkg_candidates:
+                # old-style virtuals are matched through their providers
+                if parsed_key.category == \
+                        EntropyRepositoryBase.VIRTUAL_META_PACKAGE_CATEGORY:
+                    slow_package_ids.append(package_id)
+                else:
+                    remove.append(package_id)
+                continue
+
+            if len(pkg_candidates) > 1:
+                # leave versions and repositories ordering to atom_match()
+                slow_package_ids.append(package_id)
+                continue
+
+            repoid, m_package_id, version, tag, revision = \
+                pkg_candidates[0]
+            if tag or (m_package_id, repoid) not in visible:
+                slow_package_ids.append(package_id)
+                continue
+
+            if empty:
+                update.append((m_package_id, repoid))
+            elif cl_revision != revision:
+                if cl_revision == etpConst['spmetprev'] \
+                        and ignore_spm_downgrades:
+                    fine.append(cl_atom)
+                    spm_fine.append((m_package_id, repoid))
+                else:
+                    update.append((m_package_id, repoid))
+            elif cl_version != version:
+                update.append((m_package_id, repoid))
+            else:
+                # see _calculate_updates_packages()
+                c_digest = inst_repo.retrieveDigest(package_id)
+                r_digest = None
+                if c_digest != "0":
+                    r_digest = self.open_repository(
+                        repoid).retrieveDigest(m_package_id)
+                if (c_digest != "0") and (r_digest != c_digest) and \
+                        (r_digest is not None) and (c_digest is not None):
+                    update.append((m_package_id, repoid))
+                else:
+                    fine.append(cl_atom)
+
+        return outcome, slow_package_ids
+
+    def _calculate_updates_parallel(self, jobs, package_ids, strict_data,
+        kwargs, progress):
+        """
+        Partition the calculate_updates() work across a pool of forked
+        worker processes. Workers open the repositories again, read-only
+        (see _calculate_updates_worker_setup()), while the in-memory
+        repository snapshots are shared with the parent. Results are
+        returned in package_ids order, making the merge deterministic.
+
+        @return: list of _calculate_updates_packages() results, or None
+            if the work cannot be partitioned
+        @rtype: list or None
+        """
+        repositories = []
+        for repository_id in kwargs['match_repos']:
+            try:
+                repositories.append(self.open_repository(repository_id))
+            except (RepositoryError, SystemDatabaseError):
+                continue
+
+        # temporary repositories can be stored in memory, which is not
+        # shared across connections, thus processes.
+        for repo in [self.installed_repository()] + repositories:
+            if repo.temporary():
+                return None
+
+        # evaluate package masking and load the repository snapshots
+        # once, before forking, workers share them copy-on-write
+        for repo in repositories:
+            repo.maskFilterMany([])
+
+        chunk_size = max(1, len(package_ids) // (jobs * 4) + 1)
+        chunks = [package_ids[x:x + chunk_size] for x in
+                  range(0, len(package_ids), chunk_size)]
+
+        _CALCULATE_UPDATES_WORKER_STATE.update({
+            'client': self,
+            'strict_data': strict_data,
+            'kwargs': kwargs,
+        })
+        try:
+            try:
+                pool = multiprocessing.Pool(
+                    processes = jobs,
+                    initializer = _calculate_updates_worker_init)
+            except OSError as err:
+                const_debug_write(
+                    __name__,
+                    "_calculate_updates_parallel: cannot start pool: "
+                    "%s" % (repr(err),))
+                return None
+
+            outcomes = []
+            try:
+                for chunk, outcome in zip(
+                        chunks, pool.imap(_calculate_updates_worker, chunks)):
+                    if outcome is None:
+                        const_debug_write(
+                            __name__,
+                            "_calculate_updates_parallel: worker setup "
+                            "failed")
+                        pool.terminate()
+                        return None
+                    outcomes.append(outcome)
+                    progress(len(chunk))
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+
+        finally:
+            _CALCULATE_UPDATES_WORKER_STATE.clear()
+
+        return outcomes
+
+    def _calculate_updates_worker_setup(self):
+        """
+        Setup a calculate_updates() worker process, forked from the
+        current one. Nothing the parent opened is used by the worker:
+        SQLite connections must not cross fork() and the parent threads
+        (SQLConnectionReaper, EntropyCacher) could have held the
+        process-wide locks at fork time. The repositories are opened
+        again, read-only and without the on-disk cache, and the parent
+        repository snapshots are bound to them. The inherited instances
+        are kept referenced, so that the worker never finalizes them.
+        """
+        EntropyRepositoryMatchCache.reset_after_fork()
+        EntropyRepositoryCacher().reset_after_fork()
+        SQLConnectionReaper.reset_after_fork()
+
+        _CALCULATE_UPDATES_WORKER_STATE['inherited'] = (
+            self._repodb_cache, self._real_installed_repository)
+        self.xcache = False
+        self._repodb_cache_mutex = threading.RLock()
+        self._real_installed_repository_lock = threading.RLock()
+        self._repodb_cache = {}
+
+        name = InstalledPackagesRepository.NAME
+        inst_repo = self.get_repository(name)(
+            readOnly = True,
+            dbFile = self.installed_repository_path(),
+            xcache = False,
+            indexing = self._indexing)
+        inst_repo.setCloseToken(name)
+        self._add_plugin_to_client_repository(inst_repo)
+        self._real_installed_repository = inst_repo
+
+        snapshots = self._repository_snapshots
+        if snapshots is None:
+            return
+        # open the plain repositories, then bind the snapshots to them.
+        # The parent opened them already, tree updates are not run again.
+        self._repository_snapshots = None
+        try:
+            repositories = {}
+            for repository_id in \
+                    _CALCULATE_UPDATES_WORKER_STATE['kwargs']['match_repos']:
+                try:
+                    repositories[repository_id] = self.open_repository(
+                        repository_id)
+                except (RepositoryError, SystemDatabaseError):
+                    continue
+        finally:
+            self._repository_snapshots = snapshots
+        for snapshot in snapshots.values():
+            repo = repositories.get(snapshot.name)
+            if repo is not None:
+                snapshot.rebind(repo)
+
+    @sharedinstlock
+    @repositorysnapshots
+    def calculate_updates(self, empty = False, use_cache = True,
+        critical_updates = True, quiet = False):
+        """
+        Calculate package updates. By default, this method also handles critical
+        updates priority. Updates (as well as other objects here) are returned
+        in alphabetical order. To generate a valid installation queue, have a
+        look at Client.get_install_queue().
+
+        @keyword empty: consider the installed packages repository
+            empty. Mark every package as update.
+        @type empty: bool
+        @keyword use_cache: use Entropy cache
+        @type use_cache: bool
+        @keyword critical_updates: if False, disable critical updates check
+            priority.
+        @type critical_updates: bool
+        @keyword quiet: do not print any status info if True
+        @type quiet: bool
+        @return: dict composed by (list of package matches ("update" key),
+            list of installed package identifiers ("remove" key), list of
+            package names already up-to-date ("fine" key), list of package names
+            already up-to-date when user enabled "ignore-spm-downgrades",
+            "spm_fine" key), if critical updates were found ("critical_found"
+            key). If critical_found is True, relaxed dependencies calculation
+            must be enforced.
+        @rtype: tuple
+        """
+        cl_settings = self.ClientSettings()
+        misc_settings = cl_settings['misc']
+
+        # critical updates hook, if enabled
+        # this will force callers to receive only critical updates
+        if misc_settings.get('forcedupdates') and critical_updates:
+            _atoms, update = self.calculate_critical_updates(
+                use_cache = use_cache)
+            if update:
+                return {
+                    'update': update,
+                    'remove': [],
+                    'fine': [],
+                    'spm_fine': [],
+                    'critical_found': True,
+                    }
+
+        inst_repo = self.installed_repository()
+        ignore_spm_downgrades = misc_settings['ignore_spm_downgrades']
+        enabled_repos = self.filter_repositories(self.repositories())
+        repo_order = [x for x in self._settings['repositories']['order'] if
+                      x in enabled_repos]
+
+        cache_s = "%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|v7" % (
+            empty,
+            enabled_repos,
+            inst_repo.checksum(),
+            self.repositories_checksum(),
+            self._settings.packages_configuration_hash(),
+            self._settings_client_plugin.packages_configuration_hash(),
+            ";".join(sorted(self._settings['repositories']['available'])),
+            repo_order,
+            ignore_spm_downgrades,
+            # needed when users do bogus things like editing config files
+            # manually (branch setting)
+            self._settings['repositories']['branch'],
+        )
+
+        sha = hashlib.sha1()
+        sha.update(const_convert_to_rawstring(cache_s))
+        cache_key = "updates/%s_v1" % (sha.hexdigest(),)
+
+        if use_cache and self.xcache:
+            cached = self._cacher.pop(cache_key)
+            if cached is not None:
+                return cached
+
+        # do not match package repositories, never consider them in updates!
+        # that would be a nonsense, since package repos are temporary.
+        enabled_repos = self.filter_repositories(self.repositories())
+        match_repos = tuple([x for x in \
+            self._settings['repositories']['order'] if x in enabled_repos])
+
+        # get all the installed packages
+        try:
+            package_ids = inst_repo.listAllPackageIds()
+            # fetch the metadata of all the installed packages at once
+            strict_data = inst_repo.getStrictDataMany(package_ids)
+        except OperationalError:
+            # client db is broken!
+            raise SystemDatabaseError("installed packages repository is broken")
+
+        kwargs = {
+            'match_repos': match_repos,
+            'empty': empty,
+            'ignore_spm_downgrades': ignore_spm_downgrades,
+        }
+
+        # keep the historical processing order
+        package_ids = list(reversed(list(package_ids)))
+        outcomes = []
+        start_time = time.time()
+        if not self.DISABLE_UPDATES_FAST_PATH:
+            fast_outcome, package_ids = self._calculate_updates_fast(
+                package_ids, strict_data, **kwargs)
+            outcomes.append(fast_outcome)
+            if const_debug_enabled():
+                const_debug_write(
+                    __name__,
+                    "calculate_updates: fast path, %d packages left, "
+                    "%.3f seconds" % (
+                        len(package_ids), time.time() - start_time))
+
+        total = len(package_ids)
+        progress = {'count': 0, 'last_count': 0}
+
+        def _progress(count):
+            progress['count'] += count
+            count = progress['count']
+            if quiet:
+                return
+
+            avg = int(float(count) / total * 100)
+            execute = avg % 10 == 9 and progress['last_count'] < count
+            if not execute:
+                execute = (count == total) or (count == 1)
+
+            if execute:
+                progress['last_count'] = count
+                self.output(
+                    _("Calculating updates"),
+                    importance = 0,
+                    level = "info",
+                    back = True,
+                    header = ":: ",
+                    count = (count, total),
+                    percent = True,
+                    footer = " ::"
+                )
+
+        jobs = misc_settings['updates_jobs']
+        slow_outcomes = None
+        if jobs > 1 and total >= self._PARALLEL_UPDATES_MIN_PACKAGES:
+            slow_outcomes = self._calculate_updates_parallel(
+                jobs, package_ids, strict_data, kwargs, _progress)
+        if slow_outcomes is None:
+            jobs = 1
+            slow_outcomes = [self._calculate_updates_packages(
+                    package_ids, strict_data, progress = _progress,
+                    **kwargs)]
+        outcomes.extend(slow_outcomes)
+        if const_debug_enabled():
+            const_debug_write(
+                __name__,
+                "calculate_updates: %d packages, %d jobs, %.3f seconds" % (
+                    total, jobs, time.time() - start_time))
+
+        update = set()
+        remove = []
+        fine = []
+        spm_fine = []
+        for outcome in outcomes:
+            update.update(outcome['update'])
+            remove.extend(outcome['remove'])
+            fine.extend(outcome['fine'])
+            spm_fine.extend(outcome['spm_fine'])
+
         # validate remove, do not return installed packages that are
         # still referenced by others as "removable"
         # check inverse dependencies at the cost of growing complexity
@@ -3368,9 +4000,18 @@ class CalculatorsMixin:
         else:
             remove = list(remove)
 
-        # sort data
-        upd_sorter = lambda x: self.open_repository(x[1]).retrieveAtom(x[0])
-        rm_sorter = lambda x: self.installed_repository().retrieveAtom(x)
+        # sort data, fetching the atoms of each repository at once
+        repo_atoms = {}
+        for package_id, repository_id in itertools.chain(update, spm_fine):
+            obj = repo_atoms.setdefault(repository_id, set())
+            obj.add(package_id)
+        for repository_id, repo_package_ids in repo_atoms.items():
+            repo_atoms[repository_id] = self.open_repository(
+                repository_id).retrieveAtomMany(repo_package_ids)
+        inst_atoms = inst_repo.retrieveAtomMany(remove)
+
+        upd_sorter = lambda x: repo_atoms[x[1]].get(x[0])
+        rm_sorter = lambda x: inst_atoms.get(x)
         update = sorted(update, key = upd_sorter)
         fine = sorted(fine)
         spm_fine = sorted(spm_fine, key = upd_sorter)
@@ -3768,6 +4409,7 @@ class CalculatorsMixin:
         return queue
 
     @sharedinstlock
+    @repositorysnapshots
     def get_install_queue(self, package_matches, empty, deep,
         relaxed = False, build = False, quiet = False, recursive = True,
         only_deps = False, critical_updates = True):
@@ -3818,6 +4460,7 @@ class CalculatorsMixin:
         removal = []
         # we don't know the input type, standardize to list()
         internal_matches = list(package_matches)
+        session = _DependencySolverSession(self)
 
         def _filter_key_slot(pkg_matches):
             """
@@ -3832,16 +4475,14 @@ class CalculatorsMixin:
                                x not in internal_matches_set]
 
             for pkg_id, _repo_id in internal_matches_set:
-                _key_slot = self.open_repository(_repo_id).retrieveKeySlot(
-                    pkg_id)
+                _key_slot = session.retrieve_key_slot(pkg_id, _repo_id)
                 if _key_slot is not None:
                     internal_matches_key_slot.add(_key_slot)
 
             new_pkg_matches = []
             for pkg_match in pkg_matches:
                 pkg_id, _repo_id = pkg_match
-                _key_slot = self.open_repository(_repo_id).retrieveKeySlot(
-                    pkg_id)
+                _key_slot = session.retrieve_key_slot(pkg_id, _repo_id)
                 # ignore None
                 if _key_slot not in internal_matches_key_slot:
                     new_pkg_matches.append(pkg_match)
@@ -3871,7 +4512,8 @@ class CalculatorsMixin:
             deptree = self._get_required_packages(
                 internal_matches, empty_deps = empty, deep_deps = deep,
                 relaxed_deps = relaxed, only_deps = only_deps,
-                build_deps = build, quiet = quiet, recursive = recursive)
+                build_deps = build, quiet = quiet, recursive = recursive,
+                session = session)
         except DependenciesCollision as exc:
             # Packages pulled in conflicting dependencies, these sharing the
             # same key+slot. For example, repositories contain one or more
@@ -3883,6 +4525,12 @@ class CalculatorsMixin:
             # One or more dependencies pulled in by packages are not
             # found in repositories
             raise
+        finally:
+            if const_debug_enabled():
+                const_debug_write(
+                    __name__,
+                    "get_install_queue(), "
+                    "solver session caches: %s" % (session.stats(),))
 
         # format
         removal = deptree.pop(0, set())
@@ -3903,8 +4551,7 @@ class CalculatorsMixin:
                 myremmatch[keyslot] = rm_package_id
 
             for pkg_id, pkg_repo in install:
-                dbconn = self.open_repository(pkg_repo)
-                testtuple = dbconn.retrieveKeySlot(pkg_id)
+                testtuple = session.retrieve_key_slot(pkg_id, pkg_repo)
                 removal.discard(myremmatch.get(testtuple))
 
         return install, sorted(removal)
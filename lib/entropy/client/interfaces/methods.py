@@ -23,6 +23,7 @@ import types
 import subprocess
 import threading
 import codecs
+import contextlib
 import copy
 from datetime import datetime
 
@@ -35,6 +36,7 @@ from entropy.const import etpConst, const_debug_write, etpSys, \
 from entropy.exceptions import RepositoryError, SystemDatabaseError, \
     RepositoryPluginError, SecurityError, EntropyPackageException
 from entropy.db.skel import EntropyRepositoryBase
+from entropy.db.snapshot import EntropyRepositorySnapshot
 from entropy.db.exceptions import Error as EntropyRepositoryError
 from entropy.cache import EntropyCacher
 from entropy.misc import FlockFile
@@ -198,6 +200,9 @@ class RepositoryMixin:
                     sys.stderr.write("!!! Cannot close Entropy repos: %s\n" % (
                         err,))
             repo_cache.clear()
+            snapshots = getattr(self, "_repository_snapshots", None)
+            if snapshots is not None:
+                snapshots.clear()
 
         # disable hooks during SystemSettings cleanup
         # otherwise it makes entropy.client.interfaces.repository crazy
@@ -216,13 +221,55 @@ class RepositoryMixin:
         with self._repodb_cache_mutex:
             cached = self._repodb_cache.get(key)
             if cached is not None:
-                return cached
+                return self.__repository_snapshot(key, cached)
             cached = self._load_repository(
                 repository_id,
                 xcache = self.xcache, indexing = self._indexing,
                 _enabled_repos = _enabled_repos)
             self._repodb_cache[key] = cached
-            return cached
+            return self.__repository_snapshot(key, cached)
+
+    def __repository_snapshot(self, key, repo):
+        """
+        Return the EntropyRepositorySnapshot of the given repository if
+        called inside a repository_snapshots() context, the repository
+        itself otherwise. Only available packages repositories are
+        snapshotted.
+        """
+        snapshots = self._repository_snapshots
+        if snapshots is None:
+            return repo
+        if not isinstance(repo, AvailablePackagesRepository):
+            return repo
+
+        snapshot = snapshots.get(key)
+        if snapshot is None or snapshot.repository() is not repo:
+            snapshot = EntropyRepositorySnapshot(repo)
+            snapshots[key] = snapshot
+        return snapshot
+
+    @contextlib.contextmanager
+    def repository_snapshots(self):
+        """
+        Make open_repository() return frozen, in-memory, snapshots of the
+        available packages repositories (see
+        entropy.db.snapshot.EntropyRepositorySnapshot) while inside this
+        context. Snapshots are built lazily and dropped when the outermost
+        context is left or when close_repositories() is called.
+        Nested calls are reference counted.
+        Repositories must not be modified while inside this context.
+        """
+        with self._repodb_cache_mutex:
+            self._repository_snapshots_count += 1
+            if self._repository_snapshots is None:
+                self._repository_snapshots = {}
+        try:
+            yield
+        finally:
+            with self._repodb_cache_mutex:
+                self._repository_snapshots_count -= 1
+                if self._repository_snapshots_count == 0:
+                    self._repository_snapshots = None
 
     def open_repository(self, repository_id):
         """
@@ -324,14 +371,18 @@ class RepositoryMixin:
                     self._repo_error_messages_cache.add(repository_id)
                 raise RepositoryError("repository not downloaded")
 
-            conn = self.get_repository(repository_id)(
+            repo_class = self.get_repository(repository_id)
+            conn = repo_class(
                 readOnly = True,
                 dbFile = dbfile,
                 # this is ignored if get_repository() returns
                 # InstalledPackagesRepository
                 name = repository_id,
                 xcache = xcache,
-                indexing = indexing
+                indexing = indexing,
+                # available repositories are never written through
+                # the cached instances.
+                readonly_uri = repo_class is AvailablePackagesRepository
             )
             conn.setCloseToken(repository_id)
             self._add_plugin_to_client_repository(conn)
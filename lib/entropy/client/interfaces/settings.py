@@ -14,7 +14,7 @@ import hashlib
 import os
 
 from entropy.const import etpConst, const_file_readable, \
-    const_convert_to_unicode, const_convert_to_rawstring
+    const_convert_to_unicode, const_convert_to_rawstring, const_get_cpus
 from entropy.core.settings.plugins.skel import SystemSettingsPlugin
 
 from entropy.exceptions import SystemDatabaseError, RepositoryError
@@ -392,6 +392,7 @@ class ClientSystemSettingsPlugin(SystemSettingsPlugin):
             'configprotectskip': set(),
             'autoprune_days': None, # disabled by default
             'edelta_support': False, # disabled by default
+            'updates_jobs': 1, # serial updates calculation by default
         }
 
         cli_conf = ClientSystemSettingsPlugin.client_conf_path()
@@ -439,6 +440,17 @@ class ClientSystemSettingsPlugin(SystemSettingsPlugin):
                 if bool_setting:
                     data['multifetch'] = 3
 
+        def _updates_jobs(setting):
+            int_setting = entropy.tools.setting_to_int(setting, 1, 64)
+            bool_setting = entropy.tools.setting_to_bool(setting)
+            if int_setting is not None:
+                data['updates_jobs'] = int_setting
+            elif bool_setting is not None:
+                if bool_setting:
+                    data['updates_jobs'] = const_get_cpus()
+                else:
+                    data['updates_jobs'] = 1
+
         def _gpg(setting):
             bool_setting = entropy.tools.setting_to_bool(setting)
             if bool_setting is not None:
@@ -485,6 +497,7 @@ class ClientSystemSettingsPlugin(SystemSettingsPlugin):
             'packagehashes': _packagehashes,
             'package-hashes': _packagehashes,
             'multifetch': _multifetch,
+            'updates-jobs': _updates_jobs,
             'gpg': _gpg,
             'ignore-spm-downgrades': _spm_downgrades,
             'splitdebug': _splitdebug,
@@ -40,6 +40,24 @@ def sharedinstlock(method):
     return wrapped
 
 
+def repositorysnapshots(method):
+    """
+    Decorator that calls the wrapped function inside a
+    repository_snapshots() context, if the ENABLE_REPOSITORY_SNAPSHOTS
+    attribute of "self" evaluates to True.
+
+    This decorator expects that "self" has a repository_snapshots() method
+    (see Client.repository_snapshots()).
+    """
+    def wrapped(self, *args, **kwargs):
+        if not self.ENABLE_REPOSITORY_SNAPSHOTS:
+            return method(self, *args, **kwargs)
+        with self.repository_snapshots():
+            return method(self, *args, **kwargs)
+
+    return wrapped
+
+
 def exclusiveinstlock(method):
     """
     Decorator that acquires the Installed Packages Repository lock in
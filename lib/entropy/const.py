@@ -371,6 +371,12 @@ def const_default_settings(rootdir):
         # Entropy sqlite database file default_etp_dir + \
         #    default_etp_dbdir+"/packages.db"
         'etpdatabasefile': default_etp_dbfile,
+        # SQLite journal mode used by writable repositories (for
+        # example "wal"), None keeps the SQLite default (rollback journal)
+        'sqlitejournalmode': os.getenv("ETP_SQLITE_JOURNAL_MODE"),
+        # package content format used by writable SQLite repositories
+        # ("rows" or "blob"), None keeps the format currently in use
+        'sqlitecontentformat': os.getenv("ETP_SQLITE_CONTENT_FORMAT"),
         # Entropy sqlite database file (gzipped)
         'etpdatabasefilegzip': default_etp_dbfile+".gz",
         'etpdatabasefilegziphash': default_etp_dbfile+".gz.md5",
@@ -403,6 +409,15 @@ def const_default_settings(rootdir):
         'etpdatabasedumplighthashfilebz2': default_etp_dbfile+".dumplight.bz2.md5",
         'etpdatabasedumplighthashfilegzip': default_etp_dbfile+".dumplight.gz.md5",
         'etpdatabasedumplight': default_etp_dbfile+".dumplight",
+        # Entropy repository changesets index file
+        'etpdatabasechangesetsfile': default_etp_dbfile+".changesets",
+        # Entropy repository changeset file, per target revision
+        'etpdatabasechangesetfile': default_etp_dbfile+".changeset.%d.bz2",
+        # Entropy repository changesets state file (server-side only)
+        'etpdatabasechangesetsstatefile': \
+            default_etp_dbfile+".changesets.state",
+        # maximum number of changesets kept on mirrors
+        'etpdatabasechangesetsmax': 10,
         # expiration based server-side packages removal
 
         'etpdatabaseexpbasedpkgsrm': default_etp_dbfile+".fatscope",
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+
+    @author: Fabio Erculiani <lxnay@sabayon.org>
+    @contact: lxnay@sabayon.org
+    @copyright: Fabio Erculiani
+    @license: GPL-2
+
+    I{EntropyRepository} binary dump format.
+
+    A binary dump starts with DUMP_MAGIC and is a sequence of records,
+    each one starting with a single byte tag:
+
+        - STATEMENT: SQL statement (table or index creation)
+        - TABLE: start of table data (table name, columns count)
+        - ROW: length-prefixed table row, a sequence of typed columns
+        - END_TABLE: end of table data
+        - END: end of the dump
+
+    Integers are big-endian, strings and blobs are length-prefixed.
+    Both writing and reading are streamed, rows are never accumulated
+    by this module.
+
+"""
+import struct
+
+from entropy.const import const_is_python3, const_isunicode, \
+    const_get_buffer, const_convert_to_rawstring
+
+# magic header, the last byte is the format version
+DUMP_MAGIC = b"ETPDUMP\x01"
+
+STATEMENT = b"S"
+TABLE = b"T"
+ROW = b"R"
+END_TABLE = b"E"
+END = b"Z"
+
+_NULL = b"N"
+_INTEGER = b"I"
+_FLOAT = b"F"
+_TEXT = b"T"
+_BLOB = b"B"
+
+_LENGTH = struct.Struct(">I")
+_COLUMNS = struct.Struct(">H")
+_INT64 = struct.Struct(">q")
+_DOUBLE = struct.Struct(">d")
+
+if const_is_python3():
+    _integer_types = (int,)
+else:
+    _integer_types = (int, long,)
+
+
+def is_binary_dump(path):
+    """
+    Return whether the given file is a binary repository dump.
+
+    @param path: path to file
+    @type path: string
+    @return: True, if the file is a binary dump
+    @rtype: bool
+    """
+    try:
+        with open(path, "rb") as dump_f:
+            return dump_f.read(len(DUMP_MAGIC)) == DUMP_MAGIC
+    except (OSError, IOError):
+        return False
+
+
+class DumpFormatError(Exception):
+    """
+    Raised when a binary dump is truncated or malformed.
+    """
+
+
+class RepositoryDumpWriter(object):
+    """
+    Write a binary repository dump to a file object.
+    """
+
+    def __init__(self, dump_f):
+        """
+        RepositoryDumpWriter constructor, the dump header is written
+        immediately.
+
+        @param dump_f: file object to write to
+        @type dump_f: file object
+        """
+        self._dump_f = dump_f
+        self._dump_f.write(DUMP_MAGIC)
+
+    def _string(self, data):
+        data = const_convert_to_rawstring(data)
+        return _LENGTH.pack(len(data)) + data
+
+    def statement(self, sql):
+        """
+        Write a SQL statement record.
+
+        @param sql: SQL statement
+        @type sql: string
+        """
+        self._dump_f.write(STATEMENT + self._string(sql))
+
+    def table(self, name, columns):
+        """
+        Write a table data start record, it must be followed by columns
+        long rows and by end_table().
+
+        @param name: table name
+        @type name: string
+        @param columns: number of table columns
+        @type columns: int
+        """
+        self._dump_f.write(TABLE + self._string(name) + _COLUMNS.pack(columns))
+
+    def row(self, row):
+        """
+        Write a table row record.
+
+        @param row: table row
+        @type row: tuple
+        """
+        data = []
+        for value in row:
+            if value is None:
+                data.append(_NULL)
+            elif isinstance(value, float):
+                data.append(_FLOAT + _DOUBLE.pack(value))
+            elif isinstance(value, _integer_types):
+                data.append(_INTEGER + _INT64.pack(value))
+            elif const_isunicode(value):
+                data.append(_TEXT + self._string(value))
+            else:
+                data.append(_BLOB + self._string(value))
+
+        data = b"".join(data)
+        self._dump_f.write(ROW + _LENGTH.pack(len(data)) + data)
+
+    def end_table(self):
+        """
+        Write a table data end record.
+        """
+        self._dump_f.write(END_TABLE)
+
+    def close(self):
+        """
+        Write the dump end record and flush the file object, which is
+        not closed.
+        """
+        self._dump_f.write(END)
+        if hasattr(self._dump_f, "flush"):
+            self._dump_f.flush()
+
+
+class RepositoryDumpReader(object):
+    """
+    Read a binary repository dump from a file object. Iterating over a
+    RepositoryDumpReader instance yields the dump records as tuples:
+
+        - (STATEMENT, sql)
+        - (TABLE, name, columns)
+        - (ROW, row)
+        - (END_TABLE,)
+
+    Text columns are returned as raw strings on Python 2.x, to be stored
+    as they are, and as unicode strings on Python 3.x.
+    """
+
+    def __init__(self, dump_f):
+        """
+        RepositoryDumpReader constructor.
+
+        @param dump_f: file object to read from
+        @type dump_f: file object
+        @raise DumpFormatError: if the file is not a binary dump
+        """
+        self._dump_f = dump_f
+        if self._read(len(DUMP_MAGIC)) != DUMP_MAGIC:
+            raise DumpFormatError("not a binary repository dump")
+
+    def _read(self, length):
+        data = self._dump_f.read(length)
+        if len(data) != length:
+            raise DumpFormatError("truncated binary repository dump")
+        return data
+
+    def _string(self):
+        length, = _LENGTH.unpack(self._read(_LENGTH.size))
+        return self._read(length)
+
+    def _text(self, data):
+        if const_is_python3():
+            return data.decode("utf-8", "replace")
+        return data
+
+    def _row(self, data):
+        row = []
+        offset = 0
+        while offset < len(data):
+            tag = data[offset:offset + 1]
+            offset += 1
+            if tag == _NULL:
+                row.append(None)
+            elif tag == _INTEGER:
+                row.append(_INT64.unpack_from(data, offset)[0])
+                offset += _INT64.size
+            elif tag == _FLOAT:
+                row.append(_DOUBLE.unpack_from(data, offset)[0])
+                offset += _DOUBLE.size
+            elif tag in (_TEXT, _BLOB):
+                length, = _LENGTH.unpack_from(data, offset)
+                offset += _LENGTH.size
+                value = data[offset:offset + length]
+                offset += length
+                if tag == _TEXT:
+                    row.append(self._text(value))
+                else:
+                    row.append(const_get_buffer()(value))
+            else:
+                raise DumpFormatError("invalid column type %r" % (tag,))
+
+        if offset != len(data):
+            raise DumpFormatError("truncated table row")
+        return tuple(row)
+
+    def __iter__(self):
+        while True:
+            tag = self._read(1)
+            if tag == END:
+                return
+            elif tag == ROW:
+                yield (ROW, self._row(self._string()))
+            elif tag == STATEMENT:
+                yield (STATEMENT, self._text(self._string()))
+            elif tag == TABLE:
+                name = self._text(self._string())
+                columns, = _COLUMNS.unpack(self._read(_COLUMNS.size))
+                yield (TABLE, name, columns)
+            elif tag == END_TABLE:
+                yield (END_TABLE,)
+            else:
+                raise DumpFormatError("invalid record type %r" % (tag,))
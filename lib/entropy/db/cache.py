@@ -9,10 +9,19 @@
     I{EntropyRepository} caching interface.
 
 """
+import atexit
+import collections
+import itertools
+import os
+import sys
+import threading
+import time
 import weakref
 
+from entropy.const import const_setup_file, const_is_python3
 from entropy.core import Singleton
 
+import entropy.dump
 import entropy.tools
 
 
@@ -20,59 +29,234 @@ class EntropyRepositoryCacher(Singleton):
     """
     Tiny singleton-based helper class used by EntropyRepository in order
     to keep cached items in RAM.
+
+    Items are grouped into partitions (usually one per repository), each
+    one being a LRU list. The approximate size of the cached items is
+    tracked and once the memory budget is exceeded, the least recently
+    used items of the biggest partition are evicted.
     """
+
+    # Memory budget, in bytes, ETP_LIVE_CACHE_SIZE (megabytes) overrides
+    # the default, which is scaled on the available system memory.
+    _MIN_BUDGET = 16 * 1024 * 1024
+    _MAX_BUDGET = 512 * 1024 * 1024
+
+    # Max number of container elements inspected by _sizeof(), the
+    # size of the others is extrapolated.
+    _SIZEOF_SAMPLE = 32
+
     def init_singleton(self):
-        self.__live_cache = {}
+        self.__lock = threading.RLock()
+        self.__partitions = {}
+        self.__partition_sizes = {}
+        self.__key_index = {}
+        self.__size = 0
+        self.__budget = self._memory_budget()
+
+    @classmethod
+    def _memory_budget(cls):
+        """
+        Return the live cache memory budget, in bytes.
+        """
+        env_size = os.getenv("ETP_LIVE_CACHE_SIZE")
+        if env_size is not None:
+            try:
+                return max(0, int(env_size)) * 1024 * 1024
+            except ValueError:
+                pass
+        budget = int(entropy.tools.total_memory()) * 1024 * 1024 // 32
+        return min(max(budget, cls._MIN_BUDGET), cls._MAX_BUDGET)
+
+    @classmethod
+    def _sizeof(cls, obj, depth = 3):
+        """
+        Return the approximate size of obj, in bytes. Containers are
+        inspected down to the given depth.
+        """
+        size = sys.getsizeof(obj)
+        if depth < 1:
+            return size
+        if isinstance(obj, dict):
+            if const_is_python3():
+                items = obj.items()
+            else:
+                items = obj.iteritems()
+        elif isinstance(obj, (tuple, list, set, frozenset)):
+            items = obj
+        else:
+            return size
+
+        length = len(obj)
+        if not length:
+            return size
+        sample = itertools.islice(items, cls._SIZEOF_SAMPLE)
+        sample_size = 0
+        sample_count = 0
+        for item in sample:
+            sample_size += cls._sizeof(item, depth = depth - 1)
+            sample_count += 1
+        return size + (sample_size * length) // sample_count
+
+    def budget(self):
+        """
+        Return the memory budget, in bytes.
+        """
+        return self.__budget
+
+    def set_budget(self, budget):
+        """
+        Change the memory budget, evicting items if required.
+
+        @param budget: the new memory budget, in bytes
+        @type budget: int
+        """
+        with self.__lock:
+            self.__budget = budget
+            self.__evict()
+
+    def usage(self, partition = None):
+        """
+        Return the approximate memory used by the cached items, in bytes.
+
+        @keyword partition: if given, return the usage of this partition
+        @type partition: string
+        """
+        with self.__lock:
+            if partition is None:
+                return self.__size
+            return self.__partition_sizes.get(partition, 0)
+
+    def reset_after_fork(self):
+        """
+        Drop the cached items and the lock inherited from the parent
+        process. To be called in a forked child only, where the lock
+        could have been held by a thread that does not exist anymore.
+        """
+        self.init_singleton()
 
     def clear(self):
         """
         Clear all the cached items
         """
-        self.__live_cache.clear()
+        with self.__lock:
+            self.__partitions.clear()
+            self.__partition_sizes.clear()
+            self.__key_index.clear()
+            self.__size = 0
+
+    def __pop(self, key):
+        """
+        Remove a cached item. Must be called with the lock held.
+        """
+        partition = self.__key_index.pop(key, None)
+        if partition is None:
+            return
+        items = self.__partitions[partition]
+        _value, size = items.pop(key)
+        self.__size -= size
+        if items:
+            self.__partition_sizes[partition] -= size
+        else:
+            del self.__partitions[partition]
+            del self.__partition_sizes[partition]
+
+    def __drop_partition(self, partition):
+        """
+        Remove a whole partition. Must be called with the lock held.
+        """
+        items = self.__partitions.pop(partition)
+        self.__size -= self.__partition_sizes.pop(partition)
+        for key in items:
+            del self.__key_index[key]
+
+    def __evict(self):
+        """
+        Evict the least recently used items of the biggest partition
+        until the memory budget is met. Must be called with the lock
+        held.
+        """
+        while self.__size > self.__budget and self.__partitions:
+            partition = max(self.__partition_sizes,
+                            key = self.__partition_sizes.get)
+            items = self.__partitions[partition]
+            key = next(iter(items))
+            self.__pop(key)
 
     def clear_key(self, key):
         """
         Clear just the cached item at key (hash table).
         """
-        try:
-            del self.__live_cache[key]
-        except KeyError:
-            pass
+        with self.__lock:
+            self.__pop(key)
 
     def keys(self):
         """
         Return a list of available cache keys
         """
-        return list(self.__live_cache.keys())
+        with self.__lock:
+            return list(self.__key_index.keys())
 
     def discard(self, key):
         """
         Discard all the cache items with hash table key starting with "key".
         """
-        for dkey in tuple(self.__live_cache.keys()):
-            if dkey.startswith(key):
-                try:
-                    self.__live_cache.pop(dkey)
-                except KeyError:
-                    pass
+        with self.__lock:
+            for partition in list(self.__partitions.keys()):
+                if partition.startswith(key):
+                    self.__drop_partition(partition)
+                elif key.startswith(partition):
+                    items = self.__partitions[partition]
+                    for dkey in [x for x in items if x.startswith(key)]:
+                        self.__pop(dkey)
 
     def get(self, key):
         """
         Get the cached item, if exists.
         """
-        obj = self.__live_cache.get(key)
+        with self.__lock:
+            partition = self.__key_index.get(key)
+            if partition is None:
+                return None
+            items = self.__partitions[partition]
+            data = items.pop(key)
+            # mark as most recently used
+            items[key] = data
+            obj = data[0]
+
         if isinstance(obj, weakref.ref):
             return obj()
         return obj
 
-    def set(self, key, value):
+    def set(self, key, value, partition = ""):
         """
         Set item in cache.
+
+        @param key: the cache key
+        @type key: string
+        @param value: the object to cache
+        @type value: any
+        @keyword partition: the partition the item belongs to, keys
+            should start with it (usually, the repository live cache key)
+        @type partition: string
         """
         if isinstance(value, (set, frozenset)):
-            self.__live_cache[key] = weakref.ref(value)
+            value = weakref.ref(value)
+            size = sys.getsizeof(value)
         else:
-            self.__live_cache[key] = value
+            size = self._sizeof(value)
+
+        with self.__lock:
+            self.__pop(key)
+            items = self.__partitions.get(partition)
+            if items is None:
+                items = collections.OrderedDict()
+                self.__partitions[partition] = items
+                self.__partition_sizes[partition] = 0
+            items[key] = (value, size)
+            self.__key_index[key] = partition
+            self.__partition_sizes[partition] += size
+            self.__size += size
+            self.__evict()
 
 
 class EntropyRepositoryCachePolicies(object):
@@ -86,11 +270,297 @@ class EntropyRepositoryCachePolicies(object):
         # No caching in RAM at all, slower in some cases, but
         # still acceptably fast.
         NONE,
-        # All the queries that make sense to cache are cached in RAM.
+        # All the queries that make sense to cache are cached in RAM,
+        # within the EntropyRepositoryCacher memory budget.
         ALL,
     ) = range(2)
 
-    if entropy.tools.total_memory() >= 4000:
-        DEFAULT_CACHE_POLICY = ALL
-    else:
-        DEFAULT_CACHE_POLICY = NONE
+    DEFAULT_CACHE_POLICY = ALL
+
+
+class EntropyRepositoryMatchCache(object):
+    """
+    On-disk, single-file, store of EntropyRepository atomMatch() results.
+
+    Each repository gets its own SQLite file, in which results are keyed
+    by a validation key (usually built from the repository checksum) and
+    the atomMatch() arguments hash string. Results for several validation
+    keys can live together, so that repositories sharing the same name
+    (temporary ones, for instance) do not wipe each other's results. The
+    least recently used validation keys are pruned in batches.
+    Writes are buffered in RAM and flushed to disk in batches, either when
+    the buffer is full, the repository is closed or the process exits.
+    """
+
+    # Max number of results kept in RAM before being written to disk
+    _BATCH_SIZE = 250
+
+    # Once more than _MAX_VALIDATION_KEYS validation keys are stored,
+    # the least recently used ones are pruned, keeping
+    # _KEEP_VALIDATION_KEYS of them.
+    _MAX_VALIDATION_KEYS = 16
+    _KEEP_VALIDATION_KEYS = 8
+
+    # On-disk format version, older stores are dropped
+    _FORMAT = 1
+
+    _DIRECTORY = os.path.join("match", "db")
+    _STORES = {}
+    _STORES_LOCK = threading.Lock()
+    # stores inherited by forked children, see reset_after_fork()
+    _INHERITED_STORES = []
+
+    @classmethod
+    def get(cls, name, cache_dir = None):
+        """
+        Return the EntropyRepositoryMatchCache instance bound to the
+        given repository name. Instances are shared process-wide.
+
+        @param name: repository identifier
+        @type name: string
+        @keyword cache_dir: alternative cache directory
+        @type cache_dir: string
+        @return: the match cache store
+        @rtype: EntropyRepositoryMatchCache
+        """
+        if cache_dir is None:
+            cache_dir = entropy.dump.D_DIR
+        key = (cache_dir, name)
+        with cls._STORES_LOCK:
+            store = cls._STORES.get(key)
+            if store is None:
+                store = cls(os.path.join(
+                        cache_dir, cls._DIRECTORY, name + ".db"))
+                cls._STORES[key] = store
+        return store
+
+    @classmethod
+    def reset_after_fork(cls):
+        """
+        Forget the stores inherited from the parent process. To be
+        called in a forked child only: the inherited SQLite connections
+        and locks belong to the parent. The inherited stores are kept
+        referenced and never used again, so that their connections are
+        not finalized by the child.
+        """
+        cls._INHERITED_STORES.append(cls._STORES)
+        cls._STORES = {}
+        cls._STORES_LOCK = threading.Lock()
+
+    @classmethod
+    def flush_all(cls):
+        """
+        Flush the pending writes of all the instantiated stores.
+        """
+        with cls._STORES_LOCK:
+            stores = list(cls._STORES.values())
+        for store in stores:
+            store.flush()
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.RLock()
+        self._conn = None
+        self._excs = None
+        self._validation_keys = set()
+        self._pending = {}
+
+    def _connection(self):
+        """
+        Return the SQLite connection to the store, (re)opening it if
+        needed. The file could have been removed by a cache cleanup.
+        """
+        if self._conn is not None and not os.path.isfile(self._path):
+            self._close()
+
+        if self._conn is None:
+            from sqlite3 import dbapi2
+            self._excs = dbapi2
+
+            store_dir = os.path.dirname(self._path)
+            if not os.path.isdir(store_dir):
+                os.makedirs(store_dir, 0o775)
+                const_setup_file(store_dir, entropy.dump.E_GID, 0o775)
+            is_new = not os.path.isfile(self._path)
+
+            conn = dbapi2.connect(
+                self._path, timeout = 30.0, check_same_thread = False)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != self._FORMAT:
+                conn.executescript("""
+                DROP TABLE IF EXISTS settings;
+                DROP TABLE IF EXISTS matches;
+                DROP TABLE IF EXISTS validationkeys;
+                CREATE TABLE validationkeys (
+                    validation_key VARCHAR PRIMARY KEY,
+                    last_used FLOAT
+                );
+                CREATE TABLE matches (
+                    validation_key VARCHAR,
+                    hash VARCHAR,
+                    data BLOB,
+                    PRIMARY KEY (validation_key, hash)
+                );
+                PRAGMA user_version = %d;
+                """ % (self._FORMAT,))
+                conn.commit()
+            if is_new:
+                const_setup_file(self._path, entropy.dump.E_GID, 0o664)
+            self._conn = conn
+            self._validation_keys.clear()
+
+        return self._conn
+
+    def _close(self):
+        """
+        Close the SQLite connection to the store, if open.
+        """
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except self._excs.Error:
+                pass
+            self._conn = None
+            self._validation_keys.clear()
+
+    def _validate(self, conn, validation_keys):
+        """
+        Mark the given validation keys as recently used, once per
+        connection, and prune the least recently used ones if too many
+        of them are stored.
+        """
+        new_keys = [x for x in validation_keys if x not in \
+                        self._validation_keys]
+        if not new_keys:
+            return
+
+        now = time.time()
+        conn.executemany("""
+        INSERT OR REPLACE INTO validationkeys VALUES (?, ?)
+        """, [(x, now) for x in new_keys])
+
+        cur = conn.execute("SELECT COUNT(*) FROM validationkeys")
+        if cur.fetchone()[0] > self._MAX_VALIDATION_KEYS:
+            cur = conn.execute("""
+            SELECT validation_key FROM validationkeys
+            ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            """, (self._KEEP_VALIDATION_KEYS,))
+            stale_keys = [(x[0],) for x in cur.fetchall() \
+                              if x[0] not in new_keys]
+            conn.executemany("""
+            DELETE FROM matches WHERE validation_key = ?
+            """, stale_keys)
+            conn.executemany("""
+            DELETE FROM validationkeys WHERE validation_key = ?
+            """, stale_keys)
+            self._validation_keys.difference_update(
+                x[0] for x in stale_keys)
+
+        conn.commit()
+        self._validation_keys.update(new_keys)
+
+    def _touch(self, conn, validation_key):
+        """
+        Best-effort _validate() for readers: users that can read the
+        store but cannot write it must still get cache hits.
+        """
+        try:
+            self._validate(conn, (validation_key,))
+        except self._excs.Error:
+            try:
+                conn.rollback()
+            except self._excs.Error:
+                pass
+            # do not try again on every lookup
+            self._validation_keys.add(validation_key)
+
+    def fetch(self, validation_key, hash_str):
+        """
+        Fetch a cached result.
+
+        @param validation_key: the current validation key
+        @type validation_key: string
+        @param hash_str: the result key
+        @type hash_str: string
+        @return: the cached result, or None
+        @rtype: object
+        """
+        with self._lock:
+            data = self._pending.get((validation_key, hash_str))
+            if data is not None:
+                return entropy.dump.unserialize_string(data)
+
+            try:
+                conn = self._connection()
+                self._touch(conn, validation_key)
+                cur = conn.execute("""
+                SELECT data FROM matches
+                WHERE validation_key = ? AND hash = ?
+                """, (validation_key, hash_str,))
+                row = cur.fetchone()
+            except (OSError, IOError,):
+                return None
+            except self._excs.Error:
+                self._close()
+                return None
+
+        if row is None:
+            return None
+        try:
+            return entropy.dump.unserialize_string(bytes(row[0]))
+        except Exception:
+            # corrupted entry, ignore
+            return None
+
+    def store(self, validation_key, hash_str, result):
+        """
+        Store a result. Data is buffered and written to disk in batches.
+
+        @param validation_key: the current validation key
+        @type validation_key: string
+        @param hash_str: the result key
+        @type hash_str: string
+        @param result: picklable result
+        @type result: object
+        """
+        data = entropy.dump.serialize_string(result)
+        with self._lock:
+            self._pending[(validation_key, hash_str)] = data
+            if len(self._pending) >= self._BATCH_SIZE:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the buffered results to disk.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                conn = self._connection()
+                self._validate(conn, set(x[0] for x in pending))
+                conn.executemany("""
+                INSERT OR REPLACE INTO matches VALUES (?, ?, ?)
+                """, [(validation_key, hash_str, self._excs.Binary(data)) \
+                          for (validation_key, hash_str), data in \
+                          pending.items()])
+                conn.commit()
+            except (OSError, IOError,):
+                pass
+            except self._excs.Error:
+                self._close()
+
+    def clear(self):
+        """
+        Drop all the cached results, both buffered and on-disk.
+        """
+        with self._lock:
+            self._pending.clear()
+            self._close()
+            try:
+                os.remove(self._path)
+            except (OSError, IOError,):
+                pass
+
+atexit.register(EntropyRepositoryMatchCache.flush_all)
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+
+    @author: Fabio Erculiani <lxnay@sabayon.org>
+    @contact: lxnay@sabayon.org
+    @copyright: Fabio Erculiani
+    @license: GPL-2
+
+    I{EntropyRepository} changesets.
+
+    A changeset describes what changed in a repository between two
+    revisions: the removed package identifiers and the added packages,
+    with their metadata as served to EAPI3 clients, see
+    EntropyRepositoryBase.getPackageData(). Package sets and tree updates
+    are repository-wide and are carried as they are at the target
+    revision, together with the repository checksum.
+
+    A changeset file is a bzip2 compressed sequence of JSON lines, the
+    first line is the changeset header, each other line is an added
+    package. The changesets available on a mirror are listed in an index
+    file, one "<from revision> <to revision> <file name> <md5>" line each.
+
+"""
+import base64
+import bz2
+import hashlib
+import json
+import os
+
+from entropy.const import const_is_python3, const_isunicode, \
+    const_convert_to_unicode, const_convert_to_rawstring
+
+CHANGESET_VERSION = 1
+
+# JSON object key used to carry raw strings, like package triggers
+_RAW_KEY = "__raw__"
+
+if const_is_python3():
+    _scalar_types = (bool, int, float)
+else:
+    _scalar_types = (bool, int, long, float)
+
+
+class ChangesetError(Exception):
+    """
+    Raised when a changeset is malformed or cannot be applied.
+    """
+
+
+def _encode(obj):
+    if obj is None or isinstance(obj, _scalar_types):
+        return obj
+    if const_isunicode(obj):
+        return obj
+    if isinstance(obj, dict):
+        return dict((key, _encode(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return [_encode(x) for x in obj]
+    # raw strings and buffers
+    return {_RAW_KEY: const_convert_to_unicode(
+            base64.b64encode(const_convert_to_rawstring(obj)))}
+
+
+def _decode(obj):
+    if isinstance(obj, dict):
+        if len(obj) == 1 and _RAW_KEY in obj:
+            return base64.b64decode(const_convert_to_rawstring(obj[_RAW_KEY]))
+        return dict((key, _decode(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return [_decode(x) for x in obj]
+    return obj
+
+
+def _canonical(obj):
+    # like _encode(), with sequences sorted, so that equal metadata
+    # always yields the same JSON document
+    if isinstance(obj, dict):
+        return dict((key, _canonical(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sorted((_canonical(x) for x in obj),
+            key = lambda x: json.dumps(x, sort_keys = True))
+    return _encode(obj)
+
+
+def _write_line(changeset_f, obj):
+    changeset_f.write(const_convert_to_rawstring(
+            json.dumps(_encode(obj)) + "\n"))
+
+
+def _package_data(repository, package_id):
+    return repository.getPackageData(package_id,
+        content_insert_formatted = True, get_content = False,
+        get_changelog = False)
+
+
+def package_fingerprints(repository, package_ids):
+    """
+    Return a fingerprint of the metadata a changeset carries for each
+    of the given packages. Packages whose fingerprint changed between
+    two revisions must be written to the changeset as removed and
+    added again.
+
+    @param repository: the repository
+    @type repository: EntropyRepositoryBase
+    @param package_ids: package identifiers
+    @type package_ids: iterable
+    @return: map of package identifier and fingerprint (md5 hex digest)
+    @rtype: dict
+    """
+    fingerprints = {}
+    for package_id in package_ids:
+        data = _package_data(repository, package_id)
+        digest = hashlib.md5()
+        digest.update(const_convert_to_rawstring(
+                json.dumps(_canonical(data), sort_keys = True)))
+        fingerprints[package_id] = digest.hexdigest()
+    return fingerprints
+
+
+def write_changeset(repository, path, repository_id, from_revision,
+                    to_revision, added_ids, removed_ids):
+    """
+    Write a changeset from the current repository content. The file is
+    written to a temporary path first and then moved in place.
+
+    @param repository: the repository, at revision to_revision
+    @type repository: EntropyRepositoryBase
+    @param path: changeset file path
+    @type path: string
+    @param repository_id: repository identifier
+    @type repository_id: string
+    @param from_revision: revision the changeset applies to
+    @type from_revision: int
+    @param to_revision: revision the changeset leads to
+    @type to_revision: int
+    @param added_ids: package identifiers added since from_revision,
+        including the modified ones
+    @type added_ids: iterable
+    @param removed_ids: package identifiers removed since from_revision,
+        including the modified ones
+    @type removed_ids: iterable
+    """
+    header = {
+        "version": CHANGESET_VERSION,
+        "from_revision": from_revision,
+        "to_revision": to_revision,
+        "removed": sorted(removed_ids),
+        "checksum": repository.checksum(do_order = True,
+            strict = False, include_signatures = True),
+        "sets": repository.retrievePackageSets(),
+        "treeupdates_digest": repository.retrieveRepositoryUpdatesDigest(
+            repository_id),
+        "treeupdates_actions": repository.listAllTreeUpdatesActions(),
+    }
+
+    tmp_path = path + ".tmp"
+    changeset_f = bz2.BZ2File(tmp_path, "wb")
+    try:
+        _write_line(changeset_f, header)
+        for package_id in sorted(added_ids):
+            data = _package_data(repository, package_id)
+            _write_line(changeset_f,
+                {"package_id": package_id, "metadata": data})
+    finally:
+        changeset_f.close()
+    os.rename(tmp_path, path)
+
+
+class ChangesetReader(object):
+    """
+    Read a changeset file. Iterating over a ChangesetReader instance
+    yields (package_id, metadata) tuples for the added packages.
+    """
+
+    def __init__(self, path):
+        """
+        ChangesetReader constructor, the changeset header is read
+        immediately.
+
+        @param path: changeset file path
+        @type path: string
+        @raise ChangesetError: if the changeset is malformed
+        """
+        self._changeset_f = bz2.BZ2File(path, "rb")
+        try:
+            self._header = self._read_line()
+            if self._header is None:
+                raise ChangesetError("empty changeset")
+            if self._header.get("version") != CHANGESET_VERSION:
+                raise ChangesetError("unsupported changeset version")
+        except:
+            self._changeset_f.close()
+            raise
+
+    def _read_line(self):
+        try:
+            line = self._changeset_f.readline()
+        except (IOError, EOFError) as err:
+            raise ChangesetError("cannot read changeset: %s" % (err,))
+        if not line:
+            return None
+        try:
+            return _decode(json.loads(const_convert_to_unicode(line)))
+        except (ValueError, TypeError) as err:
+            raise ChangesetError("malformed changeset: %s" % (err,))
+
+    @property
+    def header(self):
+        """
+        Return the changeset header.
+
+        @return: changeset header, see write_changeset()
+        @rtype: dict
+        """
+        return self._header
+
+    def __iter__(self):
+        while True:
+            obj = self._read_line()
+            if obj is None:
+                return
+            yield obj["package_id"], obj["metadata"]
+
+    def close(self):
+        """
+        Close the changeset file.
+        """
+        self._changeset_f.close()
+
+
+def apply_changesets(repository, repository_id, paths, from_revision):
+    """
+    Apply consecutive changesets to the given repository, starting from
+    from_revision, inside a single EntropySQLRepository.bulkImport()
+    transaction. The repository checksum is verified against the one
+    of the last changeset before committing, on any error, nothing is
+    written.
+
+    @param repository: the repository to update
+    @type repository: EntropySQLRepository
+    @param repository_id: repository identifier
+    @type repository_id: string
+    @param paths: ordered list of changeset file paths
+    @type paths: list
+    @param from_revision: current repository revision
+    @type from_revision: int
+    @return: the new repository revision
+    @rtype: int
+    @raise ChangesetError: if changesets are not consecutive, malformed
+        or if the resulting repository checksum does not match
+    """
+    if not paths:
+        raise ChangesetError("no changesets to apply")
+
+    revision = from_revision
+    header = None
+    with repository.bulkImport():
+        for path in paths:
+            reader = ChangesetReader(path)
+            try:
+                header = reader.header
+                if header["from_revision"] != revision:
+                    raise ChangesetError(
+                        "changeset for revision %s, expected %s" % (
+                            header["from_revision"], revision))
+
+                for package_id in header["removed"]:
+                    repository.removePackage(package_id)
+                for package_id, metadata in reader:
+                    repository.addPackage(metadata,
+                        revision = metadata['revision'],
+                        package_id = package_id,
+                        formatted_content = True)
+                revision = header["to_revision"]
+            finally:
+                reader.close()
+
+        repository.setRepositoryUpdatesDigest(repository_id,
+            header["treeupdates_digest"])
+        repository.bumpTreeUpdatesActions(header["treeupdates_actions"])
+        repository.clearPackageSets()
+        repository.insertPackageSets(header["sets"])
+
+        repository.clearCache()
+        checksum = repository.checksum(do_order = True,
+            strict = False, include_signatures = True)
+        if checksum != header["checksum"]:
+            raise ChangesetError("repository checksum mismatch")
+
+    return revision
+
+
+def read_changeset_index(path):
+    """
+    Read a changeset index file.
+
+    @param path: changeset index file path
+    @type path: string
+    @return: list of (from revision, to revision, file name, md5) tuples
+    @rtype: list
+    @raise ChangesetError: if the index file is malformed
+    """
+    entries = []
+    with open(path, "rb") as index_f:
+        for line in index_f.readlines():
+            line = const_convert_to_unicode(line).strip()
+            if not line:
+                continue
+            try:
+                from_revision, to_revision, name, md5 = line.split()
+                entries.append(
+                    (int(from_revision), int(to_revision), name, md5))
+            except ValueError:
+                raise ChangesetError("malformed changeset index")
+    return entries
+
+
+def write_changeset_index(path, entries):
+    """
+    Write a changeset index file.
+
+    @param path: changeset index file path
+    @type path: string
+    @param entries: list of (from revision, to revision, file name, md5)
+        tuples
+    @type entries: list
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as index_f:
+        for entry in entries:
+            index_f.write(const_convert_to_rawstring("%d %d %s %s\n" % entry))
+    os.rename(tmp_path, path)
+
+
+def changeset_chain(entries, from_revision, to_revision):
+    """
+    Return the changeset index entries leading from from_revision to
+    to_revision, in order.
+
+    @param entries: changeset index entries, see read_changeset_index()
+    @type entries: list
+    @param from_revision: starting revision
+    @type from_revision: int
+    @param to_revision: target revision
+    @type to_revision: int
+    @return: list of index entries or None, if no chain is available
+    @rtype: list or None
+    """
+    by_revision = dict((x[0], x) for x in entries)
+    chain = []
+    revision = from_revision
+    while revision != to_revision:
+        entry = by_revision.get(revision)
+        if entry is None or entry[1] <= revision:
+            return None
+        chain.append(entry)
+        revision = entry[1]
+    if not chain:
+        return None
+    return chain
@@ -12,6 +12,8 @@
 """
 import os
 import hashlib
+import itertools
+import re
 import time
 try:
     import thread
@@ -41,6 +43,16 @@ class MySQLCursorWrapper(SQLCursorWrapper):
     the cursor itself.
     """
 
+    # rows fetched from the server at once, when iterating
+    FETCH_ROWS = 500
+    # maximum number of rows per multi-row INSERT statement
+    INSERT_BATCH_ROWS = 500
+    # MySQL prepared statements support up to 65535 placeholders
+    _MAX_PLACEHOLDERS = 65535
+    _INSERT_VALUES_RE = re.compile(
+        r"^(\s*(?:INSERT|REPLACE)\b.*\bVALUES\s*)(\([\s?,]*\))\s*;?\s*$",
+        re.IGNORECASE | re.DOTALL)
+
     def __init__(self, cursor, exceptions, errno):
         self._errno = errno
         self._conn_wr = cursor.connection
@@ -77,10 +89,32 @@ class MySQLCursorWrapper(SQLCursorWrapper):
         self._proxy_call(self._cur.execute, *args, **kwargs)
         return self
 
-    def executemany(self, *args, **kwargs):
+    def executemany(self, sql, params):
+        """
+        Execute sql for every set of params. INSERT and REPLACE
+        statements are rewritten into multi-row statements, inserting
+        up to INSERT_BATCH_ROWS rows per server round-trip.
+        """
         # force oursql to empty the resultset
         self._cur = self._cur.connection.cursor()
-        self._proxy_call(self._cur.executemany, *args, **kwargs)
+
+        match = self._INSERT_VALUES_RE.match(sql)
+        if match is None:
+            self._proxy_call(self._cur.executemany, sql, params)
+            return self
+
+        prefix, values = match.groups()
+        columns = max(values.count("?"), 1)
+        batch_rows = min(self.INSERT_BATCH_ROWS,
+                         self._MAX_PLACEHOLDERS // columns)
+        params = iter(params)
+        while True:
+            rows = list(itertools.islice(params, batch_rows))
+            if not rows:
+                break
+            batch_sql = prefix + ", ".join([values] * len(rows))
+            batch_params = list(itertools.chain.from_iterable(rows))
+            self._proxy_call(self._cur.execute, batch_sql, batch_params)
         return self
 
     def close(self, *args, **kwargs):
@@ -109,8 +143,15 @@ class MySQLCursorWrapper(SQLCursorWrapper):
         return self._proxy_call(self._cur.nextset, *args, **kwargs)
 
     def __iter__(self):
-        cur = iter(self._cur)
-        return MySQLCursorWrapper(cur, self._excs)
+        # stream the result set, FETCH_ROWS at a time, rather than
+        # loading it into memory
+        cur = self._cur
+        while True:
+            rows = self._proxy_call(cur.fetchmany, self.FETCH_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                yield row
 
     def __next__(self):
         return self.wrap(next, self._cur)
@@ -129,6 +170,7 @@ class MySQLConnectionWrapper(SQLConnectionWrapper):
 
     def __init__(self, connection, exceptions):
         SQLConnectionWrapper.__init__(self, connection, exceptions)
+        self._last_ping = time.time()
 
     def interrupt(self):
         """
@@ -140,8 +182,18 @@ class MySQLConnectionWrapper(SQLConnectionWrapper):
     def ping(self):
         """
         Reimplemented from SQLConnectionWrapper.
+        The connection is transparently re-established, if needed
+        (see EntropyMySQLRepository._connect()).
         """
-        return self._proxy_call(self._excs, self._con.ping)
+        rc = self._proxy_call(self._excs, self._con.ping)
+        self._last_ping = time.time()
+        return rc
+
+    def last_ping(self):
+        """
+        Return the time of the last successful ping().
+        """
+        return self._last_ping
 
     def unicode(self):
         """
@@ -160,12 +212,18 @@ class EntropyMySQLRepository(EntropySQLRepository):
 
     # bump this every time schema changes and databaseStructureUpdate
     # should be triggered
-    _SCHEMA_REVISION = 1
+    _SCHEMA_REVISION = 2
 
     _INSERT_OR_REPLACE = "REPLACE"
     _INSERT_OR_IGNORE = "INSERT IGNORE"
     _UPDATE_OR_REPLACE = None
 
+    # MySQL servers limit the number of concurrent connections, shared
+    # among all the clients
+    _CONNECTION_POOL_MAX_SIZE = 16
+    # seconds after which a connection in use is pinged again
+    _CONNECTION_PING_INTERVAL = 60.0
+
     class MySQLSchema(object):
 
         def get_init(self):
@@ -239,6 +297,14 @@ class EntropyMySQLRepository(EntropySQLRepository):
                     dependency VARCHAR(1024) NOT NULL
                 );
 
+                CREATE TABLE reversedependencies (
+                    idpackage INTEGER(10) UNSIGNED NOT NULL,
+                    iddependency INTEGER(10) UNSIGNED NOT NULL,
+                    PRIMARY KEY(idpackage, iddependency),
+                    FOREIGN KEY(idpackage)
+                        REFERENCES baseinfo(idpackage) ON DELETE CASCADE
+                );
+
                 CREATE TABLE conflicts (
                     idpackage INTEGER(10) UNSIGNED NOT NULL,
                     conflict VARCHAR(128) NOT NULL,
@@ -661,21 +727,31 @@ class EntropyMySQLRepository(EntropySQLRepository):
         current_thread = threading.current_thread()
         c_key = self._cursor_connection_pool_key()
 
-        cursor = None
         with self._cursor_pool_mutex():
+            cursor_data = self._cursor_pool().get(c_key)
+            if cursor_data is not None:
+                cursor, threads = cursor_data
+                # handle possible thread ident clashing
+                # in the cleanup thread function, because
+                # thread idents are recycled
+                # on thread termination
+                threads.add(current_thread)
+                return cursor
+
+        # the Connection Pool may have to wait for another thread to
+        # release its connection, which requires the Cursor Pool mutex
+        conn = self._connection_impl(_from_cursor=True)
+
+        with self._cursor_pool_mutex():
+            cursor = None
             threads = set()
             cursor_pool = self._cursor_pool()
             cursor_data = cursor_pool.get(c_key)
             if cursor_data is not None:
                 cursor, threads = cursor_data
-            # handle possible thread ident clashing
-            # in the cleanup thread function, because
-            # thread idents are recycled
-            # on thread termination
             threads.add(current_thread)
 
             if cursor is None:
-                conn = self._connection_impl(_from_cursor=True)
                 cursor = conn.cursor()
                 cursor.execute("SET storage_engine=InnoDB;")
                 cursor.execute("SET autocommit=OFF;")
@@ -687,6 +763,19 @@ class EntropyMySQLRepository(EntropySQLRepository):
 
         return cursor
 
+    def _iterCursor(self):
+        """
+        Reimplemented from EntropySQLRepository.
+        Return a new Cursor object, bound to the Connection of this
+        thread, whose result set is streamed from the server,
+        MySQLCursorWrapper.FETCH_ROWS rows at a time.
+        """
+        # make sure that the session has been set up
+        self._cursor()
+        return MySQLCursorWrapper(
+            self._connection().cursor(), self.ModuleProxy.exceptions(),
+            self.ModuleProxy.errno())
+
     def _connection_impl(self, _from_cursor=False):
         """
         Connection getter method implementation, adds
@@ -697,7 +786,7 @@ class EntropyMySQLRepository(EntropySQLRepository):
         c_key = self._cursor_connection_pool_key()
 
         conn = None
-        with self._connection_pool_mutex():
+        with self._connection_pool_checkout():
             threads = set()
             connection_pool = self._connection_pool()
             conn_data = connection_pool.get(c_key)
@@ -710,19 +799,33 @@ class EntropyMySQLRepository(EntropySQLRepository):
             threads.add(current_thread)
 
             if conn is None:
-                conn = MySQLConnectionWrapper.connect(
-                    self.ModuleProxy, self._mysql,
-                    MySQLConnectionWrapper,
-                    host = self._host, user = self._user,
-                    passwd = self._password, db = self._db,
-                    port = self._port, autoreconnect = True)
+                conn = self._checkoutConnection(self._connect)
+                # pooled connections may have been idle for a while
+                try:
+                    conn.ping()
+                except (OperationalError, InterfaceError):
+                    # cannot be re-established, get rid of it
+                    self._closeConnection(conn)
+                    conn = self._connect()
                 connection_pool[c_key] = conn, threads
                 if not _from_cursor:
                     self._start_cleanup_monitor(current_thread, c_key)
-            else:
+            elif time.time() - conn.last_ping() > \
+                    self._CONNECTION_PING_INTERVAL:
                 conn.ping()
         return conn
 
+    def _connect(self):
+        """
+        Open a new connection to the database.
+        """
+        return MySQLConnectionWrapper.connect(
+            self.ModuleProxy, self._mysql,
+            MySQLConnectionWrapper,
+            host = self._host, user = self._user,
+            passwd = self._password, db = self._db,
+            port = self._port, autoreconnect = True)
+
     def _connection(self):
         """
         Reimplemented from EntropySQLRepository.
@@ -867,6 +970,8 @@ class EntropyMySQLRepository(EntropySQLRepository):
         self._readonly = False
 
         # !!! insert schema changes here
+        if not self._doesTableExist("reversedependencies"):
+            self._createReverseDependenciesTable()
 
         self._readonly = old_readonly
         self._connection().commit()
@@ -878,6 +983,19 @@ class EntropyMySQLRepository(EntropySQLRepository):
                 EntropyMySQLRepository._SCHEMA_REVISION)
             self._connection().commit()
 
+    def _createReverseDependenciesTable(self):
+        self._cursor().execute("""
+        CREATE TABLE reversedependencies (
+            idpackage INTEGER(10) UNSIGNED NOT NULL,
+            iddependency INTEGER(10) UNSIGNED NOT NULL,
+            PRIMARY KEY(idpackage, iddependency),
+            FOREIGN KEY(idpackage)
+                REFERENCES baseinfo(idpackage) ON DELETE CASCADE
+        );
+        """)
+        self._clearLiveCache("_doesTableExist")
+        self._clearLiveCache("_doesColumnInTableExist")
+
     def integrity_check(self):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -913,10 +1031,13 @@ class EntropyMySQLRepository(EntropySQLRepository):
         except OSError:
             return 1
 
-    def exportRepository(self, dumpfile):
+    def exportRepository(self, dumpfile, dump_format = None):
         """
         Reimplemented from EntropyRepositoryBase.
+        Only the SQL dump format is supported.
         """
+        if dump_format not in (None, self.DUMP_FORMAT_SQL):
+            raise AttributeError("unsupported dump format")
         try:
             proc = subprocess.Popen(
                 ("/usr/bin/mysqldump",
@@ -963,10 +1084,9 @@ class EntropyMySQLRepository(EntropySQLRepository):
             del cached
             return obj
 
-        exists = False
         query = "SHOW TABLES LIKE '%s'" % (table,)
         cur = self._cursor().execute(query)
-        rslt = cur.fetchone() is not None
+        exists = cur.fetchone() is not None
 
         cached[table] = exists
         self._setLiveCache("_doesTableExist", cached)
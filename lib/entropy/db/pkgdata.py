@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+
+    @author: Fabio Erculiani <lxnay@sabayon.org>
+    @contact: lxnay@sabayon.org
+    @copyright: Fabio Erculiani
+    @license: GPL-2
+
+    I{LazyPackageData} is a package metadata mapping whose values are
+    retrieved from the repository on first access.
+
+"""
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+def _sources(repo, package_id, options):
+    sources = repo.retrieveSources(package_id)
+    mirrornames = set()
+    for x in sources:
+        if x.startswith("mirror://"):
+            mirrornames.add(x.split("/")[2])
+    return {
+        'sources': sources,
+        'mirrorlinks': [[x, repo.retrieveMirrorData(x)] for x in mirrornames],
+    }
+
+
+def _needed_libs(repo, package_id, options):
+    needed_libs = repo.retrieveNeededLibraries(package_id)
+    compat_needed_libs = tuple(
+        sorted((soname, elfclass) for _x, _x, soname, elfclass, _x
+                in needed_libs)
+    )
+    return {
+        'needed': compat_needed_libs,
+        'needed_libs': needed_libs,
+    }
+
+
+def _signatures(repo, package_id, options):
+    sha1, sha256, sha512, gpg = repo.retrieveSignatures(package_id)
+    return {
+        'signatures': {
+            'sha1': sha1,
+            'sha256': sha256,
+            'sha512': sha512,
+            'gpg': gpg,
+        },
+    }
+
+
+def _content(repo, package_id, options):
+    content = {}
+    if options['get_content']:
+        content = repo.retrieveContent(
+            package_id, extended = True, formatted = True,
+            insert_formatted = options['content_insert_formatted'])
+    return {'content': content}
+
+
+def _content_safety(repo, package_id, options):
+    content_safety = {}
+    if options['get_content_safety']:
+        content_safety = repo.retrieveContentSafety(package_id)
+    return {'content_safety': content_safety}
+
+
+def _changelog(repo, package_id, options):
+    changelog = None
+    if options['get_changelog']:
+        changelog = repo.retrieveChangelog(package_id)
+    return {'changelog': changelog}
+
+
+def _simple(key, method, *args, **kwargs):
+    def _resolver(repo, package_id, options):
+        return {key: getattr(repo, method)(package_id, *args, **kwargs)}
+    return _resolver
+
+
+class LazyPackageData(MutableMapping):
+    """
+    Package metadata mapping, with the same keys and values of
+    EntropyRepositoryBase.getPackageData(). Base metadata (see
+    EntropyRepositoryBase.getBaseData()) is retrieved immediately, every
+    other key is retrieved from the repository on first access, keys
+    retrieved by the same query are resolved together.
+    Values can be replaced and keys removed, like in a dict.
+    Calling dict() on a LazyPackageData object resolves all the keys.
+
+    The repository must stay open as long as unresolved keys are accessed.
+    """
+
+    BASE_KEYS = ("atom", "name", "version", "versiontag", "description",
+                 "category", "chost", "cflags", "cxxflags", "homepage",
+                 "license", "branch", "download", "digest", "slot",
+                 "etpapi", "datecreation", "size", "revision")
+
+    _RESOLVERS = (
+        (("counter",), _simple("counter", "retrieveSpmUid")),
+        (("trigger",), _simple("trigger", "retrieveTrigger")),
+        (("disksize",), _simple("disksize", "retrieveOnDiskSize")),
+        (("changelog",), _changelog),
+        (("injected",), _simple("injected", "isInjected")),
+        (("systempackage",), _simple("systempackage", "isSystemPackage")),
+        (("config_protect",), _simple("config_protect", "retrieveProtect")),
+        (("config_protect_mask",),
+         _simple("config_protect_mask", "retrieveProtectMask")),
+        (("useflags",), _simple("useflags", "retrieveUseflags")),
+        (("keywords",), _simple("keywords", "retrieveKeywords")),
+        (("sources", "mirrorlinks"), _sources),
+        (("needed", "needed_libs"), _needed_libs),
+        (("provided_libs",),
+         _simple("provided_libs", "retrieveProvidedLibraries")),
+        (("provide_extended",), _simple("provide_extended", "retrieveProvide")),
+        (("conflicts",), _simple("conflicts", "retrieveConflicts")),
+        (("licensedata",), _simple("licensedata", "retrieveLicenseData")),
+        (("content",), _content),
+        (("content_safety",), _content_safety),
+        (("pkg_dependencies",),
+         _simple("pkg_dependencies", "retrieveDependencies",
+                 extended = True, resolve_conditional_deps = False)),
+        (("signatures",), _signatures),
+        (("spm_phases",), _simple("spm_phases", "retrieveSpmPhases")),
+        (("spm_repository",),
+         _simple("spm_repository", "retrieveSpmRepository")),
+        (("desktop_mime",), _simple("desktop_mime", "retrieveDesktopMime")),
+        (("provided_mime",),
+         _simple("provided_mime", "retrieveProvidedMime")),
+        (("original_repository",),
+         _simple("original_repository", "getInstalledPackageRepository")),
+        (("extra_download",),
+         _simple("extra_download", "retrieveExtraDownload")),
+    )
+
+    _RESOLVERS_MAP = dict((key, resolver) for keys, resolver in _RESOLVERS
+                          for key in keys)
+
+    KEYS = BASE_KEYS + tuple(key for keys, _res in _RESOLVERS for key in keys)
+    _KEYS_SET = frozenset(KEYS)
+
+    # metadata commonly needed together, see prefetch()
+    PREFETCH_GROUPS = {
+        "dependencies": ("pkg_dependencies", "conflicts",
+                         "provide_extended", "useflags", "keywords"),
+        "libraries": ("needed_libs", "provided_libs"),
+        "files": ("content", "content_safety", "config_protect",
+                  "config_protect_mask"),
+        "download": ("signatures", "extra_download", "sources"),
+        "details": ("licensedata", "changelog", "spm_repository",
+                    "original_repository", "disksize"),
+    }
+
+    def __init__(self, repository, package_id, base_data,
+                 get_content = True, content_insert_formatted = False,
+                 get_changelog = True, get_content_safety = True):
+        """
+        LazyPackageData constructor.
+
+        @param repository: repository the package belongs to
+        @type repository: EntropyRepositoryBase
+        @param package_id: package indentifier
+        @type package_id: int
+        @param base_data: getBaseData() output for package_id
+        @type base_data: tuple
+        @keyword get_content: see EntropyRepositoryBase.getPackageData()
+        @type get_content: bool
+        @keyword content_insert_formatted: see
+            EntropyRepositoryBase.getPackageData()
+        @type content_insert_formatted: bool
+        @keyword get_changelog: see EntropyRepositoryBase.getPackageData()
+        @type get_changelog: bool
+        @keyword get_content_safety: see
+            EntropyRepositoryBase.getPackageData()
+        @type get_content_safety: bool
+        """
+        self._repository = repository
+        self._package_id = package_id
+        self._options = {
+            'get_content': get_content,
+            'content_insert_formatted': content_insert_formatted,
+            'get_changelog': get_changelog,
+            'get_content_safety': get_content_safety,
+        }
+        self._data = dict(zip(self.BASE_KEYS, base_data))
+        self._deleted = set()
+
+    def _lazy(self, key):
+        return key not in self._data and key not in self._deleted and \
+            key in self._RESOLVERS_MAP
+
+    def _resolve(self, key):
+        resolver = self._RESOLVERS_MAP[key]
+        values = resolver(self._repository, self._package_id, self._options)
+        for value_key, value in values.items():
+            if self._lazy(value_key):
+                self._data[value_key] = value
+
+    def prefetch(self, keys):
+        """
+        Resolve the given keys at once. Prefetch group names (see
+        PREFETCH_GROUPS) can be used in place of keys.
+
+        @param keys: list of keys or prefetch group names
+        @type keys: iterable
+        """
+        for key in keys:
+            for group_key in self.PREFETCH_GROUPS.get(key, (key,)):
+                if self._lazy(group_key):
+                    self._resolve(group_key)
+
+    def resolved(self):
+        """
+        Return the keys already retrieved from the repository or set.
+
+        @return: resolved keys
+        @rtype: frozenset
+        """
+        return frozenset(self._data)
+
+    def __getitem__(self, key):
+        if self._lazy(key):
+            self._resolve(key)
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._deleted.discard(key)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._data.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        return key in self._data or self._lazy(key)
+
+    def __iter__(self):
+        for key in self.KEYS:
+            if key in self:
+                yield key
+        for key in self._data:
+            if key not in self._KEYS_SET:
+                yield key
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __repr__(self):
+        return "<LazyPackageData package_id: %s, resolved: %s>" % (
+            self._package_id, sorted(self._data),)
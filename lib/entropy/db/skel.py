@@ -19,7 +19,6 @@ import contextlib
 import threading
 
 from entropy.i18n import _
-from entropy.exceptions import InvalidAtom
 from entropy.const import etpConst, const_cmp, const_debug_write, \
     const_convert_to_rawstring, const_mkstemp, const_is_python3
 from entropy.output import TextInterface, brown, bold, red, blue, purple, \
@@ -31,7 +30,9 @@ from entropy.exceptions import RepositoryPluginError
 from entropy.spm.plugins.factory import get_default_instance as get_spm, \
     get_default_class as get_spm_class
 from entropy.db.exceptions import OperationalError
-from entropy.db.cache import EntropyRepositoryCachePolicies
+from entropy.db.pkgdata import LazyPackageData
+from entropy.db.cache import EntropyRepositoryCachePolicies, \
+    EntropyRepositoryMatchCache
 
 import entropy.dep
 import entropy.tools
@@ -370,6 +371,11 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
     # You can extend this with custom settings for your Repository
     SETTING_KEYS = ("arch", "schema_revision")
 
+    # exportRepository() dump formats, textual SQL statements or
+    # binary table stream (see entropy.db.binarydump)
+    DUMP_FORMAT_SQL = "sql"
+    DUMP_FORMAT_BINARY = "binary"
+
     class ModuleProxy(object):
 
         @staticmethod
@@ -425,7 +431,6 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         self.reponame = name
         self._settings = SystemSettings()
         self._cacher = EntropyCacher()
-        self.__db_match_cache_key = "match/db"
 
         EntropyRepositoryPluginStore.__init__(self)
 
@@ -733,6 +738,17 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def _match_cacher(self):
+        """
+        Return the on-disk atomMatch() results store bound to this
+        repository.
+
+        @return: the atomMatch() results store
+        @rtype: EntropyRepositoryMatchCache
+        """
+        return EntropyRepositoryMatchCache.get(
+            self.name, cache_dir = self._cacher.current_directory())
+
     def caching(self):
         """
         Return whether caching is enabled in this repository.
@@ -790,6 +806,8 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         if not self._readonly:
             self.commit()
+        if self._caching:
+            self._match_cacher().flush()
 
         plugins = self.get_plugins()
         for plugin_id in sorted(plugins):
@@ -1700,6 +1718,28 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def getStrictDataMany(self, package_ids):
+        """
+        Get a restricted (optimized) set of package metadata for the
+        provided package identifiers. This is the vectorized version of
+        getStrictData(), subclasses should reimplement it using as few
+        queries as possible.
+
+        @param package_ids: list of package indentifiers
+        @type package_ids: iterable
+        @return: dict composed by package identifier as key and
+            tuple of length 6 composed by
+            (package key, slot, version, tag, revision, atom) as value.
+            Invalid package identifiers are not returned.
+        @rtype: dict
+        """
+        data = {}
+        for package_id in package_ids:
+            strict_data = self.getStrictData(package_id)
+            if strict_data is not None:
+                data[package_id] = strict_data
+        return data
+
     def getStrictScopeData(self, package_id):
         """
         Get a restricted (optimized) set of package metadata for provided
@@ -1878,106 +1918,52 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
 
         @rtype: dict
         """
-        data = {}
-        try:
-            atom, name, version, versiontag, \
-            description, category, chost, \
-            cflags, cxxflags, homepage, \
-            mylicense, branch, download, \
-            digest, slot, etpapi, \
-            datecreation, size, revision  = self.getBaseData(package_id)
-        except TypeError:
+        data = self.getLazyPackageData(
+            package_id, get_content = get_content,
+            content_insert_formatted = content_insert_formatted,
+            get_changelog = get_changelog,
+            get_content_safety = get_content_safety)
+        if data is None:
             return None
+        return dict(data)
 
-        content = {}
-        if get_content:
-            content = self.retrieveContent(
-                package_id, extended = True,
-                formatted = True, insert_formatted = content_insert_formatted
-            )
-
-        sources = self.retrieveSources(package_id)
-        mirrornames = set()
-        for x in sources:
-            if x.startswith("mirror://"):
-                mirrornames.add(x.split("/")[2])
-
-        sha1, sha256, sha512, gpg = self.retrieveSignatures(package_id)
-        signatures = {
-            'sha1': sha1,
-            'sha256': sha256,
-            'sha512': sha512,
-            'gpg': gpg,
-        }
-
-        changelog = None
-        if get_changelog:
-            changelog = self.retrieveChangelog(package_id)
-        content_safety = {}
-        if get_content_safety:
-            content_safety = self.retrieveContentSafety(package_id)
-
-        deps = self.retrieveDependencies(
-            package_id, extended = True,
-            resolve_conditional_deps = False)
-
-        needed_libs = self.retrieveNeededLibraries(package_id)
-        compat_needed_libs = tuple(
-            sorted((soname, elfclass) for _x, _x, soname, elfclass, _x
-                    in needed_libs)
-        )
+    def getLazyPackageData(self, package_id, get_content = True,
+            content_insert_formatted = False, get_changelog = True,
+            get_content_safety = True, prefetch = None):
+        """
+        Same as getPackageData(), but return a LazyPackageData mapping,
+        whose metadata is retrieved from the repository on first access.
+        Callers reading just a few metadata keys do not pay for the others.
+        The repository must not be closed while the mapping is in use.
 
-        data = {
-            'atom': atom,
-            'name': name,
-            'version': version,
-            'versiontag': versiontag,
-            'description': description,
-            'category': category,
-            'chost': chost,
-            'cflags': cflags,
-            'cxxflags': cxxflags,
-            'homepage': homepage,
-            'license': mylicense,
-            'branch': branch,
-            'download': download,
-            'digest': digest,
-            'slot': slot,
-            'etpapi': etpapi,
-            'datecreation': datecreation,
-            'size': size,
-            'revision': revision,
-            # risky to add to the sql above, still
-            'counter': self.retrieveSpmUid(package_id),
-            'trigger': self.retrieveTrigger(package_id),
-            'disksize': self.retrieveOnDiskSize(package_id),
-            'changelog': changelog,
-            'injected': self.isInjected(package_id),
-            'systempackage': self.isSystemPackage(package_id),
-            'config_protect': self.retrieveProtect(package_id),
-            'config_protect_mask': self.retrieveProtectMask(package_id),
-            'useflags': self.retrieveUseflags(package_id),
-            'keywords': self.retrieveKeywords(package_id),
-            'sources': sources,
-            'needed': compat_needed_libs,
-            'needed_libs': needed_libs,
-            'provided_libs': self.retrieveProvidedLibraries(package_id),
-            'provide_extended': self.retrieveProvide(package_id),
-            'conflicts': self.retrieveConflicts(package_id),
-            'licensedata': self.retrieveLicenseData(package_id),
-            'content': content,
-            'content_safety': content_safety,
-            'pkg_dependencies': deps,
-            'mirrorlinks': [[x, self.retrieveMirrorData(x)] for x in mirrornames],
-            'signatures': signatures,
-            'spm_phases': self.retrieveSpmPhases(package_id),
-            'spm_repository': self.retrieveSpmRepository(package_id),
-            'desktop_mime': self.retrieveDesktopMime(package_id),
-            'provided_mime': self.retrieveProvidedMime(package_id),
-            'original_repository': self.getInstalledPackageRepository(package_id),
-            'extra_download': self.retrieveExtraDownload(package_id),
-        }
+        @param package_id: package indentifier
+        @type package_id: int
+        @keyword get_content: see getPackageData()
+        @type get_content: bool
+        @keyword content_insert_formatted: see getPackageData()
+        @type content_insert_formatted: bool
+        @keyword get_changelog: see getPackageData()
+        @type get_changelog: bool
+        @keyword get_content_safety: see getPackageData()
+        @type get_content_safety: bool
+        @keyword prefetch: metadata keys or prefetch group names
+            (see LazyPackageData.PREFETCH_GROUPS) to retrieve immediately
+        @type prefetch: iterable
+        @return: package metadata mapping or None, if package_id is
+            not available
+        @rtype: LazyPackageData
+        """
+        base_data = self.getBaseData(package_id)
+        if base_data is None:
+            return None
 
+        data = LazyPackageData(
+            self, package_id, base_data, get_content = get_content,
+            content_insert_formatted = content_insert_formatted,
+            get_changelog = get_changelog,
+            get_content_safety = get_content_safety)
+        if prefetch:
+            data.prefetch(prefetch)
         return data
 
     def getPackageXmlData(self, package_ids, get_content=True,
@@ -2972,6 +2958,25 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def retrieveAtomMany(self, package_ids):
+        """
+        Return "atom" metadatum for the given package identifiers.
+        This is the vectorized version of retrieveAtom(), subclasses
+        should reimplement it using as few queries as possible.
+
+        @param package_ids: list of package indentifiers
+        @type package_ids: iterable
+        @return: dict composed by package identifier as key and atom string
+            as value. Invalid package identifiers are not returned.
+        @rtype: dict
+        """
+        data = {}
+        for package_id in package_ids:
+            atom = self.retrieveAtom(package_id)
+            if atom is not None:
+                data[package_id] = atom
+        return data
+
     def retrieveBranch(self, package_id):
         """
         Return "branch" metadatum for given package identifier.
@@ -3150,6 +3155,26 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def retrieveKeySlotMany(self, package_ids):
+        """
+        Return package key and slot for the given package identifiers.
+        This is the vectorized version of retrieveKeySlot(), subclasses
+        should reimplement it using as few queries as possible.
+
+        @param package_ids: list of package indentifiers
+        @type package_ids: iterable
+        @return: dict composed by package identifier as key and
+            (package_key, package_slot,) tuple as value. Invalid package
+            identifiers are not returned.
+        @rtype: dict
+        """
+        data = {}
+        for package_id in package_ids:
+            key_slot = self.retrieveKeySlot(package_id)
+            if key_slot is not None:
+                data[package_id] = key_slot
+        return data
+
     def retrieveKeySlotAggregated(self, package_id):
         """
         Return package key and package slot string (aggregated form through
@@ -3230,6 +3255,26 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def retrieveUseflagsMany(self, package_ids):
+        """
+        Return "USE flags" metadatum for the given package identifiers.
+        This is the vectorized version of retrieveUseflags(), subclasses
+        should reimplement it using as few queries as possible.
+
+        @param package_ids: list of package indentifiers
+        @type package_ids: iterable
+        @return: dict composed by package identifier as key and list
+            (frozenset) of USE flags as value. Package identifiers without
+            USE flags are not returned.
+        @rtype: dict
+        """
+        data = {}
+        for package_id in package_ids:
+            useflags = self.retrieveUseflags(package_id)
+            if useflags:
+                data[package_id] = useflags
+        return data
+
     def retrieveSpmPhases(self, package_id):
         """
         Return "Source Package Manager install phases" for given package
@@ -3330,6 +3375,26 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def retrieveConflictsMany(self, package_ids):
+        """
+        Return list of conflicting dependencies for the given package
+        identifiers. This is the vectorized version of retrieveConflicts(),
+        subclasses should reimplement it using as few queries as possible.
+
+        @param package_ids: list of package indentifiers
+        @type package_ids: iterable
+        @return: dict composed by package identifier as key and list
+            (frozenset) of conflicting package dependencies as value.
+            Package identifiers without conflicts are not returned.
+        @rtype: dict
+        """
+        data = {}
+        for package_id in package_ids:
+            conflicts = self.retrieveConflicts(package_id)
+            if conflicts:
+                data[package_id] = conflicts
+        return data
+
     def retrieveProvide(self, package_id):
         """
         Return list of dependencies/atoms are provided by the given package
@@ -3475,6 +3540,30 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def retrieveDependenciesMany(self, package_ids):
+        """
+        Return the dependencies of the given package identifiers, in
+        extended format and without resolving conditional dependencies.
+        This is the vectorized version of retrieveDependencies(),
+        subclasses should reimplement it using as few queries as possible.
+
+        @param package_ids: list of package indentifiers
+        @type package_ids: iterable
+        @return: dict composed by package identifier as key and tuple of
+            tuples of length 2 composed by dependency string and dependency
+            type as value. Package identifiers without dependencies are
+            not returned.
+        @rtype: dict
+        """
+        data = {}
+        for package_id in package_ids:
+            deps = self.retrieveDependencies(
+                package_id, extended = True,
+                resolve_conditional_deps = False)
+            if deps:
+                data[package_id] = tuple(deps)
+        return data
+
     def retrieveKeywords(self, package_id):
         """
         Return package SPM keyword list for given package identifier.
@@ -3486,6 +3575,26 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def retrieveKeywordsMany(self, package_ids):
+        """
+        Return package SPM keyword lists for the given package identifiers.
+        This is the vectorized version of retrieveKeywords(), subclasses
+        should reimplement it using as few queries as possible.
+
+        @param package_ids: list of package indentifiers
+        @type package_ids: iterable
+        @return: dict composed by package identifier as key and list
+            (frozenset) of keywords as value. Package identifiers without
+            keywords are not returned.
+        @rtype: dict
+        """
+        data = {}
+        for package_id in package_ids:
+            keywords = self.retrieveKeywords(package_id)
+            if keywords:
+                data[package_id] = keywords
+        return data
+
     def retrieveProtect(self, package_id):
         """
         Return CONFIG_PROTECT (configuration file protection) string
@@ -3758,6 +3867,26 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def retrieveLicenseMany(self, package_ids):
+        """
+        Return "license" metadatum for the given package identifiers.
+        This is the vectorized version of retrieveLicense(), subclasses
+        should reimplement it using as few queries as possible.
+
+        @param package_ids: list of package indentifiers
+        @type package_ids: iterable
+        @return: dict composed by package identifier as key and license
+            string as value. Package identifiers not available are not
+            returned.
+        @rtype: dict
+        """
+        data = {}
+        for package_id in package_ids:
+            license = self.retrieveLicense(package_id)
+            if license is not None:
+                data[package_id] = license
+        return data
+
     def retrieveCompileFlags(self, package_id):
         """
         Return Compiler flags during building of package.
@@ -3973,19 +4102,35 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
-    def searchBelongs(self, bfile, like = False):
+    def searchBelongs(self, bfile, like = False, glob = False):
         """
         Search packages which given file path belongs to.
 
         @param bfile: file path to search
         @type bfile: string
-        @keyword like: do not match exact case
+        @keyword like: do not match exact case, bfile is a SQL LIKE pattern
         @type like: bool
+        @keyword glob: bfile is a shell-like (SQL GLOB) pattern, supporting
+            "*", "?" and "[...]"
+        @type glob: bool
         @return: list (frozenset) of package identifiers owning given file
         @rtype: frozenset
         """
         raise NotImplementedError()
 
+    def searchBelongsDirectory(self, directory, recursive = False):
+        """
+        Search packages owning files inside the given directory.
+
+        @param directory: directory path
+        @type directory: string
+        @keyword recursive: also consider files in subdirectories
+        @type recursive: bool
+        @return: list (frozenset) of package identifiers
+        @rtype: frozenset
+        """
+        raise NotImplementedError()
+
     def searchContentSafety(self, sfile):
         """
         Search content safety metadata (usually, sha256 and mtime) related to
@@ -4275,6 +4420,57 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
+    def searchNameMany(self, names):
+        """
+        Vectorized version of searchName(sensitive = True, just_id = True),
+        subclasses should reimplement it, looking up all the names at once.
+
+        @param names: list of package names to search
+        @type names: iterable
+        @return: dict, package name -> frozenset of package identifiers.
+            Names without any package are not returned.
+        @rtype: dict
+        """
+        data = {}
+        for name in names:
+            package_ids = self.searchName(name, sensitive = True,
+                just_id = True)
+            if package_ids:
+                data[name] = frozenset(package_ids)
+        return data
+
+    def searchKeySlotCandidates(self, repositories):
+        """
+        For each package in this repository, search the packages having
+        the same key (category and name) and slot in the given
+        repositories. Subclasses should reimplement it using as few
+        queries as possible.
+
+        @param repositories: dict composed by repository identifier as key
+            and EntropyRepositoryBase instance as value
+        @type repositories: dict
+        @return: dict composed by package identifier as key and list of
+            tuples of length 5 composed by (repository identifier,
+            package identifier, version, tag, revision) as value.
+            Packages without any candidate are not returned.
+        @rtype: dict
+        """
+        index = {}
+        for repository_id, repo in repositories.items():
+            data = repo.getStrictDataMany(repo.listAllPackageIds())
+            for package_id, strict_data in data.items():
+                key, slot, version, tag, revision, _atom = strict_data
+                index.setdefault((key, slot), []).append(
+                    (repository_id, package_id, version, tag, revision))
+
+        candidates = {}
+        data = self.getStrictDataMany(self.listAllPackageIds())
+        for package_id, strict_data in data.items():
+            key_slot_candidates = index.get(strict_data[:2])
+            if key_slot_candidates:
+                candidates[package_id] = list(key_slot_candidates)
+        return candidates
+
     def searchCategory(self, keyword, like = False, just_id = False):
         """
         Search packages by category name.
@@ -4687,12 +4883,17 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         raise NotImplementedError()
 
-    def exportRepository(self, dumpfile):
+    def exportRepository(self, dumpfile, dump_format = None):
         """
         Export running database to file.
 
         @param dumpfile: dump file object to write to
         @type dumpfile: file object (hint: open())
+        @keyword dump_format: dump format, either DUMP_FORMAT_SQL (the
+            default, if None) or DUMP_FORMAT_BINARY, not all the
+            implementations support the latter
+        @type dump_format: string
+        @raise AttributeError: if the dump format is not supported
         """
         raise NotImplementedError()
 
@@ -4701,8 +4902,14 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         Get Repository metadata checksum, useful for integrity verification.
         Note: result is cached in EntropyRepository.live_cache (dict).
+        Subclasses may return, if do_order is False, a checksum that is
+        incrementally maintained on every repository change: this is only
+        guaranteed to change whenever the repository changes, while
+        content based comparisons between different repositories require
+        do_order = True.
 
         @keyword do_order: order metadata collection alphabetically
+            and always compute the checksum from the repository content
         @type do_order: bool
         @keyword strict: improve checksum accuracy
         @type strict: bool
@@ -4989,6 +5196,21 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         """
         return package_id, 0
 
+    def maskFilterMany(self, package_ids, live = True):
+        """
+        Vectorized version of maskFilter(), subclasses implementing
+        package masking should reimplement it, evaluating masking rules
+        for all the packages at once.
+
+        @param package_ids: list of package indentifiers
+        @type package_ids: iterable
+        @keyword live: use live masking feature
+        @type live: bool
+        @return: list of maskFilter() results, in package_ids order
+        @rtype: list
+        """
+        return [self.maskFilter(x, live = live) for x in package_ids]
+
     def atomMatchCacheKey(self):
         """
         Return a string that shall be used as part of the atomMatch cache key
@@ -5046,72 +5268,29 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
                 if rc == 0:
                     return data, rc
 
-        matchTag = entropy.dep.dep_gettag(atom)
-        try:
-            matchUse = entropy.dep.dep_getusedeps(atom)
-        except InvalidAtom:
-            matchUse = ()
-        atomSlot = entropy.dep.dep_getslot(atom)
-        matchRevision = entropy.dep.dep_get_entropy_revision(atom)
+        parsed_atom = entropy.dep.Atom.parse(atom)
+        matchTag = parsed_atom.tag
+        matchUse = parsed_atom.use
+        matchRevision = parsed_atom.revision
         if isinstance(matchRevision, int):
             if matchRevision < 0:
                 matchRevision = None
 
-        # use match
-        scan_atom = entropy.dep.remove_usedeps(atom)
-        # tag match
-        scan_atom = entropy.dep.remove_tag(scan_atom)
-
         # slot match
-        scan_atom = entropy.dep.remove_slot(scan_atom)
-        if (matchSlot is None) and (atomSlot is not None):
-            matchSlot = atomSlot
-
-        # revision match
-        scan_atom = entropy.dep.remove_entropy_revision(scan_atom)
-
-        direction = ''
-        justname = True
-        pkgkey = ''
-        pkgname = ''
-        pkgcat = ''
-        pkgversion = ''
-        stripped_atom = ''
+        if (matchSlot is None) and (parsed_atom.slot is not None):
+            matchSlot = parsed_atom.slot
+
+        direction = parsed_atom.operator
+        justname = parsed_atom.justname
+        pkgkey = parsed_atom.key
+        pkgname = parsed_atom.name
+        pkgcat = parsed_atom.category
+        pkgversion = parsed_atom.version
+        stripped_atom = parsed_atom.cpv
         found_ids = []
         default_package_ids = None
 
-        if scan_atom:
-
-            while True:
-                # check for direction
-                scan_cpv = entropy.dep.dep_getcpv(scan_atom)
-                stripped_atom = scan_cpv
-                if scan_atom.endswith("*"):
-                    stripped_atom += "*"
-                direction = scan_atom[0:-len(stripped_atom)]
-
-                justname = entropy.dep.isjustname(scan_cpv)
-                pkgkey = stripped_atom
-                if justname == 0:
-                    # get version
-                    data = entropy.dep.catpkgsplit(scan_cpv)
-                    if data is None:
-                        break # badly formatted
-                    wildcard = ""
-                    if scan_atom.endswith("*"):
-                        wildcard = "*"
-                    pkgversion = data[2]+wildcard+"-"+data[3]
-                    pkgkey = entropy.dep.dep_getkey(stripped_atom)
-
-                splitkey = pkgkey.split("/")
-                if (len(splitkey) == 2):
-                    pkgcat, pkgname = splitkey
-                else:
-                    pkgcat, pkgname = "null", splitkey[0]
-
-                break
-
-
+        if parsed_atom.matchable:
             # IDs found in the database that match our search
             try:
                 found_ids, default_package_ids = self.__generate_found_ids_match(
@@ -5222,7 +5401,10 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         pkgdata = {}
         versions = set()
 
-        for x in dbpkginfo:
+        # packages sharing version, tag and revision (different slots)
+        # are resolved in favour of the most recently added one,
+        # regardless of the set iteration order.
+        for x in sorted(dbpkginfo):
             info_tuple = (x[1], self.retrieveTag(x[0]), \
                 self.retrieveRevision(x[0]))
             versions.add(info_tuple)
@@ -5249,7 +5431,7 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
 
         if versions:
             # it looks like we wiped out all the
-            newer = entropy.dep.get_entropy_newer_version(list(versions))[0]
+            newer = max(versions, key = entropy.dep.entropy_version_key)
             x = pkgdata[newer]
             rc = 0
         else:
@@ -5276,6 +5458,110 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
             )
             return x, rc
 
+    def atomMatchMany(self, atoms, matchSlot = None, multiMatch = False,
+        maskFilter = True, extendedResults = False, useCache = True):
+        """
+        Vectorized version of atomMatch(). The candidate packages of all
+        the given atoms are looked up at once by name (see searchNameMany())
+        and loaded into an in-memory EntropyRepositorySnapshot, slot, tag,
+        USE and version filtering is then done by atomMatch() against it.
+        Results are identical to the ones returned by atomMatch().
+        Old-style virtual packages are matched against this repository.
+
+        @param atoms: list of atoms or dependencies to match in repository
+        @type atoms: iterable
+        @keyword matchSlot: match packages with given slot
+        @type matchSlot: string
+        @keyword multiMatch: match all the available packages, not just the
+            best one
+        @type multiMatch: bool
+        @keyword maskFilter: enable package masking filter
+        @type maskFilter: bool
+        @keyword extendedResults: return extended results
+        @type extendedResults: bool
+        @keyword useCache: use on-disk cache
+        @type useCache: bool
+        @return: dict, atom -> atomMatch() result
+        @rtype: dict
+        """
+        from entropy.db.snapshot import EntropyRepositorySnapshot
+
+        results = {}
+        pending = []
+        fallback = set()
+        names = set()
+
+        for atom in atoms:
+            if atom in results:
+                continue
+            if not atom:
+                results[atom] = self.atomMatch(atom)
+                continue
+
+            if useCache:
+                cached = self.__atomMatchFetchCache(atom, matchSlot,
+                    multiMatch, maskFilter, extendedResults)
+                if cached is not None:
+                    results[atom] = cached
+                    continue
+
+            sub_atoms = [atom]
+            # "or" dependency support, see atomMatch()
+            if atom.endswith(etpConst['entropyordepquestion']):
+                sub_atoms.extend(
+                    atom[:-1].split(etpConst['entropyordepsep']))
+
+            for sub_atom in sub_atoms:
+                parsed_atom = entropy.dep.Atom.parse(sub_atom)
+                if parsed_atom.category == \
+                        self.VIRTUAL_META_PACKAGE_CATEGORY:
+                    # old-style virtuals are looked up through
+                    # searchProvidedVirtualPackage()
+                    fallback.add(atom)
+                elif parsed_atom.matchable:
+                    names.add(parsed_atom.name)
+
+            results[atom] = None
+            pending.append(atom)
+
+        if not pending:
+            return results
+
+        kwargs = {
+            'matchSlot': matchSlot,
+            'multiMatch': multiMatch,
+            'maskFilter': maskFilter,
+            'extendedResults': extendedResults,
+        }
+
+        snapshot = None
+        try:
+            package_ids = set()
+            for ids in self.searchNameMany(names).values():
+                package_ids.update(ids)
+            snapshot = EntropyRepositorySnapshot(
+                self, package_ids = package_ids)
+        except OperationalError:
+            # let atomMatch() deal with it
+            pass
+
+        for atom in pending:
+            if snapshot is None or atom in fallback:
+                results[atom] = self.atomMatch(
+                    atom, useCache = useCache, **kwargs)
+                continue
+
+            result = snapshot.atomMatch(atom, useCache = False, **kwargs)
+            if useCache:
+                self.__atomMatchStoreCache(
+                    atom, matchSlot,
+                    multiMatch, maskFilter,
+                    extendedResults, result = result
+                )
+            results[atom] = result
+
+        return results
+
     def __generate_found_ids_match(self, pkgkey, pkgname, pkgcat, multiMatch):
 
         if pkgcat == "null":
@@ -5509,20 +5795,17 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
 
         return dbpkginfo
 
+    def __atomMatchValidationKey(self):
+        return "%s_%s" % (
+            self.atomMatchCacheKey(),
+            self.checksum(strict = False),
+            )
+
     def __atomMatchFetchCache(self, *args):
         if self._caching:
-            ck_sum = self.checksum(strict = False)
             hash_str = self.__atomMatch_gen_hash_str(args)
-            cached = entropy.dump.loadobj(
-                "%s/%s/%s_%s_%s" % (
-                    self.__db_match_cache_key,
-                    self.name,
-                    self.atomMatchCacheKey(),
-                    ck_sum,
-                    hash_str,
-                    )
-                )
-            return cached
+            return self._match_cacher().fetch(
+                self.__atomMatchValidationKey(), hash_str)
 
     def __atomMatch_gen_hash_str(self, args):
         data_str = repr(args)
@@ -5534,19 +5817,11 @@ class EntropyRepositoryBase(TextInterface, EntropyRepositoryPluginStore):
         return sha1.hexdigest()
 
     def __atomMatchStoreCache(self, *args, **kwargs):
-        if self._caching:
-            ck_sum = self.checksum(strict = False)
+        if self._caching and self._cacher.is_started():
             hash_str = self.__atomMatch_gen_hash_str(args)
-            self._cacher.push(
-                "%s/%s/%s_%s_%s" % (
-                    self.__db_match_cache_key,
-                    self.name,
-                    self.atomMatchCacheKey(),
-                    ck_sum,
-                    hash_str,
-                    ),
-                kwargs.get('result'),
-                async = False)
+            self._match_cacher().store(
+                self.__atomMatchValidationKey(), hash_str,
+                kwargs.get('result'))
 
     def __filterSlot(self, package_id, slot):
         if slot is None:
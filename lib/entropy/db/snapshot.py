@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+"""
+
+    @author: Fabio Erculiani <lxnay@sabayon.org>
+    @contact: lxnay@sabayon.org
+    @copyright: Fabio Erculiani
+    @license: GPL-2
+
+    I{EntropyRepositorySnapshot} is a frozen, in-memory, copy of the
+    metadata of an EntropyRepositoryBase instance, used by the
+    dependency solver.
+
+"""
+import array
+import inspect
+
+from entropy.const import etpConst
+from entropy.db.skel import EntropyRepositoryBase
+
+import entropy.dep
+
+class EntropyRepositorySnapshot(EntropyRepositoryBase):
+    """
+    Read-only, in-memory, snapshot of the package metadata used by
+    atomMatch() and by the dependency solver (key, slot, version, tag,
+    revision, atom, USE flags, dependencies and conflicts).
+    Data is loaded once, using the bulk retrieval methods of the
+    snapshotted repository and stored in compact column tables, strings
+    are interned. Package masking, package digests and old-style virtual
+    lookups are read from the snapshotted repository on first use and
+    memoized.
+    Every other method is delegated to the snapshotted repository.
+
+    The snapshot is not updated when the snapshotted repository changes,
+    it is meant to be short lived (for instance, a single solver run).
+    It can also be restricted to a subset of the packages, in this case
+    the reimplemented methods only see the given packages.
+    """
+
+    # EntropyRepositoryBase methods that are not delegated to the
+    # snapshotted repository, beside the ones reimplemented here.
+    _LOCAL_METHODS = frozenset(["atomMatch"])
+
+    _EMPTY_SET = frozenset()
+
+    def __init__(self, repository, package_ids = None):
+        """
+        EntropyRepositorySnapshot constructor.
+
+        @param repository: the repository to snapshot
+        @type repository: EntropyRepositoryBase
+        @keyword package_ids: restrict the snapshot to the given package
+            identifiers, if None, all the packages are loaded
+        @type package_ids: iterable
+        """
+        EntropyRepositoryBase.__init__(
+            self, True, False, False, repository.name, direct = True)
+        self._repository = repository
+        self._package_ids = package_ids
+        self._mask_cache = {}
+        self._lookup_cache = {}
+        self._load()
+
+    def _load(self):
+        """
+        Load the repository metadata.
+        """
+        repo = self._repository
+        package_ids = self._package_ids
+        if package_ids is None:
+            package_ids = repo.listAllPackageIds()
+        package_ids = sorted(package_ids)
+        strict_data = repo.getStrictDataMany(package_ids)
+        useflags = repo.retrieveUseflagsMany(package_ids)
+        dependencies = repo.retrieveDependenciesMany(package_ids)
+        conflicts = repo.retrieveConflictsMany(package_ids)
+
+        self._rows = {}
+        self._keys = []
+        self._slots = []
+        self._versions = []
+        self._tags = []
+        self._revisions = array.array("l")
+        self._atoms = []
+        self._useflags = []
+        self._dependencies = []
+        self._conflicts = []
+        self._key_index = {}
+        self._name_index = {}
+        self._lower_name_index = None
+
+        # intern() does not accept unicode strings on Python 2.x
+        interned = {}
+
+        def _intern(obj):
+            return interned.setdefault(obj, obj)
+
+        def _intern_set(items):
+            if not items:
+                return self._EMPTY_SET
+            return _intern(frozenset(_intern(x) for x in items))
+
+        for package_id in package_ids:
+            data = strict_data.get(package_id)
+            if data is None:
+                continue
+            key, slot, version, tag, revision, atom = data
+
+            self._rows[package_id] = len(self._keys)
+            key = _intern(key)
+            self._keys.append(key)
+            self._slots.append(_intern(slot))
+            self._versions.append(_intern(version))
+            self._tags.append(_intern(tag))
+            self._revisions.append(revision)
+            self._atoms.append(atom)
+            self._useflags.append(_intern_set(useflags.get(package_id)))
+            self._dependencies.append(tuple(
+                (_intern(dep), dep_type) for dep, dep_type in
+                dependencies.get(package_id, ())))
+            self._conflicts.append(_intern_set(conflicts.get(package_id)))
+
+            self._key_index.setdefault(key, []).append(package_id)
+            name = key.split("/", 1)[-1]
+            self._name_index.setdefault(name, []).append(package_id)
+
+        for index in (self._key_index, self._name_index):
+            for key, ids in index.items():
+                index[key] = tuple(ids)
+
+    def repository(self):
+        """
+        Return the snapshotted repository.
+
+        @return: the snapshotted repository
+        @rtype: EntropyRepositoryBase
+        """
+        return self._repository
+
+    def rebind(self, repository):
+        """
+        Make the snapshot delegate to another instance of the same
+        repository, keeping the in-memory data. Used by forked processes
+        that must not share the repository instances of their parent.
+
+        @param repository: the repository to delegate to
+        @type repository: EntropyRepositoryBase
+        """
+        self._repository = repository
+
+    def listAllPackageIds(self, order_by = None):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        if order_by is not None:
+            return self._repository.listAllPackageIds(order_by = order_by)
+        return frozenset(self._rows)
+
+    def isPackageIdAvailable(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return package_id in self._rows
+
+    def getVersioningData(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        row = self._rows.get(package_id)
+        if row is None:
+            return None
+        return self._versions[row], self._tags[row], self._revisions[row]
+
+    def getStrictData(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        row = self._rows.get(package_id)
+        if row is None:
+            return None
+        return (self._keys[row], self._slots[row], self._versions[row],
+                self._tags[row], self._revisions[row], self._atoms[row])
+
+    def getStrictDataMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        data = {}
+        for package_id in package_ids:
+            strict_data = self.getStrictData(package_id)
+            if strict_data is not None:
+                data[package_id] = strict_data
+        return data
+
+    def _column(self, column, package_id):
+        """
+        Return the value of a column for the given package identifier.
+        """
+        row = self._rows.get(package_id)
+        if row is None:
+            return None
+        return column[row]
+
+    def retrieveAtom(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return self._column(self._atoms, package_id)
+
+    def retrieveAtomMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._rows
+        atoms = self._atoms
+        return dict((x, atoms[rows[x]]) for x in package_ids if x in rows)
+
+    def retrieveVersion(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return self._column(self._versions, package_id)
+
+    def retrieveTag(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return self._column(self._tags, package_id)
+
+    def retrieveRevision(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return self._column(self._revisions, package_id)
+
+    def retrieveSlot(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return self._column(self._slots, package_id)
+
+    def retrieveKeySplit(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        key = self._column(self._keys, package_id)
+        if key is None:
+            return None
+        return tuple(key.split("/", 1))
+
+    def retrieveCategory(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        key_split = self.retrieveKeySplit(package_id)
+        if key_split is None:
+            return None
+        return key_split[0]
+
+    def retrieveName(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        key_split = self.retrieveKeySplit(package_id)
+        if key_split is None:
+            return None
+        return key_split[1]
+
+    def retrieveKeySlot(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        row = self._rows.get(package_id)
+        if row is None:
+            return None
+        return self._keys[row], self._slots[row]
+
+    def retrieveKeySlotMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._rows
+        keys = self._keys
+        slots = self._slots
+        return dict((x, (keys[rows[x]], slots[rows[x]])) for x in
+                    package_ids if x in rows)
+
+    def retrieveKeySlotAggregated(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        row = self._rows.get(package_id)
+        if row is None:
+            return None
+        return self._keys[row] + etpConst['entropyslotprefix'] + \
+            self._slots[row]
+
+    def retrieveUseflags(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        useflags = self._column(self._useflags, package_id)
+        if useflags is None:
+            return self._EMPTY_SET
+        return useflags
+
+    def retrieveUseflagsMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._rows
+        useflags = self._useflags
+        return dict((x, useflags[rows[x]]) for x in package_ids
+                    if x in rows and useflags[rows[x]])
+
+    def retrieveConflicts(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        conflicts = self._column(self._conflicts, package_id)
+        if conflicts is None:
+            return self._EMPTY_SET
+        return conflicts
+
+    def retrieveConflictsMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._rows
+        conflicts = self._conflicts
+        return dict((x, conflicts[rows[x]]) for x in package_ids
+                    if x in rows and conflicts[rows[x]])
+
+    def retrieveDependenciesMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._rows
+        dependencies = self._dependencies
+        return dict((x, dependencies[rows[x]]) for x in package_ids
+                    if x in rows and dependencies[rows[x]])
+
+    def retrieveDependencies(self, package_id, extended = False,
+        deptype = None, exclude_deptypes = None,
+        resolve_conditional_deps = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        data = self._column(self._dependencies, package_id)
+        if data is None:
+            data = ()
+
+        if deptype is not None:
+            data = [x for x in data if x[1] == deptype]
+        elif exclude_deptypes is not None:
+            excl_set = frozenset(exclude_deptypes)
+            data = [x for x in data if x[1] not in excl_set]
+
+        iter_obj = tuple
+        if not extended:
+            iter_obj = frozenset
+            data = [x for x, _x in data]
+
+        if resolve_conditional_deps:
+            return iter_obj(entropy.dep.expand_dependencies(
+                    data, [self]))
+        return iter_obj(data)
+
+    def retrieveBuildDependencies(self, package_id, extended = False,
+        resolve_conditional_deps = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return self.retrieveDependencies(package_id, extended = extended,
+            deptype = etpConst['dependency_type_ids']['bdepend_id'],
+            resolve_conditional_deps = resolve_conditional_deps)
+
+    def retrieveRuntimeDependencies(self, package_id, extended = False,
+        resolve_conditional_deps = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return self.retrieveDependencies(package_id, extended = extended,
+            deptype = etpConst['dependency_type_ids']['rdepend_id'],
+            resolve_conditional_deps = resolve_conditional_deps)
+
+    def retrievePostDependencies(self, package_id, extended = False,
+        resolve_conditional_deps = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return self.retrieveDependencies(package_id, extended = extended,
+            deptype = etpConst['dependency_type_ids']['pdepend_id'],
+            resolve_conditional_deps = resolve_conditional_deps)
+
+    def retrieveManualDependencies(self, package_id, extended = False,
+        resolve_conditional_deps = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        return self.retrieveDependencies(package_id, extended = extended,
+            deptype = etpConst['dependency_type_ids']['mdepend_id'],
+            resolve_conditional_deps = resolve_conditional_deps)
+
+    def retrieveDependenciesList(self, package_id, exclude_deptypes = None,
+        resolve_conditional_deps = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        deps = list(self.retrieveDependencies(
+                package_id, exclude_deptypes = exclude_deptypes,
+                resolve_conditional_deps = False))
+        deps.extend("!" + x for x in self.retrieveConflicts(package_id))
+        if resolve_conditional_deps:
+            return frozenset(entropy.dep.expand_dependencies(deps, [self]))
+        return frozenset(deps)
+
+    def searchName(self, keyword, sensitive = False, just_id = False):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        if sensitive:
+            package_ids = self._name_index.get(keyword, ())
+        else:
+            if self._lower_name_index is None:
+                lower_index = {}
+                for name, ids in self._name_index.items():
+                    lower_index.setdefault(name.lower(), []).extend(ids)
+                self._lower_name_index = lower_index
+            package_ids = tuple(self._lower_name_index.get(
+                    keyword.lower(), ()))
+
+        if just_id:
+            return package_ids
+        return frozenset((self.retrieveAtom(x), x) for x in package_ids)
+
+    def searchNameMany(self, names):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        data = {}
+        for name in names:
+            package_ids = self._name_index.get(name)
+            if package_ids:
+                data[name] = frozenset(package_ids)
+        return data
+
+    def searchKeySlot(self, key, slot):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._rows
+        slots = self._slots
+        return frozenset(x for x in self._key_index.get(key, ())
+                         if slots[rows[x]] == slot)
+
+    def searchNameCategory(self, name, category, just_id = False):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        package_ids = self._key_index.get(category + "/" + name, ())
+        if just_id:
+            return frozenset(package_ids)
+        return tuple((self.retrieveAtom(x), x) for x in package_ids)
+
+    def maskFilter(self, package_id, live = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        Results of the snapshotted repository are memoized.
+        """
+        cache_key = (package_id, live)
+        result = self._mask_cache.get(cache_key)
+        if result is None:
+            result = self._repository.maskFilter(package_id, live = live)
+            self._mask_cache[cache_key] = result
+        return result
+
+    def maskFilterMany(self, package_ids, live = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        Results of the snapshotted repository are memoized.
+        """
+        package_ids = list(package_ids)
+        missing = [x for x in package_ids if
+                   (x, live) not in self._mask_cache]
+        if missing:
+            results = self._repository.maskFilterMany(missing, live = live)
+            for package_id, result in zip(missing, results):
+                self._mask_cache[(package_id, live)] = result
+        return [self._mask_cache[(x, live)] for x in package_ids]
+
+    def atomMatchMany(self, atoms, matchSlot = None, multiMatch = False,
+        maskFilter = True, extendedResults = False, useCache = True):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        Atoms are matched one by one against the snapshot, the on-disk
+        cache is not used.
+        """
+        results = {}
+        for atom in atoms:
+            if atom not in results:
+                results[atom] = self.atomMatch(atom, matchSlot = matchSlot,
+                    multiMatch = multiMatch, maskFilter = maskFilter,
+                    extendedResults = extendedResults, useCache = False)
+        return results
+
+    def _lookup(self, method, *args):
+        """
+        Call the given method of the snapshotted repository, memoizing
+        its result.
+        """
+        cache_key = (method,) + args
+        try:
+            return self._lookup_cache[cache_key]
+        except KeyError:
+            result = getattr(self._repository, method)(*args)
+            self._lookup_cache[cache_key] = result
+            return result
+
+    def retrieveDigest(self, package_id):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        Results of the snapshotted repository are memoized.
+        """
+        if package_id not in self._rows:
+            return None
+        return self._lookup("retrieveDigest", package_id)
+
+    def searchProvidedVirtualPackage(self, keyword):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        Results of the snapshotted repository are memoized.
+        """
+        virtuals = self._lookup("searchProvidedVirtualPackage", keyword)
+        return tuple(x for x in virtuals if x[0] in self._rows)
+
+
+def _delegated(name):
+    """
+    Return a method calling the given method of the snapshotted repository.
+    """
+    def _method(self, *args, **kwargs):
+        return getattr(self._repository, name)(*args, **kwargs)
+    _method.__name__ = name
+    _method.__doc__ = "Delegated to the snapshotted repository."
+    return _method
+
+
+for _name, _obj in list(EntropyRepositoryBase.__dict__.items()):
+    if _name.startswith("_") or not inspect.isfunction(_obj):
+        continue
+    if _name in EntropyRepositorySnapshot.__dict__:
+        continue
+    if _name in EntropyRepositorySnapshot._LOCAL_METHODS:
+        continue
+    setattr(EntropyRepositorySnapshot, _name, _delegated(_name))
@@ -10,11 +10,15 @@
     most of the EntropyRepository methods using standard SQL.
 
 """
+import contextlib
+import fnmatch
 import os
 import hashlib
 import itertools
+import re
 import time
 import threading
+import weakref
 
 from entropy.const import etpConst, const_debug_write, \
     const_debug_enabled, const_isunicode, const_convert_to_unicode, \
@@ -240,6 +244,135 @@ class SQLCursorWrapper(object):
         return self._cur.description
 
 
+class SQLConnectionReaper(object):
+
+    """
+    Process-wide housekeeping thread that releases the Cursor and
+    Connection resources of terminated threads and closes the pooled
+    idle connections that have not been used for a while.
+    A single thread is running at any time, it terminates itself once
+    there is nothing left to watch.
+    """
+
+    # seconds between two reaping runs
+    _INTERVAL = 2.0
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        """
+        Return the process-wide SQLConnectionReaper instance.
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def reset_after_fork(cls):
+        """
+        Forget the instance inherited from the parent process, whose
+        thread does not exist in a forked child and whose mutex could
+        have been held at fork time. To be called in a forked child only.
+        """
+        cls._instance_lock = threading.Lock()
+        cls._instance = None
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._watched = {}
+        self._repos = weakref.WeakValueDictionary()
+        self._thread = None
+
+    def watch(self, repo, thread_obj, c_key):
+        """
+        Release the resources pointed by c_key once thread_obj
+        terminates.
+
+        @param repo: the repository owning the resources
+        @type repo: EntropySQLRepository
+        @param thread_obj: the thread using the resources
+        @type thread_obj: threading.Thread
+        @param c_key: the Cursor and Connection pool key
+        @type c_key: tuple
+        """
+        with self._mutex:
+            self._watched[(id(repo), c_key)] = (
+                weakref.ref(repo), thread_obj, c_key)
+            self._repos[id(repo)] = repo
+            self._start()
+
+    def wake(self, repo):
+        """
+        Make sure that the idle connections of the given repository
+        are eventually reaped.
+
+        @param repo: the repository owning the idle connections
+        @type repo: EntropySQLRepository
+        """
+        with self._mutex:
+            self._repos[id(repo)] = repo
+            self._start()
+
+    def _start(self):
+        """
+        Start the housekeeping thread, if not running. Must be called
+        with the mutex held.
+        """
+        if self._thread is not None:
+            return
+        self._thread = ParallelTask(self._run)
+        self._thread.name = "SQLConnectionReaper"
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        """
+        Housekeeping thread body.
+        """
+        while True:
+            time.sleep(self._INTERVAL)
+            busy = self.reap()
+            with self._mutex:
+                if not busy and not self._watched:
+                    self._thread = None
+                    return
+
+    def reap(self):
+        """
+        Release the resources of terminated threads and close the
+        expired idle connections.
+
+        @return: True, if there are idle connections left
+        @rtype: bool
+        """
+        with self._mutex:
+            watched = list(self._watched.items())
+            repos = list(self._repos.values())
+
+        for key, (repo_ref, thread_obj, c_key) in watched:
+            repo = repo_ref()
+            if repo is not None and thread_obj.is_alive():
+                continue
+            with self._mutex:
+                self._watched.pop(key, None)
+            if repo is not None:
+                if const_debug_enabled():
+                    const_debug_write(
+                        __name__,
+                        "thread '%s' exited, cleaning: %s" % (
+                            thread_obj, c_key,))
+                repo._cleanup_killer(c_key, _recycle=True)
+
+        busy = False
+        for repo in repos:
+            if repo._reapIdleConnections():
+                busy = True
+        return busy
+
+
 class EntropySQLRepository(EntropyRepositoryBase):
 
     """
@@ -318,6 +451,14 @@ class EntropySQLRepository(EntropyRepositoryBase):
                     dependency VARCHAR
                 );
 
+                CREATE TABLE reversedependencies (
+                    idpackage INTEGER,
+                    iddependency INTEGER,
+                    PRIMARY KEY(idpackage, iddependency),
+                    FOREIGN KEY(idpackage)
+                        REFERENCES baseinfo(idpackage) ON DELETE CASCADE
+                );
+
                 CREATE TABLE conflicts (
                     idpackage INTEGER,
                     conflict VARCHAR,
@@ -600,6 +741,10 @@ class EntropySQLRepository(EntropyRepositoryBase):
     # the "INSERT OR IGNORE" dialect
     _INSERT_OR_IGNORE = None
 
+    # maximum number of host parameters in a single SQL statement,
+    # this is SQLITE_MAX_VARIABLE_NUMBER default value
+    _MAX_SQL_VARIABLES = 999
+
     ## Optionals
 
     # If not None, must contain the
@@ -615,23 +760,80 @@ class EntropySQLRepository(EntropyRepositoryBase):
     # Generic repository name to use when none is given.
     GENERIC_NAME = "__generic__"
 
+    # In-memory cache keys that must be cleared before the persistent
+    # reverse dependencies index is incrementally updated: the index
+    # state itself and the lookups used by atomMatch().
+    _REVERSE_DEPENDENCIES_LIVE_CACHE_KEYS = (
+        "reverseDependenciesIndex", "reverseDependenciesMetadata",
+        "retrieveCategory", "retrieveKeySplit", "retrieveRevision",
+        "retrieveSlot", "retrieveTag", "retrieveUseflags",
+        "retrieveVersion", "searchNameCategory")
+
+    # Name of the setting holding the incrementally maintained repository
+    # checksum digest, see _updateChecksum(). The value is in the
+    # "<digest>@<stamp>" form, see _checksumStamp().
+    _CHECKSUM_SETTING = "checksum_digest"
+
+    # Consistency stamp written by _holdChecksumStamp() before adding or
+    # removing packages, until _updateChecksum() writes the real one.
+    _CHECKSUM_STAMP_HELD = "*"
+
+    # Number of library lookups on the same repository state (checksum
+    # digest) after which the in-memory soname index is built, see
+    # _sonameIndex(). Fewer lookups are cheaper to run as SQL queries.
+    _SONAME_INDEX_THRESHOLD = 16
+
+    # Reference tables whose identifiers are kept in memory during
+    # bulkImport(), mapping to (table, identifier column, value column).
+    _BULK_IMPORT_REFERENCES = {
+        "dependency": ("dependenciesreference", "iddependency",
+                       "dependency"),
+        "keyword": ("keywordsreference", "idkeyword", "keywordname"),
+        "useflag": ("useflagsreference", "idflag", "flagname"),
+        "source": ("sourcesreference", "idsource", "source"),
+        "protect": ("configprotectreference", "idprotect", "protect"),
+    }
+
+    # maximum number of idle connections kept around for reuse by
+    # new threads, once their owner thread terminates.
+    _CONNECTION_POOL_MAX_IDLE = 4
+    # seconds after which an idle connection is closed
+    _CONNECTION_POOL_IDLE_TIMEOUT = 30.0
+    # maximum number of connections (live and idle), None means unbounded
+    _CONNECTION_POOL_MAX_SIZE = None
+    # seconds a new thread waits for a connection, when the pool is full
+    _CONNECTION_POOL_WAIT_TIMEOUT = 60.0
+
     def __init__(self, db, read_only, skip_checks, indexing,
                  xcache, temporary, name, direct=False, cache_policy=None):
-        # connection and cursor automatic cleanup support
-        self._cleanup_monitor_cache_mutex = threading.Lock()
-        self._cleanup_monitor_cache = {}
-
         self._db = db
         self._indexing = indexing
         self._skip_checks = skip_checks
         self._settings_cache = {}
         self.__connection_pool = {}
         self.__connection_pool_mutex = threading.RLock()
+        self.__connection_pool_cond = threading.Condition(
+            self.__connection_pool_mutex)
         self.__cursor_pool_mutex = threading.RLock()
         self.__cursor_pool = {}
+        self.__idle_connections = []
+        self.__connection_pool_stats = {
+            "created": 0,
+            "reused": 0,
+            "reaped": 0,
+            "checkouts": 0,
+            "wait_time": 0.0,
+            "mutex_wait_time": 0.0,
+        }
+        # nesting level of connectionScope(), by pool key
+        self.__connection_scopes = {}
         if name is None:
             name = self.GENERIC_NAME
         self._live_cacher = EntropyRepositoryCacher()
+        # bulkImport() state, None if not in bulk import mode
+        self._bulk_import = None
+        # checksum digest held by _holdChecksumStamp()
+        self._checksum_held = None
 
         EntropyRepositoryBase.__init__(self, read_only, xcache,
                                        temporary, name, direct=direct,
@@ -665,36 +867,22 @@ class EntropySQLRepository(EntropyRepositoryBase):
                     self._cleanup_killer(
                         c_key,
                         _cleanup_main_thread=_cleanup_main_thread)
+                idle = self._idle_connection_pool()
+                conns = [conn for conn, _last_used in idle]
+                del idle[:]
 
-    def _cleanup_monitor(self, target_thread, c_key):
-        """
-        Execute Cursor and Connection resources
-        termination.
-        """
-        # join on thread
-        target_thread.join()
-
-        if const_debug_enabled():
-            const_debug_write(
-                __name__,
-                "thread '%s' exited [%s], cleaning: %s" % (
-                    target_thread, hex(target_thread.ident),
-                    c_key,))
-        with self._cleanup_monitor_cache_mutex:
-            self._cleanup_monitor_cache.pop(c_key, None)
-        self._cleanup_killer(c_key)
+        for conn in conns:
+            self._closeConnection(conn)
 
     def _start_cleanup_monitor(self, current_thread, c_key):
         """
-        Allocate a new thread that monitors the thread object
-        passed as "current_thread". Once this thread terminates,
-        all its resources are automatically released.
-        current_thread is actually joined() and live cursor and
-        connections are checked against thread identity value
-        clashing (because thread.ident values are recycled).
+        Make the process-wide SQLConnectionReaper watch the thread
+        object passed as "current_thread". Once this thread
+        terminates, all its resources are automatically released.
+        Live cursor and connections are checked against thread
+        identity value clashing (because thread.ident values are
+        recycled).
         For the main thread, this method is a NO-OP.
-        The allocated thread is a daemon thread, so it should
-        be safe to use join() on daemon threads as well.
         """
         if self.isMainThread(current_thread):
             const_debug_write(
@@ -703,27 +891,14 @@ class EntropySQLRepository(EntropyRepositoryBase):
             # do not install any cleanup monitor then
             return
 
-        with self._cleanup_monitor_cache_mutex:
-            mon = self._cleanup_monitor_cache.get(c_key)
-            if mon is not None:
-                # there is already a monitor for this
-                # cache key, quit straight away
-                return
-            self._cleanup_monitor_cache[c_key] = mon
+        SQLConnectionReaper.get().watch(self, current_thread, c_key)
 
-        if const_debug_enabled():
-            const_debug_write(
-                __name__,
-                "setting up a new cleanup monitor")
-        mon = ParallelTask(self._cleanup_monitor,
-                           current_thread, c_key)
-        mon.name = "CleanupMonitor"
-        mon.daemon = True
-        mon.start()
-
-    def _cleanup_killer(self, c_key, _cleanup_main_thread=False):
+    def _cleanup_killer(self, c_key, _cleanup_main_thread=False,
+                        _recycle=False):
         """
         Cursor and Connection cleanup method.
+        If _recycle is True, the connection is moved to the
+        idle connections pool rather than being closed.
         """
         db, th_ident, pid = c_key
 
@@ -794,27 +969,211 @@ class EntropySQLRepository(EntropyRepositoryBase):
                     "ident are gone, i canz kill thread "
                     "ids: %s." % (hex(th_ident),))
 
-            # WARNING !! BEHAVIOUR CHANGE
-            # no more implicit commit()
-            # caller has to do it!
+            if conn is None:
+                return
+            if not (_recycle and self._recycleConnection(conn)):
+                self._closeConnection(conn)
+
+        # wake up any thread waiting for a connection slot
+        with self._connection_pool_mutex():
+            self.__connection_pool_cond.notify_all()
+
+    def _closeConnection(self, conn):
+        """
+        Close a Connection object, ignoring errors.
+        """
+        # WARNING !! BEHAVIOUR CHANGE
+        # no more implicit commit()
+        # caller has to do it!
+        try:
+            conn.close()
+        except OperationalError as err:
+            if const_debug_enabled():
+                const_debug_write(
+                    __name__,
+                    "_cleanup_killer_1: %s" % (err,))
             try:
+                conn.interrupt()
                 conn.close()
             except OperationalError as err:
+                # heh, unable to close due to
+                # unfinalized statements
+                # interpreter shutdown?
                 if const_debug_enabled():
                     const_debug_write(
                         __name__,
-                        "_cleanup_killer_1: %s" % (err,))
-                try:
-                    conn.interrupt()
-                    conn.close()
-                except OperationalError as err:
-                    # heh, unable to close due to
-                    # unfinalized statements
-                    # interpreter shutdown?
-                    if const_debug_enabled():
-                        const_debug_write(
-                            __name__,
-                            "_cleanup_killer_2: %s" % (err,))
+                        "_cleanup_killer_2: %s" % (err,))
+
+    def _isConnectionReusable(self):
+        """
+        Return whether connections left behind by terminated threads
+        can be handed over to other threads.
+        """
+        return True
+
+    def _recycleConnection(self, conn):
+        """
+        Move a Connection object, whose owner thread terminated, to
+        the idle connections pool. Uncommitted changes are
+        rolled back, as it would happen on close.
+
+        @return: True, if the connection has been pooled
+        @rtype: bool
+        """
+        if not self._isConnectionReusable():
+            return False
+
+        with self._connection_pool_mutex():
+            idle = self._idle_connection_pool()
+            if len(idle) >= self._CONNECTION_POOL_MAX_IDLE:
+                return False
+            try:
+                conn.rollback()
+            except (OperationalError, ProgrammingError):
+                return False
+            idle.append((conn, time.time()))
+            self._connection_pool_stats()["reaped"] += 1
+
+        SQLConnectionReaper.get().wake(self)
+        return True
+
+    def _checkoutConnection(self, connect):
+        """
+        Return a Connection object for a new thread, taking it from
+        the idle connections pool, if possible, or creating a new one
+        by calling connect(). If the pool is bounded
+        (_CONNECTION_POOL_MAX_SIZE) and full, wait for a connection
+        to be released, up to _CONNECTION_POOL_WAIT_TIMEOUT seconds.
+        Must be called with the Connection Pool mutex held
+        (see _connection_pool_checkout()) and without the Cursor Pool
+        mutex held.
+
+        @param connect: Connection object factory function
+        @type connect: callable
+        @return: a Connection object
+        @rtype: SQLConnectionWrapper
+        @raise OperationalError: if no connection is released in time
+        """
+        stats = self._connection_pool_stats()
+        idle = self._idle_connection_pool()
+        max_size = self._CONNECTION_POOL_MAX_SIZE
+        if max_size is not None and not idle:
+            t1 = time.time()
+            deadline = t1 + self._CONNECTION_POOL_WAIT_TIMEOUT
+            while not idle and self._connectionPoolSize() >= max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise OperationalError(
+                        "connection pool exhausted (%d connections)" % (
+                            max_size,))
+                self.__connection_pool_cond.wait(remaining)
+            stats["wait_time"] += time.time() - t1
+
+        if idle:
+            conn, _last_used = idle.pop()
+            stats["reused"] += 1
+            return conn
+
+        stats["created"] += 1
+        return connect()
+
+    def _connectionPoolSize(self):
+        """
+        Return the number of live connections to this repository. Must
+        be called with the Connection Pool mutex held.
+        """
+        # the Connection Pool can be shared among repositories
+        return len([x for x in self._connection_pool().keys()
+                    if x[0] == self._db])
+
+    def _reapIdleConnections(self):
+        """
+        Close the idle connections unused for more than
+        _CONNECTION_POOL_IDLE_TIMEOUT seconds.
+
+        @return: True, if there are idle connections left
+        @rtype: bool
+        """
+        expired = []
+        limit = time.time() - self._CONNECTION_POOL_IDLE_TIMEOUT
+        with self._connection_pool_mutex():
+            idle = self._idle_connection_pool()
+            for item in idle[:]:
+                conn, last_used = item
+                if last_used < limit:
+                    idle.remove(item)
+                    expired.append(conn)
+            busy = len(idle) > 0
+
+        for conn in expired:
+            self._closeConnection(conn)
+        return busy
+
+    @contextlib.contextmanager
+    def _connection_pool_checkout(self):
+        """
+        Acquire the Connection Pool mutex, accounting the time spent
+        waiting for it.
+        """
+        mutex = self._connection_pool_mutex()
+        t1 = time.time()
+        with mutex:
+            stats = self._connection_pool_stats()
+            stats["checkouts"] += 1
+            stats["mutex_wait_time"] += time.time() - t1
+            yield
+
+    @contextlib.contextmanager
+    def connectionScope(self):
+        """
+        Context manager binding a pooled Connection to the current thread
+        for the duration of the context. On exit, the Connection is handed
+        back to the pool, where other threads can take it, rather than
+        staying bound to this thread until it terminates. This is the way
+        to go for long-lived threads (for instance, thread pool workers)
+        when the pool is bounded (_CONNECTION_POOL_MAX_SIZE).
+        Uncommitted changes are rolled back on exit, call commit() before
+        leaving the context. Nested calls are no-ops.
+
+        Example:
+        >>> with repo.connectionScope():
+        ...     repo.retrieveAtom(package_id)
+        """
+        c_key = self._cursor_connection_pool_key()
+        scopes = self.__connection_scopes
+        with self._connection_pool_mutex():
+            depth = scopes.get(c_key, 0)
+            scopes[c_key] = depth + 1
+        try:
+            yield
+        finally:
+            with self._connection_pool_mutex():
+                if depth:
+                    scopes[c_key] = depth
+                else:
+                    scopes.pop(c_key, None)
+            # connections to private databases cannot be handed over
+            if not depth and self._isConnectionReusable():
+                self._cleanup_killer(c_key, _recycle=True)
+
+    def connectionPoolStats(self):
+        """
+        Return the Connection Pool counters.
+
+        @return: a dictionary containing the number of live connections
+            ("size"), idle connections ("idle"), connections created
+            ("created"), reused ("reused") and handed back to the pool
+            ("reaped"), pool checkouts ("checkouts"), the overall time
+            spent waiting for a connection slot of a full pool
+            ("wait_time") and for the pool mutex ("mutex_wait_time"),
+            in seconds.
+        @rtype: dict
+        """
+        with self._connection_pool_mutex():
+            stats = self._connection_pool_stats().copy()
+            stats["size"] = self._connectionPoolSize()
+            stats["idle"] = len(self._idle_connection_pool())
+        return stats
 
     def _concatOperator(self, fields):
         """
@@ -859,7 +1218,8 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Save a new key -> value pair to the in-memory cache.
         """
-        self._live_cacher.set(self._getLiveCacheKey() + key, value)
+        partition = self._getLiveCacheKey()
+        self._live_cacher.set(partition + key, value, partition = partition)
 
     def _getLiveCache(self, key):
         """
@@ -890,6 +1250,15 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         raise NotImplementedError()
 
+    def _iterCursor(self):
+        """
+        Return a Cursor object for the iterator APIs, like
+        retrieveContentIter(), whose result set is consumed lazily.
+        Subclasses can return a dedicated Cursor, so that other queries
+        can be executed while iterating.
+        """
+        return self._cursor()
+
     def _cur2frozenset(self, cur):
         """
         Flatten out a cursor content (usually some kind of list of lists)
@@ -931,6 +1300,19 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         return self.__cursor_pool_mutex
 
+    def _idle_connection_pool(self):
+        """
+        Return the idle Connection Pool list object, containing
+        (connection, last used timestamp) tuples.
+        """
+        return self.__idle_connections
+
+    def _connection_pool_stats(self):
+        """
+        Return the Connection Pool counters mapping object
+        """
+        return self.__connection_pool_stats
+
     def _doesTableExist(self, table, temporary = False):
         """
         Return whether a table exists.
@@ -999,6 +1381,9 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 "commit(), "
                 "force: %s, no_plugins: %s, readonly: %s | %s" % (
                     force, no_plugins, self.readonly(), self))
+        if self._bulk_import is not None:
+            # bulkImport() commits once, on exit
+            return
         if force or not self.readonly():
             # NOTE: the actual commit MUST be executed before calling
             # the superclass method (that is going to call EntropyRepositoryBase
@@ -1201,15 +1586,12 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 idflags = self._addCompileFlags(pkg_data['chost'],
                     pkg_data['cflags'], pkg_data['cxxflags'])
 
-        idprotect = self._isProtectAvailable(pkg_data['config_protect'])
-        if idprotect == -1:
-            idprotect = self._addProtect(pkg_data['config_protect'])
-
-        idprotect_mask = self._isProtectAvailable(
-            pkg_data['config_protect_mask'])
-        if idprotect_mask == -1:
-            idprotect_mask = self._addProtect(
-                pkg_data['config_protect_mask'])
+        idprotect = self._getReferenceId(
+            "protect", pkg_data['config_protect'],
+            self._isProtectAvailable, self._addProtect)
+        idprotect_mask = self._getReferenceId(
+            "protect", pkg_data['config_protect_mask'],
+            self._isProtectAvailable, self._addProtect)
 
         trigger = 0
         if pkg_data['trigger']:
@@ -1252,6 +1634,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
             for manual_dep in manual_deps:
                 pkg_data['pkg_dependencies'] += ((manual_dep, m_dep_id),)
 
+        self._holdChecksumStamp()
         cur = self._cursor().execute("""
         INSERT INTO baseinfo VALUES
         (%s, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""" % (
@@ -1399,6 +1782,13 @@ class EntropySQLRepository(EntropyRepositoryBase):
             package_id = self._addPackage(pkg_data, revision = revision,
                 package_id = package_id,
                 formatted_content = formatted_content)
+            self._updateChecksum("addPackage", package_id)
+            if self._bulk_import is not None:
+                self._bulk_import["keys"].update(
+                    self._getReverseDependenciesKeys(package_id))
+            elif self._isReverseDependenciesIndexMaintained():
+                self._updateReverseDependenciesIndex(
+                    keys = self._getReverseDependenciesKeys(package_id))
             super(EntropySQLRepository, self).addPackage(
                 pkg_data, revision = revision,
                 package_id = package_id,
@@ -1408,6 +1798,117 @@ class EntropySQLRepository(EntropyRepositoryBase):
             self._connection().rollback()
             raise
 
+    @contextlib.contextmanager
+    def bulkImport(self, drop_indexes = True):
+        """
+        Context manager speeding up the import of many packages through
+        addPackage(), for instance when generating a server-side repository
+        from scratch. Inside the context, indexes are dropped and
+        recreated on exit, reference metadata identifiers (dependencies,
+        keywords, USE flags, ...) are resolved in memory, intermediate
+        commits are suppressed and the checksum digest and the reverse
+        dependencies index are updated once. On exit, everything is
+        committed at once, or rolled back if an exception is raised.
+        Queries run inside the context cannot use indexes, unless
+        drop_indexes is False.
+        Nested calls are no-ops.
+
+        Example:
+        >>> with repo.bulkImport():
+        ...     for pkg_data in packages:
+        ...         repo.addPackage(pkg_data)
+
+        @keyword drop_indexes: drop the indexes while importing, this
+            should be disabled when adding a few packages to a large
+            repository, or when the import loop runs many queries.
+        @type drop_indexes: bool
+        """
+        if self._bulk_import is not None:
+            yield
+            return
+
+        indexing = self._indexing and drop_indexes
+        if indexing:
+            self.dropAllIndexes()
+
+        state = {
+            "references": {},
+            "checksum": None,
+            "dependency_ids": set(),
+            "keys": set(),
+        }
+        self._bulk_import = state
+        try:
+            yield
+        except:
+            self._bulk_import = None
+            self.rollback()
+            if indexing:
+                self.createAllIndexes()
+                self.commit()
+            raise
+
+        self._bulk_import = None
+        if state["checksum"] is not None:
+            old_checksum = self.checksum(include_dependencies = True)
+            self._setSetting(self._CHECKSUM_SETTING, "%s@%s" % (
+                    state["checksum"], self._checksumStamp()))
+            self._checksum_held = None
+            self._live_cacher.discard(self._getLiveCacheKey() + "checksum")
+            self._rollReverseDependenciesIndex(old_checksum)
+        if (state["dependency_ids"] or state["keys"]) and \
+                self._isReverseDependenciesIndexMaintained():
+            self._updateReverseDependenciesIndex(
+                dependency_ids = state["dependency_ids"],
+                keys = state["keys"])
+        if indexing:
+            self.createAllIndexes()
+        self.commit()
+
+    def _getReferenceId(self, reference, value, lookup, add):
+        """
+        Return the identifier of the given reference table value, adding it
+        to the repository if not available. Inside bulkImport(), the whole
+        reference table is kept in memory.
+
+        @param reference: reference name, see _BULK_IMPORT_REFERENCES
+        @type reference: string
+        @param value: reference value (dependency string, keyword, ...)
+        @type value: string
+        @param lookup: function returning the identifier of value, or -1
+        @type lookup: callable
+        @param add: function adding value and returning its identifier
+        @type add: callable
+        @return: the reference identifier
+        @rtype: int
+        """
+        bulk = self._bulk_import
+        if bulk is None:
+            ref_id = lookup(value)
+            if ref_id == -1:
+                ref_id = add(value)
+            return ref_id
+
+        ids = bulk["references"].get(reference)
+        if ids is None:
+            table, id_column, value_column = \
+                self._BULK_IMPORT_REFERENCES[reference]
+            cur = self._cursor().execute("""
+            SELECT %s, %s FROM %s
+            """ % (value_column, id_column, table))
+            ids = dict(cur)
+            bulk["references"][reference] = ids
+
+        # values read back from the repository are unicode
+        key = value
+        if not const_isunicode(key):
+            key = const_convert_to_unicode(key)
+        ref_id = ids.get(key)
+        if ref_id is None:
+            ref_id = add(value)
+            ids[key] = ref_id
+        return ref_id
+
     def removePackage(self, package_id, from_add_package = False):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -1419,8 +1920,21 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 package_id, from_add_package = from_add_package)
             self.clearCache()
 
-            return self._removePackage(package_id,
+            rev_deps_keys = None
+            if self._bulk_import is not None:
+                self._bulk_import["keys"].update(
+                    self._getReverseDependenciesKeys(package_id))
+            elif self._isReverseDependenciesIndexMaintained():
+                rev_deps_keys = self._getReverseDependenciesKeys(package_id)
+
+            self._holdChecksumStamp()
+            outcome = self._removePackage(package_id,
                 from_add_package = from_add_package)
+            self._updateChecksum("removePackage", package_id)
+
+            if rev_deps_keys:
+                self._updateReverseDependenciesIndex(keys = rev_deps_keys)
+            return outcome
         except:
             self._connection().rollback()
             raise
@@ -1563,6 +2077,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         self._cursor().execute("""
         UPDATE extrainfo SET datecreation = ? WHERE idpackage = ?
         """, (str(date), package_id,))
+        self._updateChecksum("setCreationDate", package_id, date)
 
     def setDigest(self, package_id, digest):
         """
@@ -1571,6 +2086,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         self._cursor().execute("""
         UPDATE extrainfo SET digest = ? WHERE idpackage = ?
         """, (digest, package_id,))
+        self._updateChecksum("setDigest", package_id, digest)
 
     def setSignatures(self, package_id, sha1, sha256, sha512, gpg = None):
         """
@@ -1580,6 +2096,8 @@ class EntropySQLRepository(EntropyRepositoryBase):
         UPDATE packagesignatures SET sha1 = ?, sha256 = ?, sha512 = ?,
         gpg = ? WHERE idpackage = ?
         """, (sha1, sha256, sha512, gpg, package_id))
+        self._updateChecksum(
+            "setSignatures", package_id, sha1, sha256, sha512, gpg)
 
     def setDownloadURL(self, package_id, url):
         """
@@ -1593,11 +2111,27 @@ class EntropySQLRepository(EntropyRepositoryBase):
         self._cursor().execute("""
         UPDATE extrainfo SET download = ? WHERE idpackage = ?
         """, (url, package_id,))
+        self._updateChecksum("setDownloadURL", package_id, url)
 
     def setCategory(self, package_id, category):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        rev_deps_keys = None
+        if self._isReverseDependenciesIndexMaintained():
+            rev_deps_keys = self._getReverseDependenciesKeys(package_id)
+
+        self._setCategory(package_id, category)
+        self._updateChecksum("setCategory", package_id, category)
+
+        if rev_deps_keys:
+            rev_deps_keys |= self._getReverseDependenciesKeys(package_id)
+            self._updateReverseDependenciesIndex(keys = rev_deps_keys)
+
+    def _setCategory(self, package_id, category):
+        """
+        Write the new category of the package, see setCategory().
+        """
         self._cursor().execute("""
         UPDATE baseinfo SET category = ? WHERE idpackage = ?
         """, (category, package_id,))
@@ -1619,9 +2153,18 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        rev_deps_keys = None
+        if self._isReverseDependenciesIndexMaintained():
+            rev_deps_keys = self._getReverseDependenciesKeys(package_id)
+
         self._cursor().execute("""
         UPDATE baseinfo SET name = ? WHERE idpackage = ?
         """, (name, package_id,))
+        self._updateChecksum("setName", package_id, name)
+
+        if rev_deps_keys:
+            rev_deps_keys |= self._getReverseDependenciesKeys(package_id)
+            self._updateReverseDependenciesIndex(keys = rev_deps_keys)
 
     def setDependency(self, iddependency, dependency):
         """
@@ -1631,6 +2174,11 @@ class EntropySQLRepository(EntropyRepositoryBase):
         UPDATE dependenciesreference SET dependency = ?
         WHERE iddependency = ?
         """, (dependency, iddependency,))
+        self._updateChecksum("setDependency", iddependency, dependency)
+
+        if self._isReverseDependenciesIndexMaintained():
+            self._updateReverseDependenciesIndex(
+                dependency_ids = (iddependency,))
 
     def setAtom(self, package_id, atom):
         """
@@ -1639,22 +2187,41 @@ class EntropySQLRepository(EntropyRepositoryBase):
         self._cursor().execute("""
         UPDATE baseinfo SET atom = ? WHERE idpackage = ?
         """, (atom, package_id,))
+        self._updateChecksum("setAtom", package_id, atom)
 
     def setSlot(self, package_id, slot):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        rev_deps_keys = None
+        if self._isReverseDependenciesIndexMaintained():
+            rev_deps_keys = self._getReverseDependenciesKeys(package_id)
+
         self._cursor().execute("""
         UPDATE baseinfo SET slot = ? WHERE idpackage = ?
         """, (slot, package_id,))
+        self._updateChecksum("setSlot", package_id, slot)
+
+        if rev_deps_keys:
+            rev_deps_keys |= self._getReverseDependenciesKeys(package_id)
+            self._updateReverseDependenciesIndex(keys = rev_deps_keys)
 
     def setRevision(self, package_id, revision):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        rev_deps_keys = None
+        if self._isReverseDependenciesIndexMaintained():
+            rev_deps_keys = self._getReverseDependenciesKeys(package_id)
+
         self._cursor().execute("""
         UPDATE baseinfo SET revision = ? WHERE idpackage = ?
         """, (revision, package_id,))
+        self._updateChecksum("setRevision", package_id, revision)
+
+        if rev_deps_keys:
+            rev_deps_keys |= self._getReverseDependenciesKeys(package_id)
+            self._updateReverseDependenciesIndex(keys = rev_deps_keys)
 
     def removeDependencies(self, package_id):
         """
@@ -1663,6 +2230,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         self._cursor().execute("""
         DELETE FROM dependencies WHERE idpackage = ?
         """, (package_id,))
+        self._updateChecksum("removeDependencies", package_id)
 
     def insertDependencies(self, package_id, depdata):
         """
@@ -1680,17 +2248,25 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 elif not isinstance(dep, const_get_stringtype()):
                     dep, deptype = dep
 
-                iddep = self._isDependencyAvailable(dep)
-                if iddep == -1:
-                    iddep = self._addDependency(dep)
+                iddep = self._getReferenceId(
+                    "dependency", dep, self._isDependencyAvailable,
+                    self._addDependency)
 
                 deps.append((package_id, iddep, deptype,))
 
             return deps
 
+        deps = insert_list()
         self._cursor().executemany("""
         INSERT INTO dependencies VALUES (?, ?, ?)
-        """, insert_list())
+        """, deps)
+        self._updateChecksum("insertDependencies", package_id, deps)
+
+        if self._bulk_import is not None:
+            self._bulk_import["dependency_ids"].update(x[1] for x in deps)
+        elif deps and self._isReverseDependenciesIndexMaintained():
+            self._updateReverseDependenciesIndex(
+                dependency_ids = [x[1] for x in deps])
 
     def removeConflicts(self, package_id):
         """
@@ -1934,10 +2510,8 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
 
         def mymf(key):
-            idkeyword = self._isKeywordAvailable(key)
-            if idkeyword == -1:
-                # create category
-                idkeyword = self._addKeyword(key)
+            idkeyword = self._getReferenceId(
+                "keyword", key, self._isKeywordAvailable, self._addKeyword)
             return (package_id, idkeyword,)
 
         self._cursor().executemany("""
@@ -1955,10 +2529,8 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
 
         def mymf(flag):
-            iduseflag = self._isUseflagAvailable(flag)
-            if iduseflag == -1:
-                # create category
-                iduseflag = self._addUseflag(flag)
+            iduseflag = self._getReferenceId(
+                "useflag", flag, self._isUseflagAvailable, self._addUseflag)
             return (package_id, iduseflag,)
 
         self._cursor().executemany("""
@@ -2079,9 +2651,8 @@ class EntropySQLRepository(EntropyRepositoryBase):
             (not entropy.tools.is_valid_string(source)):
                 return 0
 
-            idsource = self._isSourceAvailable(source)
-            if idsource == -1:
-                idsource = self._addSource(source)
+            idsource = self._getReferenceId(
+                "source", source, self._isSourceAvailable, self._addSource)
 
             return (package_id, idsource,)
 
@@ -2420,6 +2991,12 @@ class EntropySQLRepository(EntropyRepositoryBase):
         DELETE FROM dependenciesreference
         WHERE iddependency NOT IN (SELECT iddependency FROM dependencies)
         """)
+        if self._doesTableExist("reversedependencies"):
+            self._cursor().execute("""
+            DELETE FROM reversedependencies
+            WHERE iddependency NOT IN (
+                SELECT iddependency FROM dependenciesreference)
+            """)
 
     def getFakeSpmUid(self):
         """
@@ -2525,6 +3102,46 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """ % (concat,), (package_id,))
         return cur.fetchone()
 
+    def _getPackageIdsRows(self, query, package_ids, args = ()):
+        """
+        Execute the given query for the given package identifiers, splitting
+        them in chunks in order not to exceed the maximum number of SQL
+        variables, and return an iterator over the resulting rows.
+        The query must contain a single "%s" placeholder, which is going
+        to be replaced by the list of SQL variables.
+
+        @param query: SQL query string
+        @type query: string
+        @param package_ids: list of package identifiers
+        @type package_ids: iterable
+        @keyword args: further SQL arguments, following the package
+            identifiers in the query
+        @type args: tuple
+        @return: iterator over the result rows
+        @rtype: iterator
+        """
+        package_ids = list(set(package_ids))
+        chunk_size = self._MAX_SQL_VARIABLES - len(args)
+        for idx in range(0, len(package_ids), chunk_size):
+            chunk = package_ids[idx:idx + chunk_size]
+            cur = self._cursor().execute(
+                query % (", ".join(["?"] * len(chunk)),),
+                chunk + list(args))
+            for row in cur:
+                yield row
+
+    def getStrictDataMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        concat = self._concatOperator(("category", "'/'", "name"))
+        rows = self._getPackageIdsRows("""
+        SELECT idpackage, %s, slot, version, versiontag, revision, atom
+        FROM baseinfo
+        WHERE idpackage IN ( %%s )
+        """ % (concat,), package_ids)
+        return dict((row[0], row[1:]) for row in rows)
+
     def getStrictScopeData(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -2755,6 +3372,16 @@ class EntropySQLRepository(EntropyRepositoryBase):
         if atom:
             return atom[0]
 
+    def retrieveAtomMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._getPackageIdsRows("""
+        SELECT idpackage, atom FROM baseinfo
+        WHERE idpackage IN ( %s )
+        """, package_ids)
+        return dict(rows)
+
     def retrieveBranch(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -2943,6 +3570,17 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """ % (concat,), (package_id,))
         return cur.fetchone()
 
+    def retrieveKeySlotMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        concat = self._concatOperator(("category", "'/'", "name"))
+        rows = self._getPackageIdsRows("""
+        SELECT idpackage, %s, slot FROM baseinfo
+        WHERE idpackage IN ( %%s )
+        """ % (concat,), package_ids)
+        return dict((pkg_id, (key, slot)) for pkg_id, key, slot in rows)
+
     def retrieveKeySlotAggregated(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -3034,6 +3672,21 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """, (package_id,))
         return self._cur2frozenset(cur)
 
+    def retrieveUseflagsMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._getPackageIdsRows("""
+        SELECT useflags.idpackage, useflagsreference.flagname
+        FROM useflags, useflagsreference
+        WHERE useflags.idpackage IN ( %s )
+        AND useflags.idflag = useflagsreference.idflag
+        """, package_ids)
+        data = {}
+        for package_id, flag in rows:
+            data.setdefault(package_id, set()).add(flag)
+        return dict((k, frozenset(v)) for k, v in data.items())
+
     def retrieveSpmPhases(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -3149,6 +3802,10 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        index = self._sonameIndex()
+        if index is not None:
+            return index["package"].get(package_id, frozenset())
+
         cur = self._cursor().execute("""
         SELECT library, path, elfclass FROM provided_libs
         WHERE idpackage = ?
@@ -3164,6 +3821,18 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """, (package_id,))
         return self._cur2frozenset(cur)
 
+    def retrieveConflictsMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._getPackageIdsRows("""
+        SELECT idpackage, conflict FROM conflicts WHERE idpackage IN ( %s )
+        """, package_ids)
+        data = {}
+        for package_id, conflict in rows:
+            data.setdefault(package_id, set()).add(conflict)
+        return dict((k, frozenset(v)) for k, v in data.items())
+
     def retrieveProvide(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -3280,6 +3949,22 @@ class EntropySQLRepository(EntropyRepositoryBase):
                     cur, [self]))
         return iter_obj(cur)
 
+    def retrieveDependenciesMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._getPackageIdsRows("""
+        SELECT dependencies.idpackage, dependenciesreference.dependency,
+            dependencies.type
+        FROM dependencies, dependenciesreference
+        WHERE dependencies.idpackage IN ( %s ) AND
+        dependencies.iddependency = dependenciesreference.iddependency
+        """, package_ids)
+        data = {}
+        for package_id, dependency, dep_type in rows:
+            data.setdefault(package_id, []).append((dependency, dep_type))
+        return dict((k, tuple(v)) for k, v in data.items())
+
     def retrieveKeywords(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -3290,6 +3975,21 @@ class EntropySQLRepository(EntropyRepositoryBase):
         keywords.idkeyword = keywordsreference.idkeyword""", (package_id,))
         return self._cur2frozenset(cur)
 
+    def retrieveKeywordsMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._getPackageIdsRows("""
+        SELECT keywords.idpackage, keywordsreference.keywordname
+        FROM keywords, keywordsreference
+        WHERE keywords.idpackage IN ( %s )
+        AND keywords.idkeyword = keywordsreference.idkeyword
+        """, package_ids)
+        data = {}
+        for package_id, keyword in rows:
+            data.setdefault(package_id, set()).add(keyword)
+        return dict((k, frozenset(v)) for k, v in data.items())
+
     def retrieveProtect(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -3432,8 +4132,8 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 self._init_cur()
 
             def _init_cur(self):
-                self._cur = self._db._cursor().execute(
-                    self._query, self._keywords)
+                self._cur = iter(self._db._iterCursor().execute(
+                    self._query, self._keywords))
 
             def __iter__(self):
                 self._init_cur()
@@ -3443,7 +4143,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 return next(self._cur)
 
             def next(self):
-                return self._cur.next()
+                return next(self._cur)
 
         searchkeywords = (package_id,)
         order_by_string = ''
@@ -3686,6 +4386,16 @@ class EntropySQLRepository(EntropyRepositoryBase):
         if licname:
             return licname[0]
 
+    def retrieveLicenseMany(self, package_ids):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        rows = self._getPackageIdsRows("""
+        SELECT idpackage, license FROM baseinfo
+        WHERE idpackage IN ( %s )
+        """, package_ids)
+        return dict(rows)
+
     def retrieveCompileFlags(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -3703,14 +4413,8 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
-        cached = self._getLiveCache("reverseDependenciesMetadata")
-        if cached is None:
-            cached = self._generateReverseDependenciesMetadata()
-
-        dep_ids = set((k for k, v in cached.items() if package_id in v))
+        dep_ids = self._retrieveReverseDependencyIds(package_id)
         if not dep_ids:
-            # avoid python3.x memleak
-            del cached
             if key_slot:
                 return tuple()
             return frozenset()
@@ -3818,25 +4522,62 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 WHERE dependencies.iddependency IN ( %s )""" % (dep_ids_str,))
                 result = self._cur2frozenset(cur)
 
+        return result
+
+    def _retrieveReverseDependencyIds(self, package_id):
+        """
+        Return the dependency identifiers (iddependency) that are
+        satisfied by the given package identifier, using the persistent
+        reverse dependencies index whenever it is available.
+
+        @param package_id: package identifier
+        @type package_id: int
+        @return: dependency identifiers
+        @rtype: frozenset
+        """
+        if self._reverseDependenciesIndex():
+            cur = self._cursor().execute("""
+            SELECT iddependency FROM reversedependencies
+            WHERE idpackage = ?
+            """, (package_id,))
+            return self._cur2frozenset(cur)
+
+        cached = self._getLiveCache("reverseDependenciesMetadata")
+        if cached is None:
+            cached = self._generateReverseDependenciesMetadata()
+        dep_ids = frozenset(cached.get(package_id, ()))
         # avoid python3.x memleak
         del cached
-        return result
+        return dep_ids
 
     def retrieveUnusedPackageIds(self):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        if self._reverseDependenciesIndex():
+            cur = self._cursor().execute("""
+            SELECT idpackage FROM baseinfo
+            WHERE idpackage NOT IN (
+                SELECT reversedependencies.idpackage
+                FROM reversedependencies, dependencies
+                WHERE reversedependencies.iddependency =
+                    dependencies.iddependency )
+            ORDER BY atom
+            """)
+            return self._cur2tuple(cur)
+
         cached = self._getLiveCache("reverseDependenciesMetadata")
         if cached is None:
             cached = self._generateReverseDependenciesMetadata()
 
-        pkg_ids = set()
-        for v in cached.values():
-            pkg_ids |= v
+        pkg_ids = set(cached.keys())
+        # avoid python3.x memleak
+        del cached
         if not pkg_ids:
-            # avoid python3.x memleak
-            del cached
-            return tuple()
+            cur = self._cursor().execute("""
+            SELECT idpackage FROM baseinfo ORDER BY atom
+            """)
+            return self._cur2tuple(cur)
         pkg_ids_str = ', '.join((str(x) for x in pkg_ids))
 
         cur = self._cursor().execute("""
@@ -3844,8 +4585,6 @@ class EntropySQLRepository(EntropyRepositoryBase):
         WHERE idpackage NOT IN ( %s )
         ORDER BY atom
         """ % (pkg_ids_str,))
-        # avoid python3.x memleak
-        del cached
         return self._cur2tuple(cur)
 
     def arePackageIdsAvailable(self, package_ids):
@@ -3911,6 +4650,15 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        index = self._sonameIndex()
+        if index is not None:
+            providers = index["provided"].get(needed, ())
+            if extended:
+                return frozenset((x, y) for x, y, z in providers
+                                 if elfclass == -1 or z == elfclass)
+            return frozenset(x for x, y, z in providers
+                             if elfclass == -1 or z == elfclass)
+
         args = (needed,)
         elfclass_txt = ''
         if elfclass != -1:
@@ -3928,6 +4676,80 @@ class EntropySQLRepository(EntropyRepositoryBase):
         WHERE library = ?""" + elfclass_txt, args)
         return self._cur2frozenset(cur)
 
+    def _sonameIndex(self):
+        """
+        Return the in-memory index of the provided and needed libraries
+        used by resolveNeeded(), searchNeeded() and
+        retrieveProvidedLibraries(), or None if the tables must be
+        queried instead.
+
+        The index is built once per repository state, identified by the
+        incrementally maintained checksum digest, and kept in the live
+        cache. It is only built after _SONAME_INDEX_THRESHOLD lookups on
+        the same state, so that repositories modified between a few
+        lookups do not pay for it.
+
+        @return: a dictionary with the "provided" (library -> list of
+            (package_id, path, elfclass)), "package" (package_id ->
+            frozenset of (library, path, elfclass)) and "needed"
+            (soname -> list of (package_id, elfclass)) mappings, or None
+        @rtype: dict or None
+        """
+        if self._bulk_import is not None:
+            return None
+        digest = self._getChecksumDigest()
+        if digest is None:
+            return None
+
+        cached = self._getLiveCache("sonameIndex")
+        lookups = 1
+        if cached is not None:
+            cached_digest, index, cached_lookups = cached
+            if cached_digest == digest:
+                if index is not None:
+                    return index
+                lookups += cached_lookups
+        # avoid memleak with python3.x
+        del cached
+
+        index = None
+        if lookups >= self._SONAME_INDEX_THRESHOLD:
+            index = self._buildSonameIndex()
+        self._setLiveCache("sonameIndex", (digest, index, lookups))
+        return index
+
+    def _buildSonameIndex(self):
+        """
+        Build the in-memory soname index, see _sonameIndex().
+        Return None if the repository lacks the needed_libs table.
+        """
+        if not self._doesTableExist("needed_libs"):
+            return None
+
+        provided = {}
+        package = {}
+        cur = self._cursor().execute("""
+        SELECT idpackage, library, path, elfclass FROM provided_libs
+        """)
+        for package_id, library, path, elfclass in cur:
+            provided.setdefault(library, []).append(
+                (package_id, path, elfclass))
+            package.setdefault(package_id, set()).add(
+                (library, path, elfclass))
+
+        needed = {}
+        cur = self._cursor().execute("""
+        SELECT idpackage, soname, elfclass FROM needed_libs
+        """)
+        for package_id, soname, elfclass in cur:
+            needed.setdefault(soname, []).append((package_id, elfclass))
+
+        return {
+            "provided": provided,
+            "package": dict((x, frozenset(y)) for x, y in package.items()),
+            "needed": needed,
+        }
+
     def _isSourceAvailable(self, source):
         """
         Return whether given source package URL is available in repository.
@@ -4074,10 +4896,47 @@ class EntropySQLRepository(EntropyRepositoryBase):
             return True
         return False
 
-    def searchBelongs(self, bfile, like = False):
+    @staticmethod
+    def _patternPrefix(pattern, glob = False):
+        """
+        Return the literal prefix of a LIKE (or GLOB, if glob is True)
+        pattern, that is, the part preceding the first wildcard.
+        """
+        wildcards = "*?[" if glob else "%_"
+        for idx, char in enumerate(pattern):
+            if char in wildcards:
+                return pattern[:idx]
+        return pattern
+
+    @staticmethod
+    def _patternRegex(pattern, glob = False):
+        """
+        Compile a LIKE (case insensitive) or GLOB (if glob is True) pattern
+        into a regular expression object matching the same strings.
+        """
+        if glob:
+            # GLOB negates character classes using "^", fnmatch uses "!"
+            return re.compile(fnmatch.translate(pattern.replace("[^", "[!")))
+        regex = "".join(
+            ".*" if x == "%" else "." if x == "_" else re.escape(x)
+            for x in pattern)
+        return re.compile(regex + "$", re.IGNORECASE | re.DOTALL)
+
+    def searchBelongs(self, bfile, like = False, glob = False):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        if glob:
+            # the prefix is used to skim the candidates through LIKE,
+            # which is case insensitive, then GLOB semantics is applied.
+            regex = self._patternRegex(bfile, glob = True)
+            cur = self._cursor().execute("""
+            SELECT content.idpackage, content.file FROM content, baseinfo
+            WHERE file LIKE ? AND
+            content.idpackage = baseinfo.idpackage""", (
+                    self._patternPrefix(bfile, glob = True) + "%",))
+            return frozenset(x for x, y in cur if regex.match(y))
+
         if like:
             cur = self._cursor().execute("""
             SELECT content.idpackage FROM content,baseinfo
@@ -4091,6 +4950,26 @@ class EntropySQLRepository(EntropyRepositoryBase):
 
         return self._cur2frozenset(cur)
 
+    def searchBelongsDirectory(self, directory, recursive = False):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        directory = directory.rstrip("/")
+        # "_" and "%" in the path make LIKE match a superset
+        cur = self._cursor().execute("""
+        SELECT content.idpackage, content.file FROM content, baseinfo
+        WHERE file LIKE ? AND
+        content.idpackage = baseinfo.idpackage""", (directory + "/%",))
+
+        prefix_len = len(directory) + 1
+        package_ids = set()
+        for package_id, path in cur:
+            if not path.startswith(directory + "/"):
+                continue
+            if recursive or "/" not in path[prefix_len:]:
+                package_ids.add(package_id)
+        return frozenset(package_ids)
+
     def searchContentSafety(self, sfile):
         """
         Search content safety metadata (usually, sha256 and mtime) related to
@@ -4209,6 +5088,13 @@ class EntropySQLRepository(EntropyRepositoryBase):
             return self._compatSearchNeeded(
                 needed, elfclass = elfclass, like = like)
 
+        if not like:
+            index = self._sonameIndex()
+            if index is not None:
+                return frozenset(
+                    x for x, y in index["needed"].get(needed, ())
+                    if elfclass == -1 or y == elfclass)
+
         likestr = '='
         if like:
             needed = needed.replace("*", "%")
@@ -4526,6 +5412,19 @@ class EntropySQLRepository(EntropyRepositoryBase):
             return self._cur2tuple(cur)
         return frozenset(cur)
 
+    def searchNameMany(self, names):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        """
+        data = {}
+        rows = self._getPackageIdsRows("""
+        SELECT name, idpackage FROM baseinfo
+        WHERE name IN (%s)
+        """, names)
+        for name, package_id in rows:
+            data.setdefault(name, set()).add(package_id)
+        return dict((k, frozenset(v)) for k, v in data.items())
+
 
     def searchCategory(self, keyword, like = False, just_id = True):
         """
@@ -4670,12 +5569,12 @@ class EntropySQLRepository(EntropyRepositoryBase):
             order_by_string = ' order by %s' % (order_by,)
 
         if order_by == "date":
-            cur = self._cursor().execute("""
+            cur = self._iterCursor().execute("""
             SELECT baseinfo.idpackage FROM baseinfo, extrainfo
             WHERE baseinfo.idpackage = extrainfo.idpackage
             ORDER BY extrainfo.datecreation DESC""")
         else:
-            cur = self._cursor().execute("""
+            cur = self._iterCursor().execute("""
             SELECT idpackage FROM baseinfo""" + order_by_string)
 
         try:
@@ -4813,6 +5712,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         self._cursor().execute("""
         UPDATE baseinfo SET branch = ?
         WHERE idpackage = ?""", (tobranch, package_id,))
+        self._updateChecksum("switchBranch", package_id, tobranch)
         self.clearCache()
 
     def getSetting(self, setting_name):
@@ -4911,7 +5811,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         raise NotImplementedError()
 
-    def exportRepository(self, dumpfile):
+    def exportRepository(self, dumpfile, dump_format = None):
         """
         Not implemented, subclasses must implement this.
         """
@@ -4935,6 +5835,12 @@ class EntropySQLRepository(EntropyRepositoryBase):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        if not do_order:
+            result = self._maintainedChecksum(
+                strict, include_signatures, include_dependencies)
+            if result is not None:
+                return result
+
         cache_key = "checksum_%s_%s_True_%s_%s" % (
             do_order, strict, include_signatures, include_dependencies)
         cached = self._getLiveCache(cache_key)
@@ -4944,7 +5850,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         del cached
 
         package_id_order = ""
-        depenenciesref_order = ""
+        dependenciesref_order = ""
         dependencies_order = ""
         if do_order:
             package_id_order = "order by idpackage"
@@ -5019,6 +5925,137 @@ class EntropySQLRepository(EntropyRepositoryBase):
 
         return result
 
+    def _checksumStamp(self):
+        """
+        Return the consistency stamp stored along with the incrementally
+        maintained checksum digest: the number of packages and the
+        highest package identifier. Writers not maintaining the digest
+        (older Entropy versions, raw SQL) are very likely to change it.
+        """
+        cur = self._cursor().execute("""
+        SELECT COUNT(idpackage), MAX(idpackage) FROM baseinfo
+        """)
+        count, max_package_id = cur.fetchone()
+        return "%d:%d" % (count, max_package_id or 0)
+
+    def _readChecksumDigest(self):
+        """
+        Read the incrementally maintained checksum digest and its
+        consistency stamp from the repository, bypassing any cache.
+
+        @return: tuple composed by digest and stamp, (None, None) if
+            not available
+        @rtype: tuple
+        """
+        try:
+            cur = self._cursor().execute("""
+            SELECT setting_value FROM settings WHERE setting_name = ?
+            LIMIT 1
+            """, (self._CHECKSUM_SETTING,))
+        except Error:
+            return None, None
+
+        value = cur.fetchone()
+        if value is None:
+            return None, None
+        digest, _sep, stamp = value[0].partition("@")
+        return digest, stamp
+
+    def _getChecksumDigest(self):
+        """
+        Return the incrementally maintained checksum digest, or None if
+        the repository does not have one or if its consistency stamp does
+        not match the repository content anymore. Like the content based
+        checksum, the outcome is kept in the live cache, which is discarded
+        on every modification done through this object.
+        """
+        cached = self._getLiveCache("checksumDigest")
+        if cached is not None:
+            return cached or None
+        # avoid memleak with python3.x
+        del cached
+
+        digest, stamp = self._readChecksumDigest()
+        if stamp == self._CHECKSUM_STAMP_HELD:
+            # only valid while held by this object, in the same
+            # transaction
+            if digest != self._checksum_held:
+                digest = None
+        elif digest is not None and stamp != self._checksumStamp():
+            # modified by a writer not maintaining the digest
+            digest = None
+        self._setLiveCache("checksumDigest", digest or "")
+        return digest
+
+    def _holdChecksumStamp(self):
+        """
+        Must be called right before adding or removing packages, which
+        changes the consistency stamp before _updateChecksum() is called.
+        The digest, if still consistent, is marked as held, so that it
+        stays valid for this object until _updateChecksum() writes the
+        new stamp.
+        """
+        bulk = self._bulk_import
+        if bulk is not None and bulk["checksum"] is not None:
+            # the digest lives in memory until bulkImport() ends
+            return
+        digest = self._getChecksumDigest()
+        if digest is None:
+            # _updateChecksum() will seed a new one
+            return
+        self._checksum_held = digest
+        self._setSetting(self._CHECKSUM_SETTING, "%s@%s" % (
+                digest, self._CHECKSUM_STAMP_HELD))
+
+    def _maintainedChecksum(self, strict, include_signatures,
+                            include_dependencies):
+        """
+        Return the repository checksum built from the incrementally
+        maintained digest, or None if not available. This is O(1) and
+        consistent across processes, but unlike the content based checksum
+        it is not equal for two repositories with the same content.
+        """
+        digest = self._getChecksumDigest()
+        if digest is None:
+            return None
+
+        m = hashlib.sha1()
+        m.update(const_convert_to_rawstring("%s|%s|%s|%s" % (
+            digest, strict, include_signatures, include_dependencies)))
+        return m.hexdigest()
+
+    def _updateChecksum(self, *event):
+        """
+        Update the incrementally maintained checksum digest with the given
+        modification event. This must be called by every method altering
+        the metadata covered by checksum().
+        If the repository has no digest yet, it is seeded with the content
+        based checksum.
+        """
+        bulk = self._bulk_import
+        digest = None
+        if bulk is not None:
+            digest = bulk["checksum"]
+        if digest is None:
+            digest = self._getChecksumDigest()
+        if digest is None:
+            digest = self.checksum(strict = True, include_signatures = True,
+                                   include_dependencies = True)
+
+        m = hashlib.sha1()
+        m.update(const_convert_to_rawstring(digest))
+        m.update(const_convert_to_rawstring(repr(event)))
+        if bulk is not None:
+            # written once by bulkImport()
+            bulk["checksum"] = m.hexdigest()
+            return
+        old_checksum = self.checksum(include_dependencies = True)
+        self._setSetting(self._CHECKSUM_SETTING, "%s@%s" % (
+                m.hexdigest(), self._checksumStamp()))
+        self._checksum_held = None
+        self._live_cacher.discard(self._getLiveCacheKey() + "checksum")
+        self._rollReverseDependenciesIndex(old_checksum)
+
     def storeInstalledPackage(self, package_id, repoid, source = 0):
         """
         Reimplemented from EntropySQLRepository.
@@ -5125,6 +6162,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         Reimplemented from EntropyRepositoryBase.
         """
         self._cursor().execute('UPDATE packagesignatures set gpg = NULL')
+        self._updateChecksum("dropGpgSignatures")
 
     def dropAllIndexes(self):
         """
@@ -5145,6 +6183,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
         self._createBaseinfoIndex()
         self._createKeywordsIndex()
         self._createDependenciesIndex()
+        self._createReverseDependenciesIndex()
         self._createProvideIndex()
         self._createConflictsIndex()
         self._createExtrainfoIndex()
@@ -5398,6 +6437,15 @@ class EntropySQLRepository(EntropyRepositoryBase):
         except OperationalError:
             pass
 
+    def _createReverseDependenciesIndex(self):
+        try:
+            self._cursor().execute("""
+            CREATE INDEX reversedependenciesindex_iddependency
+                ON reversedependencies ( iddependency );
+            """)
+        except OperationalError:
+            pass
+
     def _createCountersIndex(self):
         try:
             self._cursor().execute("""
@@ -5533,9 +6581,43 @@ class EntropySQLRepository(EntropyRepositoryBase):
         UPDATE treeupdates SET digest = '-1'
         """)
 
+    def _matchReverseDependencies(self, dependencies):
+        """
+        Match the given dependencies against this repository and return
+        an inverted mapping, from the matched package identifier to the
+        set of dependency identifiers it satisfies.
+
+        @param dependencies: iterable of (iddependency, dependency) tuples
+        @type dependencies: iterable
+        @return: package_id -> set of iddependency mapping
+        @rtype: dict
+        """
+        dep_data = {}
+        for iddep, atom in dependencies:
+
+            if iddep == -1:
+                continue
+
+            if atom.endswith(etpConst['entropyordepquestion']):
+                or_atoms = atom[:-1].split(etpConst['entropyordepsep'])
+            else:
+                or_atoms = (atom,)
+
+            for or_atom in or_atoms:
+                # not safe to use cache here, people messing with multiple
+                # instances can make this crash
+                package_id, rc = self.atomMatch(or_atom, useCache = False)
+                if package_id != -1:
+                    obj = dep_data.setdefault(package_id, set())
+                    obj.add(iddep)
+
+        return dep_data
+
     def _generateReverseDependenciesMetadata(self):
         """
         Reverse dependencies dynamic metadata generation.
+        This is used when the persistent index is not available, for
+        instance, with read-only repositories.
         """
         checksum = self.checksum()
         try:
@@ -5553,7 +6635,7 @@ class EntropySQLRepository(EntropyRepositoryBase):
             hash_str = hash_str.encode("utf-8")
         sha = hashlib.sha1()
         sha.update(hash_str)
-        cache_key = "__generateReverseDependenciesMetadata2_" + \
+        cache_key = "__generateReverseDependenciesMetadata3_" + \
             sha.hexdigest()
         rev_deps_data = self._cacher.pop(cache_key)
         if rev_deps_data is not None:
@@ -5561,28 +6643,8 @@ class EntropySQLRepository(EntropyRepositoryBase):
                 rev_deps_data)
             return rev_deps_data
 
-        dep_data = {}
-        for iddep, atom in self.listAllDependencies():
-
-            if iddep == -1:
-                continue
-
-            if atom.endswith(etpConst['entropyordepquestion']):
-                or_atoms = atom[:-1].split(etpConst['entropyordepsep'])
-                for or_atom in or_atoms:
-                    # not safe to use cache here, people messing with multiple
-                    # instances can make this crash
-                    package_id, rc = self.atomMatch(or_atom, useCache = False)
-                    if package_id != -1:
-                        obj = dep_data.setdefault(iddep, set())
-                        obj.add(package_id)
-            else:
-                # not safe to use cache here, people messing with multiple
-                # instances can make this crash
-                package_id, rc = self.atomMatch(atom, useCache = False)
-                if package_id != -1:
-                    obj = dep_data.setdefault(iddep, set())
-                    obj.add(package_id)
+        dep_data = self._matchReverseDependencies(
+            self.listAllDependencies())
 
         self._setLiveCache("reverseDependenciesMetadata", dep_data)
         try:
@@ -5592,6 +6654,199 @@ class EntropySQLRepository(EntropyRepositoryBase):
             pass
         return dep_data
 
+    def _isReverseDependenciesIndexValid(self):
+        """
+        Return whether the persistent reverse dependencies index
+        (the reversedependencies table) reflects the current
+        repository content.
+        """
+        if not self._doesTableExist("reversedependencies"):
+            return False
+        try:
+            index_checksum = self.getSetting(
+                "reverse_dependencies_checksum")
+        except KeyError:
+            return False
+        return index_checksum == self.checksum(include_dependencies = True)
+
+    def _isReverseDependenciesIndexMaintained(self):
+        """
+        Return whether the persistent reverse dependencies index has been
+        generated and must be kept up-to-date on write.
+        """
+        if not self._doesTableExist("reversedependencies"):
+            return False
+        try:
+            self.getSetting("reverse_dependencies_checksum")
+        except KeyError:
+            return False
+        return True
+
+    def _getReverseDependenciesKeys(self, package_id):
+        """
+        Return the package keys (category/name) through which dependencies
+        can match the given package: its own key and the keys of the
+        (virtual) packages it provides.
+
+        @param package_id: package identifier
+        @type package_id: int
+        @return: set of package keys
+        @rtype: set
+        """
+        # do not use the retrieve* methods, the in-memory cache
+        # could be stale at this point.
+        concat = self._concatOperator(("category", "'/'", "name"))
+        cur = self._cursor().execute("""
+        SELECT %s FROM baseinfo WHERE idpackage = ?
+        """ % (concat,), (package_id,))
+        keys = set(self._cur2tuple(cur))
+
+        cur = self._cursor().execute("""
+        SELECT atom FROM provide WHERE idpackage = ?
+        """, (package_id,))
+        keys.update(entropy.dep.dep_getkey(x) for x in self._cur2tuple(cur))
+        return keys
+
+    def _getDependencyKeys(self, dependency):
+        """
+        Return the package keys (category/name, or just name) that the given
+        dependency string refers to. "Or" dependencies return all the keys.
+
+        @param dependency: dependency string
+        @type dependency: string
+        @return: set of package keys
+        @rtype: set
+        """
+        if dependency.endswith(etpConst['entropyordepquestion']):
+            atoms = dependency[:-1].split(etpConst['entropyordepsep'])
+        else:
+            atoms = (dependency,)
+
+        keys = set()
+        for atom in atoms:
+            atom = entropy.dep.remove_usedeps(atom)
+            atom = entropy.dep.remove_tag(atom)
+            atom = entropy.dep.remove_slot(atom)
+            atom = entropy.dep.remove_entropy_revision(atom)
+            keys.add(entropy.dep.dep_getkey(atom))
+        return keys
+
+    def _updateReverseDependenciesIndex(self, dependency_ids = None,
+                                        keys = None):
+        """
+        Incrementally update the persistent reverse dependencies index,
+        re-matching the given dependencies and all the dependencies
+        referencing the given package keys, instead of regenerating the
+        whole index.
+
+        @keyword dependency_ids: dependency identifiers to re-match
+        @type dependency_ids: iterable
+        @keyword keys: package keys whose dependencies must be re-matched
+        @type keys: iterable
+        """
+        # the modification moved the index checksum forward already, if
+        # the index was valid before it (see
+        # _rollReverseDependenciesIndex()). A stale index is left alone,
+        # it is regenerated on the next lookup.
+        if not self._isReverseDependenciesIndexValid():
+            return
+
+        # atomMatch() is going to be used, make sure that it does not
+        # hit stale in-memory cache.
+        for key in self._REVERSE_DEPENDENCIES_LIVE_CACHE_KEYS:
+            self._clearLiveCache(key)
+
+        dependencies = {}
+        if dependency_ids:
+            dep_ids_str = ', '.join((str(x) for x in set(dependency_ids)))
+            cur = self._cursor().execute("""
+            SELECT iddependency, dependency FROM dependenciesreference
+            WHERE iddependency IN ( %s )""" % (dep_ids_str,))
+            dependencies.update(cur)
+
+        for key in keys or ():
+            name = key.split("/")[-1]
+            cur = self._cursor().execute("""
+            SELECT iddependency, dependency FROM dependenciesreference
+            WHERE dependency LIKE ?""", ("%" + name + "%",))
+            for iddep, dependency in cur:
+                if iddep in dependencies:
+                    continue
+                dep_keys = self._getDependencyKeys(dependency)
+                if key in dep_keys or name in dep_keys:
+                    dependencies[iddep] = dependency
+
+        if dependencies:
+            dep_ids_str = ', '.join((str(x) for x in dependencies))
+            self._cursor().execute("""
+            DELETE FROM reversedependencies
+            WHERE iddependency IN ( %s )""" % (dep_ids_str,))
+
+            dep_data = self._matchReverseDependencies(dependencies.items())
+            self._cursor().executemany("""
+            INSERT INTO reversedependencies VALUES (?, ?)
+            """, ((package_id, iddep) for package_id, dep_ids in \
+                      dep_data.items() for iddep in dep_ids))
+
+    def _rollReverseDependenciesIndex(self, old_checksum):
+        """
+        Move the persistent reverse dependencies index checksum forward
+        after a modification that has been tracked by _updateChecksum(),
+        if the index was valid before it. Modifications affecting reverse
+        dependencies update the index themselves, see
+        _updateReverseDependenciesIndex().
+
+        @param old_checksum: checksum(include_dependencies = True) value
+            before the modification
+        @type old_checksum: string
+        """
+        if not self._isReverseDependenciesIndexMaintained():
+            return
+        if self.getSetting("reverse_dependencies_checksum") != old_checksum:
+            return
+        self._setSetting("reverse_dependencies_checksum",
+            self.checksum(include_dependencies = True))
+
+    def _reverseDependenciesIndex(self):
+        """
+        Make sure that the persistent reverse dependencies index is
+        up-to-date, regenerating it if needed and possible.
+
+        @return: True, if the reversedependencies table can be used for
+            lookups, False if the in-memory metadata must be used instead
+            (read-only repository with a stale or missing index).
+        @rtype: bool
+        """
+        cached = self._getLiveCache("reverseDependenciesIndex")
+        if cached is not None:
+            return cached
+
+        usable = self._isReverseDependenciesIndexValid()
+        if not usable and not self.readonly() and \
+                self._doesTableExist("reversedependencies"):
+            self._regenerateReverseDependenciesIndex()
+            usable = True
+
+        self._setLiveCache("reverseDependenciesIndex", usable)
+        return usable
+
+    def _regenerateReverseDependenciesIndex(self):
+        """
+        Regenerate the persistent reverse dependencies index from scratch.
+        Changes are not committed, this is up to the caller (see
+        release_shared() and release_exclusive()).
+        """
+        checksum = self.checksum(include_dependencies = True)
+        dep_data = self._matchReverseDependencies(
+            self.listAllDependencies())
+
+        self._cursor().execute("DELETE FROM reversedependencies")
+        self._cursor().executemany("""
+        INSERT INTO reversedependencies VALUES (?, ?)
+        """, ((package_id, iddep) for package_id, dep_ids in dep_data.items()
+              for iddep in dep_ids))
+        self._setSetting("reverse_dependencies_checksum", checksum)
+
     def moveSpmUidsToBranch(self, to_branch):
         """
         Reimplemented from EntropyRepositoryBase.
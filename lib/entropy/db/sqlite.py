@@ -14,11 +14,19 @@ import collections
 import errno
 import os
 import hashlib
+import re
+import struct
+import sys
 import time
+import zlib
 try:
     import thread
 except ImportError:
     import _thread as thread
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
 import threading
 import subprocess
 
@@ -35,6 +43,7 @@ from entropy.db.exceptions import Warning, Error, InterfaceError, \
     InternalError, ProgrammingError, NotSupportedError, LockAcquireError
 from entropy.db.sql import EntropySQLRepository, SQLConnectionWrapper, \
     SQLCursorWrapper
+from entropy.db import binarydump
 
 from entropy.i18n import _
 
@@ -133,15 +142,33 @@ class EntropySQLiteRepository(EntropySQLRepository):
 
     # bump this every time schema changes and databaseStructureUpdate
     # should be triggered
-    _SCHEMA_REVISION = 6
+    _SCHEMA_REVISION = 8
+
+    # number of rows inserted at once while importing binary dumps
+    _IMPORT_BATCH_ROWS = 1000
 
     _INSERT_OR_REPLACE = "INSERT OR REPLACE"
     _INSERT_OR_IGNORE = "INSERT OR IGNORE"
     _UPDATE_OR_REPLACE = "UPDATE OR REPLACE"
     _CACHE_SIZE = 8192
 
+    # every connection has its own page cache (_CACHE_SIZE pages),
+    # long-lived threads should use connectionScope()
+    _CONNECTION_POOL_MAX_SIZE = 16
+
+    # bm25() weights of the full-text search index columns:
+    # name, atom, provide, description
+    _SEARCH_INDEX_RANK = "bm25(10.0, 5.0, 2.0, 1.0)"
+
+    # WAL file size (bytes) above which commit() runs a checkpoint
+    _WAL_CHECKPOINT_SIZE = 4 * 1024 * 1024
+
     SETTING_KEYS = ("arch", "on_delete_cascade", "schema_revision",
-        "_baseinfo_extrainfo_2010")
+        "_baseinfo_extrainfo_2010", "content_format")
+
+    # package content metadata formats, see setContentFormat()
+    CONTENT_FORMAT_ROWS = "rows"
+    CONTENT_FORMAT_BLOB = "blob"
 
     class SQLiteProxy(object):
 
@@ -181,7 +208,8 @@ class EntropySQLiteRepository(EntropySQLRepository):
 
     def __init__(self, readOnly = False, dbFile = None, xcache = False,
                  name = None, indexing = True, skipChecks = False,
-                 temporary = False, direct = False, cache_policy = None):
+                 temporary = False, direct = False, cache_policy = None,
+                 readonly_uri = False):
         """
         EntropySQLiteRepository constructor.
 
@@ -204,9 +232,16 @@ class EntropySQLiteRepository(EntropySQLRepository):
         @type direct: bool
         @keyword cache_policy: set the cache policy that should be used
         @type cache_policy: EntropyRepositoryCachePolicies attribute
+        @keyword readonly_uri: if True and readOnly is True, open the
+            database file through a "mode=ro" URI, this way, SQLite
+            itself refuses any write. Locks are still taken, the file
+            can be modified by other processes while open.
+        @type readonly_uri: bool
         """
         self._rwsem_lock = threading.RLock()
         self._rwsem = None
+        self._readonly_uri = False
+        self._wal_enabled = False
 
         self._sqlite = self.ModuleProxy.get()
 
@@ -239,6 +274,20 @@ class EntropySQLiteRepository(EntropySQLRepository):
 
         self._maybeDatabaseSchemaUpdates()
 
+        # schema updates (if any) have been done using a standard
+        # connection, switch to the read-only one now.
+        if readonly_uri and readOnly and self._uriSupported() and \
+                not self._is_memory():
+            self._cleanup_all(_cleanup_main_thread=False)
+            self._readonly_uri = True
+
+    @staticmethod
+    def _uriSupported():
+        """
+        Return whether the sqlite3 module can open URI filenames.
+        """
+        return const_is_python3() and sys.version_info >= (3, 4)
+
     def lock_path(self):
         """
         Overridden from EntropyBaseRepository.
@@ -380,6 +429,21 @@ class EntropySQLiteRepository(EntropySQLRepository):
         c_key = self._cursor_connection_pool_key()
 
         _init_db = False
+        with self._cursor_pool_mutex():
+            cursor_data = self._cursor_pool().get(c_key)
+            if cursor_data is not None:
+                cursor, threads = cursor_data
+                # handle possible thread ident clashing
+                # in the cleanup thread function, because
+                # thread idents are recycled
+                # on thread termination
+                threads.add(current_thread)
+                return cursor
+
+        # the Connection Pool may have to wait for another thread to
+        # release its connection, which requires the Cursor Pool mutex
+        conn = self._connection_impl(_from_cursor=True)
+
         cursor = None
         with self._cursor_pool_mutex():
             threads = set()
@@ -387,14 +451,9 @@ class EntropySQLiteRepository(EntropySQLRepository):
             cursor_data = cursor_pool.get(c_key)
             if cursor_data is not None:
                 cursor, threads = cursor_data
-            # handle possible thread ident clashing
-            # in the cleanup thread function, because
-            # thread idents are recycled
-            # on thread termination
             threads.add(current_thread)
 
             if cursor is None:
-                conn = self._connection_impl(_from_cursor=True)
                 cursor = SQLiteCursorWrapper(
                     conn.cursor(),
                     self.ModuleProxy.exceptions())
@@ -405,6 +464,7 @@ class EntropySQLiteRepository(EntropySQLRepository):
                 # to in-memory value
                 # http://www.sqlite.org/pragma.html#pragma_temp_store
                 cursor.execute("pragma temp_store = 2").fetchall()
+                self._setupJournalMode(cursor)
                 cursor_pool[c_key] = cursor, threads
                 self._start_cleanup_monitor(current_thread, c_key)
                 _init_db = True
@@ -424,7 +484,7 @@ class EntropySQLiteRepository(EntropySQLRepository):
         c_key = self._cursor_connection_pool_key()
 
         conn = None
-        with self._connection_pool_mutex():
+        with self._connection_pool_checkout():
             threads = set()
             connection_pool = self._connection_pool()
             conn_data = connection_pool.get(c_key)
@@ -437,19 +497,42 @@ class EntropySQLiteRepository(EntropySQLRepository):
             threads.add(current_thread)
 
             if conn is None:
-                # check_same_thread still required for
-                # conn.close() called from
-                # arbitrary thread
-                conn = SQLiteConnectionWrapper.connect(
-                    self.ModuleProxy, self._sqlite,
-                    SQLiteConnectionWrapper,
-                    self._db, timeout=300.0,
-                    check_same_thread=False)
+                conn = self._checkoutConnection(self._connect)
                 connection_pool[c_key] = conn, threads
                 if not _from_cursor:
                     self._start_cleanup_monitor(current_thread, c_key)
         return conn
 
+    def _connect(self):
+        """
+        Open a new connection to the database.
+        """
+        if self._readonly_uri:
+            # do not use immutable=1, the file can be replaced or
+            # modified in place by other processes (repository
+            # updates, indexing) while it is open.
+            return SQLiteConnectionWrapper.connect(
+                self.ModuleProxy, self._sqlite,
+                SQLiteConnectionWrapper,
+                "file:%s?mode=ro" % (pathname2url(self._db),),
+                uri=True, timeout=300.0, check_same_thread=False)
+
+        # check_same_thread still required for
+        # conn.close() called from
+        # arbitrary thread
+        return SQLiteConnectionWrapper.connect(
+            self.ModuleProxy, self._sqlite,
+            SQLiteConnectionWrapper,
+            self._db, timeout=300.0,
+            check_same_thread=False)
+
+    def _isConnectionReusable(self):
+        """
+        Reimplemented from EntropySQLRepository.
+        Every in-memory database connection is a different database.
+        """
+        return not self._is_memory()
+
     def _connection(self):
         """
         Reimplemented from EntropySQLRepository.
@@ -493,6 +576,55 @@ class EntropySQLiteRepository(EntropySQLRepository):
         """
         return self._db == ":memory:"
 
+    def _setupJournalMode(self, cursor):
+        """
+        Switch the database to the journal mode set in
+        etpConst['sqlitejournalmode'], if any. Only writable, on-disk,
+        non-temporary repositories are switched, since WAL requires
+        write access to the -wal and -shm files even for readers.
+
+        @param cursor: a newly created cursor
+        @type cursor: SQLiteCursorWrapper
+        """
+        journal_mode = etpConst['sqlitejournalmode']
+        if not journal_mode:
+            return
+        if self._is_memory() or self._readonly_uri or self._temporary:
+            return
+        if self.readonly():
+            return
+
+        try:
+            cur = cursor.execute(
+                "pragma journal_mode = %s" % (journal_mode,))
+            mode = cur.fetchone()
+        except OperationalError:
+            # database is locked by somebody else, keep going
+            # with the current journal mode.
+            return
+
+        self._wal_enabled = bool(mode) and mode[0].lower() == "wal"
+        if self._wal_enabled:
+            cursor.execute("pragma journal_size_limit = %d" % (
+                    self._WAL_CHECKPOINT_SIZE,)).fetchall()
+
+    def _walCheckpoint(self, mode):
+        """
+        Run a WAL checkpoint, if WAL is enabled.
+
+        @param mode: checkpoint mode, either "PASSIVE", "FULL",
+            "RESTART" or "TRUNCATE"
+        @type mode: string
+        """
+        if not self._wal_enabled:
+            return
+        try:
+            self._cursor().execute(
+                "pragma wal_checkpoint(%s)" % (mode,)).fetchall()
+        except OperationalError:
+            # readers are still active, checkpoint later.
+            pass
+
     def _setDefaultCacheSize(self, size):
         """
         Change default low-level, storage engine based cache size.
@@ -676,6 +808,22 @@ class EntropySQLiteRepository(EntropySQLRepository):
 
         self._release_reslock(opaque, True)
 
+    def commit(self, force = False, no_plugins = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        Needs to call superclass method.
+        """
+        super(EntropySQLiteRepository, self).commit(
+            force = force, no_plugins = no_plugins)
+
+        if self._wal_enabled:
+            try:
+                wal_size = os.path.getsize(self._db + "-wal")
+            except (OSError, IOError):
+                wal_size = 0
+            if wal_size > self._WAL_CHECKPOINT_SIZE:
+                self._walCheckpoint("PASSIVE")
+
     def close(self, safe=False):
         """
         Reimplemented from EntropySQLRepository.
@@ -683,6 +831,9 @@ class EntropySQLiteRepository(EntropySQLRepository):
         """
         super(EntropySQLiteRepository, self).close(safe=safe)
 
+        if not safe:
+            self._walCheckpoint("TRUNCATE")
+        self._wal_enabled = False
         self._cleanup_all(_cleanup_main_thread=not safe)
         if self._temporary and (not self._is_memory()) and \
             os.path.isfile(self._db):
@@ -779,6 +930,23 @@ class EntropySQLiteRepository(EntropySQLRepository):
                 DELETE FROM packagedownloads WHERE idpackage = (?)""",
                 (package_id,))
 
+            # Added on Oct. 2026
+            if self._doesTableExist("reversedependencies"):
+                self._cursor().execute("""
+                DELETE FROM reversedependencies WHERE idpackage = (?)""",
+                (package_id,))
+            if self._doesTableExist("contentblobs"):
+                self._cursor().execute("""
+                DELETE FROM contentblobs WHERE idpackage = (?)""",
+                (package_id,))
+                self._cursor().execute("""
+                DELETE FROM contentpaths WHERE idpackage = (?)""",
+                (package_id,))
+            if self._doesTableExist("contentdirs"):
+                self._cursor().execute("""
+                DELETE FROM contentdirs WHERE idpackage = (?)""",
+                (package_id,))
+
             # Added on Sept. 2014
             if self._doesTableExist("needed_libs"):
                 self._cursor().execute(
@@ -811,24 +979,54 @@ class EntropySQLiteRepository(EntropySQLRepository):
         self._clearLiveCache("getStrictData")
         return super(EntropySQLiteRepository, self)._addCategory(category)
 
-    def setCategory(self, package_id, category):
+    def _setCategory(self, package_id, category):
         """
         Reimplemented from EntropySQLRepository.
-        We must handle _baseinfo_extrainfo_2010 and live cache.
+        We must handle _baseinfo_extrainfo_2010.
         """
         if self._isBaseinfoExtrainfo2010():
-            self._cursor().execute("""
-            UPDATE baseinfo SET category = (?) WHERE idpackage = (?)
-            """, (category, package_id,))
-        else:
-            # create new category if it doesn't exist
-            catid = self._isCategoryAvailable(category)
-            if catid == -1:
-                # create category
-                catid = self._addCategory(category)
-            self._cursor().execute("""
-            UPDATE baseinfo SET idcategory = (?) WHERE idpackage = (?)
-            """, (catid, package_id,))
+            return super(EntropySQLiteRepository, self)._setCategory(
+                package_id, category)
+
+        # create new category if it doesn't exist
+        catid = self._isCategoryAvailable(category)
+        if catid == -1:
+            # create category
+            catid = self._addCategory(category)
+        self._cursor().execute("""
+        UPDATE baseinfo SET idcategory = (?) WHERE idpackage = (?)
+        """, (catid, package_id,))
+
+    def _getReverseDependenciesKeys(self, package_id):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle _baseinfo_extrainfo_2010.
+        """
+        if self._isBaseinfoExtrainfo2010():
+            return super(EntropySQLiteRepository,
+                         self)._getReverseDependenciesKeys(package_id)
+
+        cur = self._cursor().execute("""
+        SELECT categories.category || '/' || baseinfo.name
+        FROM baseinfo, categories
+        WHERE baseinfo.idpackage = ?
+        AND baseinfo.idcategory = categories.idcategory
+        """, (package_id,))
+        keys = set(self._cur2tuple(cur))
+
+        cur = self._cursor().execute("""
+        SELECT atom FROM provide WHERE idpackage = ?
+        """, (package_id,))
+        keys.update(entropy.dep.dep_getkey(x) for x in self._cur2tuple(cur))
+        return keys
+
+    def setCategory(self, package_id, category):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle live cache.
+        """
+        super(EntropySQLiteRepository, self).setCategory(
+            package_id, category)
 
         self._clearLiveCache("retrieveCategory")
         self._clearLiveCache("searchNameCategory")
@@ -983,6 +1181,106 @@ class EntropySQLiteRepository(EntropySQLRepository):
                 raise
             return tuple()
 
+    # SQLite refuses to attach more than 10 databases by default
+    _MAX_ATTACHED_DATABASES = 8
+    # seconds, this connection may wait for a writer in the same thread
+    _READ_ONLY_CONNECTION_TIMEOUT = 5.0
+
+    def searchKeySlotCandidates(self, repositories):
+        """
+        Reimplemented from EntropyRepositoryBase.
+        On-disk SQLite repositories are attached to a dedicated, short
+        lived, connection to this one and joined on category, name and
+        slot. The shared connections are left untouched, since ATTACH and
+        DETACH cannot run inside an open transaction. Uncommitted changes
+        to this repository are not visible.
+        """
+        use_join = not self._is_memory()
+        for repo in repositories.values():
+            if not isinstance(repo, EntropySQLiteRepository) or \
+                    repo._is_memory():
+                use_join = False
+                break
+        if not use_join:
+            return super(EntropySQLiteRepository,
+                         self).searchKeySlotCandidates(repositories)
+
+        try:
+            return self._searchKeySlotCandidatesJoin(repositories)
+        except OperationalError as err:
+            # locked by a writer, for instance
+            const_debug_write(
+                __name__,
+                "searchKeySlotCandidates: join failed: %s" % (err,))
+            return super(EntropySQLiteRepository,
+                         self).searchKeySlotCandidates(repositories)
+
+    def _searchKeySlotCandidatesJoin(self, repositories):
+        """
+        searchKeySlotCandidates() implementation joining the given
+        repositories, attached to a dedicated connection.
+        """
+        candidates = {}
+        conn = self._readOnlyConnection(self._db)
+        try:
+            cur = SQLiteCursorWrapper(
+                conn.cursor(), self.ModuleProxy.exceptions())
+            items = sorted(repositories.items())
+            for idx in range(0, len(items), self._MAX_ATTACHED_DATABASES):
+                attached = []
+                for repository_id, repo in \
+                        items[idx:idx + self._MAX_ATTACHED_DATABASES]:
+                    alias = "candidates%d" % (len(attached),)
+                    cur.execute("ATTACH DATABASE ? AS %s" % (alias,),
+                                (repo._db,))
+                    attached.append((repository_id, alias))
+
+                for repository_id, alias in attached:
+                    rows = cur.execute("""
+                    SELECT main.baseinfo.idpackage, candidate.idpackage,
+                        candidate.version, candidate.versiontag,
+                        candidate.revision
+                    FROM main.baseinfo, %s.baseinfo AS candidate
+                    WHERE candidate.name = main.baseinfo.name
+                    AND candidate.category = main.baseinfo.category
+                    AND candidate.slot = main.baseinfo.slot
+                    """ % (alias,))
+                    for package_id, c_package_id, version, tag, \
+                            revision in rows:
+                        candidates.setdefault(package_id, []).append(
+                            (repository_id, c_package_id, version, tag,
+                             revision))
+
+                for _repository_id, alias in attached:
+                    cur.execute("DETACH DATABASE %s" % (alias,))
+        finally:
+            # this also detaches everything
+            conn.close()
+
+        return candidates
+
+    def _readOnlyConnection(self, path):
+        """
+        Open a new connection, not bound to any thread nor shared, to the
+        given SQLite database file. If supported, the file is opened
+        read-only. The caller must close it.
+
+        @param path: path to the database file
+        @type path: string
+        @return: the connection
+        @rtype: SQLiteConnectionWrapper
+        """
+        if self._uriSupported():
+            return SQLiteConnectionWrapper.connect(
+                self.ModuleProxy, self._sqlite,
+                SQLiteConnectionWrapper,
+                "file:%s?mode=ro" % (pathname2url(path),),
+                uri=True, timeout=self._READ_ONLY_CONNECTION_TIMEOUT)
+        return SQLiteConnectionWrapper.connect(
+            self.ModuleProxy, self._sqlite,
+            SQLiteConnectionWrapper, path,
+            timeout=self._READ_ONLY_CONNECTION_TIMEOUT)
+
     def _bindSpmPackageUid(self, package_id, spm_package_uid, branch):
         """
         Reimplemented from EntropySQLRepository.
@@ -1082,6 +1380,22 @@ class EntropySQLiteRepository(EntropySQLRepository):
         del cached
         return obj
 
+    def getStrictDataMany(self, package_ids):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must use the in-memory cache to do some memoization.
+        """
+        if self.directed() or self.cache_policy_none():
+            return super(EntropySQLiteRepository, self).getStrictDataMany(
+                package_ids)
+
+        data = {}
+        for package_id in package_ids:
+            strict_data = self.getStrictData(package_id)
+            if strict_data is not None:
+                data[package_id] = strict_data
+        return data
+
     def getStrictScopeData(self, package_id):
         """
         Reimplemented from EntropySQLRepository.
@@ -1284,6 +1598,22 @@ class EntropySQLiteRepository(EntropySQLRepository):
         del cached
         return obj
 
+    def retrieveKeySlotMany(self, package_ids):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must use the in-memory cache to do some memoization.
+        """
+        if self.directed() or self.cache_policy_none():
+            return super(EntropySQLiteRepository, self).retrieveKeySlotMany(
+                package_ids)
+
+        data = {}
+        for package_id in package_ids:
+            key_slot = self.retrieveKeySlot(package_id)
+            if key_slot is not None:
+                data[package_id] = key_slot
+        return data
+
     def retrieveKeySlotAggregated(self, package_id):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -1510,6 +1840,472 @@ class EntropySQLiteRepository(EntropySQLRepository):
                 raise
             return iter([])
 
+    def contentFormat(self):
+        """
+        Return the format used to store package content metadata:
+        CONTENT_FORMAT_ROWS (the content table, one row per file) or
+        CONTENT_FORMAT_BLOB (one compressed, prefix-shared, blob per
+        package, see setContentFormat()).
+
+        @return: the content format
+        @rtype: string
+        """
+        try:
+            return self.getSetting("content_format")
+        except KeyError:
+            return self.CONTENT_FORMAT_ROWS
+
+    def _isContentBlob(self):
+        """
+        Return whether package content metadata is stored as blobs.
+        """
+        return self.contentFormat() == self.CONTENT_FORMAT_BLOB
+
+    def setContentFormat(self, content_format):
+        """
+        Set the format used to store package content metadata, converting
+        the already stored metadata.
+        CONTENT_FORMAT_BLOB stores the file list of each package as a single
+        compressed blob (the contentblobs table), using much less space than
+        CONTENT_FORMAT_ROWS and making insertContent() faster. File ownership
+        lookups (isFileAvailable(), searchBelongs()) use a path digest
+        index (the contentpaths table).
+        The format can also be requested through the ETP_SQLITE_CONTENT_FORMAT
+        environment variable, in which case the repository is converted
+        during the schema updates.
+
+        @param content_format: CONTENT_FORMAT_ROWS or CONTENT_FORMAT_BLOB
+        @type content_format: string
+        @raise AttributeError: if content_format is invalid
+        """
+        if content_format not in (self.CONTENT_FORMAT_ROWS,
+                                  self.CONTENT_FORMAT_BLOB):
+            raise AttributeError("invalid content_format argument")
+
+        current_format = self.contentFormat()
+        if content_format == current_format:
+            return
+
+        if content_format == self.CONTENT_FORMAT_BLOB:
+            if not self._doesTableExist("contentblobs"):
+                self._createContentBlobsTable()
+            # one package at a time, the content table can be huge
+            for package_id in self.listAllPackageIds():
+                cur = self._cursor().execute("""
+                SELECT file, type FROM content WHERE idpackage = ?
+                """, (package_id,))
+                self._insertContentBlob(package_id, cur.fetchall())
+            self._cursor().execute("DELETE FROM content")
+        else:
+            for package_id in self.listAllPackageIds():
+                self._cursor().executemany("""
+                INSERT INTO content VALUES (?, ?, ?)
+                """, [(package_id, path, ftype) for path, ftype
+                      in self._retrieveContentBlob(package_id)])
+            self._cursor().executescript("""
+            DROP TABLE IF EXISTS contentblobs;
+            DROP TABLE IF EXISTS contentpaths;
+            """)
+            self._clearLiveCache("_doesTableExist")
+            self._clearLiveCache("_doesColumnInTableExist")
+
+        self._setSetting("content_format", content_format)
+        self.commit()
+
+    @staticmethod
+    def _contentPathHash(path):
+        """
+        Return the 64bit digest of a (unicode) path used by the
+        contentpaths index. Collisions are negligible at the scale of a
+        repository, so the digest is trusted as path identity.
+        """
+        return struct.unpack(
+            ">q", hashlib.md5(path.encode("utf-8")).digest()[:8])[0]
+
+    @staticmethod
+    def _encodeContentBlob(content):
+        """
+        Encode a list of (path, type) tuples into a blob.
+        Paths are sorted and stored as the length of the prefix shared with
+        the previous path plus the remaining suffix, the result is then
+        compressed.
+        """
+        items = []
+        previous = ""
+        previous_dir = ""
+        for path, ftype in sorted(content):
+            # consecutive paths usually share the whole directory
+            if previous_dir and path.startswith(previous_dir):
+                shared = len(previous_dir)
+            else:
+                shared = len(os.path.commonprefix((previous, path)))
+            items.append("%d\0%s\0%s" % (shared, path[shared:], ftype))
+            previous = path
+            previous_dir = path[:path.rfind("/") + 1]
+        data = const_convert_to_unicode("\0".join(items))
+        return zlib.compress(data.encode("utf-8"), 6)
+
+    @staticmethod
+    def _decodeContentBlob(blob):
+        """
+        Decode a blob generated by _encodeContentBlob() into a list of
+        (path, type) tuples, sorted by path.
+        """
+        data = zlib.decompress(blob)
+        if not data:
+            return []
+        fields = data.decode("utf-8").split("\0")
+        content = []
+        previous = ""
+        for idx in range(0, len(fields), 3):
+            shared, suffix, ftype = fields[idx:idx + 3]
+            previous = previous[:int(shared)] + suffix
+            content.append((previous, ftype))
+        return content
+
+    def _insertContentBlob(self, package_id, content):
+        """
+        Store the given list of (path, type) tuples as package content
+        blob, updating the contentpaths index.
+        """
+        # paths are raw or unicode strings, avoid the generic (and slow)
+        # const_convert_to_unicode()
+        text = type(const_convert_to_unicode(""))
+        content = [
+            (x if isinstance(x, text) else x.decode("utf-8"),
+             y if isinstance(y, text) else y.decode("utf-8"))
+            for x, y in content]
+        buf = const_get_buffer()
+        self._cursor().execute("""
+        %s INTO contentblobs VALUES (?, ?)
+        """ % (self._INSERT_OR_REPLACE,),
+            (package_id, buf(self._encodeContentBlob(content)),))
+        self._cursor().execute("""
+        DELETE FROM contentpaths WHERE idpackage = ?
+        """, (package_id,))
+        # sorted digests make the index updates sequential
+        path_hash = self._contentPathHash
+        hashes = sorted(set(path_hash(x) for x, _y in content))
+        self._cursor().executemany("""
+        INSERT INTO contentpaths VALUES (?, ?)
+        """, [(package_id, x) for x in hashes])
+
+    def _retrieveContentBlob(self, package_id):
+        """
+        Return the list of (path, type) tuples stored in the package
+        content blob, sorted by path.
+        """
+        cur = self._cursor().execute("""
+        SELECT data FROM contentblobs WHERE idpackage = ? LIMIT 1
+        """, (package_id,))
+        blob = cur.fetchone()
+        if blob is None:
+            return []
+        return self._decodeContentBlob(blob[0])
+
+    def insertContent(self, package_id, content, already_formatted = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle the blob content format.
+        """
+        directory = self._contentDirectory
+        directories = set()
+        if already_formatted:
+            # collect the directories while content is consumed, it
+            # can be an iterator
+            def _content_iter(_content):
+                for item in _content:
+                    directories.add(directory(item[1]))
+                    yield item
+            content = _content_iter(content)
+        else:
+            directories.update(directory(x) for x in content)
+
+        if not self._isContentBlob():
+            super(EntropySQLiteRepository, self).insertContent(
+                package_id, content, already_formatted = already_formatted)
+        elif already_formatted:
+            self._insertContentBlob(
+                package_id, [(x, y) for _pkg_id, x, y in content])
+        else:
+            self._insertContentBlob(
+                package_id, [(x, content[x]) for x in content])
+
+        if self._doesTableExist("contentdirs"):
+            self._cursor().executemany("""
+            %s INTO contentdirs VALUES (?, ?)
+            """ % (self._INSERT_OR_IGNORE,),
+                [(x, package_id) for x in directories])
+
+    def retrieveContent(self, package_id, extended = False,
+        formatted = False, insert_formatted = False, order_by = None):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle the blob content format.
+        """
+        if not self._isContentBlob():
+            return super(EntropySQLiteRepository, self).retrieveContent(
+                package_id, extended = extended, formatted = formatted,
+                insert_formatted = insert_formatted, order_by = order_by)
+
+        if order_by is not None:
+            if order_by not in ("package_id", "idpackage", "file", "type",):
+                raise AttributeError("invalid order_by argument")
+
+        content = self._retrieveContentBlob(package_id)
+        if order_by == "type":
+            content.sort(key = lambda x: x[1])
+
+        if extended and insert_formatted:
+            return tuple((package_id, x, y) for x, y in content)
+        elif extended and formatted:
+            return dict(content)
+        elif extended:
+            return tuple(content)
+        elif order_by:
+            return tuple(x for x, _y in content)
+        return frozenset(x for x, _y in content)
+
+    def retrieveContentIter(self, package_id, order_by = None,
+                            reverse = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle the blob content format.
+        """
+        if not self._isContentBlob():
+            return super(EntropySQLiteRepository, self).retrieveContentIter(
+                package_id, order_by = order_by, reverse = reverse)
+
+        if order_by is not None:
+            if order_by not in ("package_id", "idpackage", "file", "type",):
+                raise AttributeError("invalid order_by argument")
+
+        content = self._retrieveContentBlob(package_id)
+        if order_by == "type":
+            content.sort(key = lambda x: x[1])
+        if order_by is not None and reverse:
+            content.reverse()
+        return iter(content)
+
+    def contentDiff(self, package_id, dbconn, dbconn_package_id,
+                    extended = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle the blob content format.
+        """
+        if not self._isContentBlob():
+            return super(EntropySQLiteRepository, self).contentDiff(
+                package_id, dbconn, dbconn_package_id, extended = extended)
+
+        other_content = frozenset(
+            x for x, _y in dbconn.retrieveContentIter(dbconn_package_id))
+        content = [(x, y) for x, y in self._retrieveContentBlob(package_id)
+                   if x not in other_content]
+        if extended:
+            return tuple(content)
+        return frozenset(x for x, _y in content)
+
+    def isFileAvailable(self, path, get_id = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle the blob content format.
+        """
+        if not self._isContentBlob():
+            return super(EntropySQLiteRepository, self).isFileAvailable(
+                path, get_id = get_id)
+
+        cur = self._cursor().execute("""
+        SELECT idpackage FROM contentpaths WHERE hash = ?
+        """, (self._contentPathHash(const_convert_to_unicode(path)),))
+        result = self._cur2frozenset(cur)
+        if get_id:
+            return result
+        elif result:
+            return True
+        return False
+
+    @staticmethod
+    def _contentDirectory(path):
+        """
+        Return the directory key of a path in the contentdirs index.
+        """
+        idx = path.rfind("/")
+        if idx > 0:
+            return path[:idx]
+        elif idx == 0:
+            return "/"
+        return ""
+
+    @staticmethod
+    def _prefixRange(prefix):
+        """
+        Return the (lower, upper) bounds of the strings starting with the
+        given (non empty) prefix.
+        """
+        prefix = const_convert_to_unicode(prefix)
+        if const_is_python3():
+            next_char = chr(ord(prefix[-1]) + 1)
+        else:
+            next_char = unichr(ord(prefix[-1]) + 1)
+        return prefix, prefix[:-1] + next_char
+
+    def _searchContentDirs(self, pattern, glob = False):
+        """
+        Return the identifiers of the packages that may own files matching
+        the given LIKE (or GLOB) pattern, using the contentdirs index.
+        None is returned if the pattern has no literal directory prefix.
+        """
+        prefix = self._patternPrefix(pattern, glob = glob)
+        if "/" not in prefix:
+            return None
+
+        # a matching path either lives in the directory of the prefix or
+        # in a directory starting with the prefix. Explicit ranges are
+        # used because SQLite does not optimize LIKE and GLOB with bound
+        # parameters.
+        directory = self._contentDirectory(prefix)
+        if glob:
+            cur = self._cursor().execute("""
+            SELECT idpackage FROM contentdirs
+            WHERE directory = ? OR (directory >= ? AND directory < ?)
+            """, (directory,) + self._prefixRange(prefix))
+        else:
+            # NOCASE only folds ASCII characters, the range is a superset
+            # of the matching directories.
+            prefix = "".join(
+                x.lower() if "A" <= x <= "Z" else x for x in prefix)
+            cur = self._cursor().execute("""
+            SELECT idpackage FROM contentdirs
+            WHERE directory = ? COLLATE NOCASE OR (
+                directory >= ? COLLATE NOCASE AND
+                directory < ? COLLATE NOCASE)
+            """, (directory,) + self._prefixRange(prefix))
+        return self._cur2frozenset(cur)
+
+    def _filterBelongs(self, package_ids, pattern, glob = False):
+        """
+        Return the identifiers of the given packages owning files matching
+        the given LIKE (or GLOB) pattern.
+        """
+        if not package_ids:
+            return frozenset()
+
+        if self._isContentBlob():
+            regex = self._patternRegex(pattern, glob = glob)
+            rows = self._getPackageIdsRows("""
+            SELECT idpackage, data FROM contentblobs WHERE idpackage IN (%s)
+            """, package_ids)
+            return frozenset(
+                package_id for package_id, blob in rows if
+                any(regex.match(x) for x, _y in
+                    self._decodeContentBlob(blob)))
+
+        operator = "LIKE"
+        if glob:
+            operator = "GLOB"
+        rows = self._getPackageIdsRows("""
+        SELECT DISTINCT idpackage FROM content
+        WHERE idpackage IN (%%s) AND file %s ?
+        """ % (operator,), package_ids, args = (pattern,))
+        return frozenset(x for x, in rows)
+
+    def searchBelongs(self, bfile, like = False, glob = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle the blob content format.
+        Patterns are resolved through the contentdirs index, if available.
+        """
+        if (like or glob) and self._doesTableExist("contentdirs"):
+            package_ids = self._searchContentDirs(bfile, glob = glob)
+            if package_ids is not None:
+                return self._filterBelongs(package_ids, bfile, glob = glob)
+
+        if not self._isContentBlob():
+            return super(EntropySQLiteRepository, self).searchBelongs(
+                bfile, like = like, glob = glob)
+
+        if not (like or glob):
+            cur = self._cursor().execute("""
+            SELECT contentpaths.idpackage FROM contentpaths, baseinfo
+            WHERE contentpaths.hash = ?
+            AND contentpaths.idpackage = baseinfo.idpackage
+            """, (self._contentPathHash(const_convert_to_unicode(bfile)),))
+            return self._cur2frozenset(cur)
+
+        regex = self._patternRegex(bfile, glob = glob)
+        cur = self._cursor().execute("""
+        SELECT contentblobs.idpackage, contentblobs.data
+        FROM contentblobs, baseinfo
+        WHERE contentblobs.idpackage = baseinfo.idpackage
+        """)
+        package_ids = set()
+        for package_id, blob in cur:
+            for path, _ftype in self._decodeContentBlob(blob):
+                if regex.match(path):
+                    package_ids.add(package_id)
+                    break
+        return frozenset(package_ids)
+
+    def searchBelongsDirectory(self, directory, recursive = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        Use the contentdirs index, if available.
+        """
+        if not self._doesTableExist("contentdirs"):
+            return super(EntropySQLiteRepository,
+                         self).searchBelongsDirectory(
+                directory, recursive = recursive)
+
+        directory = directory.rstrip("/") or "/"
+        if not recursive:
+            cur = self._cursor().execute("""
+            SELECT idpackage FROM contentdirs WHERE directory = ?
+            """, (directory,))
+            return self._cur2frozenset(cur)
+
+        cur = self._cursor().execute("""
+        SELECT idpackage FROM contentdirs
+        WHERE directory = ? OR (directory >= ? AND directory < ?)
+        """, (directory,) + self._prefixRange(directory.rstrip("/") + "/"))
+        return self._cur2frozenset(cur)
+
+    def listAllFiles(self, clean = False, count = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle the blob content format.
+        """
+        if not self._isContentBlob():
+            return super(EntropySQLiteRepository, self).listAllFiles(
+                clean = clean, count = count)
+
+        if count:
+            cur = self._cursor().execute("""
+            SELECT count(*) FROM contentpaths LIMIT 1
+            """)
+            return cur.fetchone()[0]
+
+        cur = self._cursor().execute("SELECT data FROM contentblobs")
+        files = []
+        for blob, in cur:
+            files.extend(x for x, _y in self._decodeContentBlob(blob))
+        if clean:
+            return frozenset(files)
+        return tuple(files)
+
+    def dropContent(self):
+        """
+        Reimplemented from EntropySQLRepository.
+        We must handle the blob content format and the directory index.
+        """
+        if self._doesTableExist("contentblobs"):
+            self._cursor().executescript("""
+            DELETE FROM contentblobs;
+            DELETE FROM contentpaths;
+            """)
+        if self._doesTableExist("contentdirs"):
+            self._cursor().execute("DELETE FROM contentdirs")
+        super(EntropySQLiteRepository, self).dropContent()
+
     def retrieveChangelog(self, package_id):
         """
         Reimplemented from EntropySQLRepository.
@@ -1632,6 +2428,139 @@ class EntropySQLiteRepository(EntropySQLRepository):
             flags = ("N/A", "N/A", "N/A")
         return flags
 
+    def _isSearchIndexValid(self):
+        """
+        Return whether the full-text search index exists and is in sync
+        with the repository content.
+        """
+        if not self._doesTableExist("packagesearch"):
+            return False
+        try:
+            index_checksum = self.getSetting("search_index_checksum")
+        except KeyError:
+            return False
+        return index_checksum == self.checksum()
+
+    def _searchIndexMatch(self, keyword):
+        """
+        Convert a search keyword into a full-text search index phrase,
+        matching the keyword tokens as prefix. Return None if the
+        keyword does not contain any indexable token.
+        """
+        tokens = re.findall(r"[^\W_]+", const_convert_to_unicode(keyword),
+                            re.UNICODE)
+        if not tokens:
+            return None
+        return '"%s"*' % (" ".join(tokens),)
+
+    def searchPackages(self, keyword, sensitive = False, slot = None,
+            tag = None, order_by = None, just_id = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        Use the full-text search index, if available. Results are ranked
+        by relevance, unless order_by is given.
+        """
+        match = None
+        if not sensitive and self._isSearchIndexValid():
+            match = self._searchIndexMatch(keyword)
+        if match is None:
+            return super(EntropySQLiteRepository, self).searchPackages(
+                keyword, sensitive = sensitive, slot = slot, tag = tag,
+                order_by = order_by, just_id = just_id)
+
+        searchkeywords = ("{atom provide} : " + match,)
+
+        slotstring = ''
+        if slot:
+            searchkeywords += (slot,)
+            slotstring = ' AND baseinfo.slot = ?'
+
+        tagstring = ''
+        if tag:
+            searchkeywords += (tag,)
+            tagstring = ' AND baseinfo.versiontag = ?'
+
+        order_by_string = ' ORDER BY packagesearch.rank'
+        if order_by is not None:
+            valid_order_by = ("atom", "idpackage", "package_id", "branch",
+                "name", "version", "versiontag", "revision", "slot")
+            if order_by not in valid_order_by:
+                raise AttributeError("invalid order_by argument")
+            if order_by == "package_id":
+                order_by = "idpackage"
+            order_by_string = ' ORDER BY baseinfo.%s' % (order_by,)
+
+        search_elements = 'baseinfo.atom, baseinfo.idpackage, baseinfo.branch'
+        if just_id:
+            search_elements = 'baseinfo.idpackage'
+
+        cur = self._cursor().execute("""
+        SELECT %s FROM packagesearch, baseinfo
+        WHERE packagesearch MATCH ?
+        AND baseinfo.idpackage = packagesearch.rowid %s %s %s
+        """ % (search_elements, slotstring, tagstring, order_by_string),
+        searchkeywords)
+
+        if just_id:
+            return self._cur2tuple(cur)
+        return tuple(cur)
+
+    def searchDescription(self, keyword, just_id = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        Use the full-text search index, if available.
+        """
+        matches = None
+        if self._isSearchIndexValid():
+            matches = [self._searchIndexMatch(x) for x in keyword.split()]
+        if not matches or None in matches:
+            return super(EntropySQLiteRepository, self).searchDescription(
+                keyword, just_id = just_id)
+
+        search_elements = 'baseinfo.atom, baseinfo.idpackage'
+        if just_id:
+            search_elements = 'baseinfo.idpackage'
+
+        cur = self._cursor().execute("""
+        SELECT %s FROM packagesearch, baseinfo
+        WHERE packagesearch MATCH ?
+        AND baseinfo.idpackage = packagesearch.rowid
+        """ % (search_elements,),
+        ("description : (%s)" % (" AND ".join(matches),),))
+
+        if just_id:
+            return self._cur2frozenset(cur)
+        return frozenset(cur)
+
+    def searchName(self, keyword, sensitive = False, just_id = False):
+        """
+        Reimplemented from EntropySQLRepository.
+        Use the full-text search index, if available.
+        """
+        match = None
+        if not sensitive and self._isSearchIndexValid():
+            match = self._searchIndexMatch(keyword)
+        if match is None:
+            return super(EntropySQLiteRepository, self).searchName(
+                keyword, sensitive = sensitive, just_id = just_id)
+
+        atomstring = ''
+        if not just_id:
+            atomstring = 'baseinfo.atom,'
+
+        # the index is used to skim the candidates, the name must
+        # still match exactly.
+        cur = self._cursor().execute("""
+        SELECT %s baseinfo.idpackage FROM packagesearch, baseinfo
+        WHERE packagesearch MATCH ?
+        AND baseinfo.idpackage = packagesearch.rowid
+        AND LOWER(baseinfo.name) = ?
+        """ % (atomstring,), ("name : " + match, keyword.lower(),))
+
+        if just_id:
+            return self._cur2tuple(cur)
+        return frozenset(cur)
+
     def searchLicense(self, keyword, just_id = False):
         """
         Reimplemented from EntropySQLRepository.
@@ -1919,7 +2848,8 @@ class EntropySQLiteRepository(EntropySQLRepository):
                 current_schema_rev = -1
 
             if current_schema_rev == EntropySQLiteRepository._SCHEMA_REVISION \
-                    and not os.getenv("ETP_REPO_SCHEMA_UPDATE"):
+                    and not os.getenv("ETP_REPO_SCHEMA_UPDATE") \
+                    and not self._isContentFormatMigrationRequired():
                 return False
             return True
 
@@ -2000,6 +2930,16 @@ class EntropySQLiteRepository(EntropySQLRepository):
         if not self._doesColumnInTableExist("preserved_libs", "atom"):
             self._createPreservedLibsAtomColumn()
 
+        # added on Oct. 2026
+        if not self._doesTableExist("reversedependencies"):
+            self._createReverseDependenciesTable()
+        if not self._doesTableExist("contentdirs"):
+            self._createContentDirsTable()
+
+        # added on Oct. 2026
+        if not old_readonly and self._isContentFormatMigrationRequired():
+            self.setContentFormat(etpConst['sqlitecontentformat'])
+
         # added on Sept. 2014, keep forever? ;-)
         self._migrateNeededLibs()
 
@@ -2018,6 +2958,16 @@ class EntropySQLiteRepository(EntropySQLRepository):
                 EntropySQLiteRepository._SCHEMA_REVISION)
             self._connection().commit()
 
+    def _isContentFormatMigrationRequired(self):
+        """
+        Return whether the content format requested through
+        ETP_SQLITE_CONTENT_FORMAT differs from the one in use.
+        """
+        content_format = etpConst['sqlitecontentformat']
+        if not content_format or self._readonly:
+            return False
+        return content_format != self.contentFormat()
+
     def integrity_check(self):
         """
         Reimplemented from EntropyRepositoryBase.
@@ -2035,6 +2985,7 @@ class EntropySQLiteRepository(EntropySQLRepository):
     def importRepository(dumpfile, db, data = None):
         """
         Reimplemented from EntropyRepositoryBase.
+        Binary dumps are loaded directly, SQL dumps through /usr/bin/sqlite3.
         @todo: remove /usr/bin/sqlite3 dependency
         """
         dbfile = os.path.realpath(db)
@@ -2044,6 +2995,14 @@ class EntropySQLiteRepository(EntropySQLRepository):
             raise AttributeError("dbfile value is invalid")
         if not entropy.tools.is_valid_path_string(dumpfile):
             raise AttributeError("dumpfile value is invalid")
+
+        if binarydump.is_binary_dump(dumpfile):
+            rc = EntropySQLiteRepository._importBinaryRepository(
+                dumpfile, tmp_dbfile)
+            if rc == 0:
+                os.rename(tmp_dbfile, dbfile)
+            return rc
+
         with open(dumpfile, "rb") as in_f:
             try:
                 proc = subprocess.Popen(("/usr/bin/sqlite3", tmp_dbfile,),
@@ -2056,32 +3015,157 @@ class EntropySQLiteRepository(EntropySQLRepository):
                 os.rename(tmp_dbfile, dbfile)
         return rc
 
-    def exportRepository(self, dumpfile):
+    @staticmethod
+    def _importBinaryRepository(dumpfile, dbfile):
+        """
+        Load a binary repository dump (see entropy.db.binarydump) into a
+        new SQLite3 database file. Rows are inserted in batches, memory
+        usage does not depend on the dump size.
+
+        @param dumpfile: path to binary dump file
+        @type dumpfile: string
+        @param dbfile: path to the SQLite3 database file to create
+        @type dbfile: string
+        @return: import return code (0 = OK)
+        @rtype: int
+        """
+        try:
+            os.remove(dbfile)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+
+        dbapi2 = EntropySQLiteRepository.ModuleProxy.get()
+        batch_size = EntropySQLiteRepository._IMPORT_BATCH_ROWS
+        rc = 0
+        conn = dbapi2.connect(dbfile)
+        try:
+            if not const_is_python3():
+                # text is stored as found in the dump, without decoding it
+                conn.text_factory = str
+            # the file is renamed into place only if the import succeeds
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+
+            with open(dumpfile, "rb") as dump_f:
+                insert_sql = None
+                rows = []
+                for record in binarydump.RepositoryDumpReader(dump_f):
+                    tag = record[0]
+                    if tag == binarydump.ROW:
+                        rows.append(record[1])
+                        if len(rows) >= batch_size:
+                            conn.executemany(insert_sql, rows)
+                            del rows[:]
+                    elif tag == binarydump.TABLE:
+                        _tag, name, columns = record
+                        insert_sql = 'INSERT INTO "%s" VALUES (%s)' % (
+                            name, ", ".join(["?"] * columns))
+                    elif tag == binarydump.END_TABLE:
+                        if rows:
+                            conn.executemany(insert_sql, rows)
+                            del rows[:]
+                    elif tag == binarydump.STATEMENT:
+                        conn.execute(record[1])
+            conn.commit()
+        except (binarydump.DumpFormatError, dbapi2.Error,
+                IOError, OSError) as err:
+            const_debug_write(
+                __name__,
+                "_importBinaryRepository: cannot import %s: %s" % (
+                    dumpfile, repr(err)))
+            rc = 1
+        finally:
+            conn.close()
+
+        if rc != 0:
+            try:
+                os.remove(dbfile)
+            except OSError:
+                pass
+        return rc
+
+    def _exportTables(self):
+        """
+        Return the list of (table name, creation SQL statement) pairs of
+        the tables that are part of a repository dump.
+        """
+        cur = self._cursor().execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE sql NOT NULL AND type=='table'
+        """)
+        tables = []
+        for name, sql in cur.fetchall():
+            if name.startswith("sqlite_"):
+                continue
+            if name == "packagesearch" or \
+                    name.startswith("packagesearch_"):
+                # full-text search index, regenerated by createAllIndexes()
+                continue
+            tables.append((name, sql))
+        return tables
+
+    def _exportIndexes(self):
+        """
+        Return the list of SQL statements creating indexes (and the other
+        non-table objects) that are part of a repository dump.
+        """
+        cur = self._cursor().execute("""
+        SELECT sql FROM sqlite_master
+        WHERE sql NOT NULL AND type!='table' AND type!='meta'
+        """)
+        return self._cur2tuple(cur)
+
+    def _exportTableOutput(self, name):
+        """
+        Print table export progress.
+        """
+        self.output(
+            red("%s " % (
+                _("Exporting database table"),
+            ) ) + "["+blue(str(name))+"]",
+            importance = 0,
+            level = "info",
+            back = True,
+            header = "   "
+        )
+
+    def exportRepository(self, dumpfile, dump_format = None):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        if dump_format is None:
+            dump_format = self.DUMP_FORMAT_SQL
+        if dump_format == self.DUMP_FORMAT_SQL:
+            self._exportSqlRepository(dumpfile)
+        elif dump_format == self.DUMP_FORMAT_BINARY:
+            self._exportBinaryRepository(dumpfile)
+        else:
+            raise AttributeError("unsupported dump format")
+
+        self.output(
+            red(_("Database Export complete.")),
+            importance = 0,
+            level = "info",
+            header = "   "
+        )
+        # remember to close the file
+
+    def _exportSqlRepository(self, dumpfile):
+        """
+        Export the repository to the given file object as SQL statements.
+
+        @param dumpfile: dump file object to write to
+        @type dumpfile: file object
+        """
         exclude_tables = []
         gentle_with_tables = True
         toraw = const_convert_to_rawstring
 
         dumpfile.write(toraw("BEGIN TRANSACTION;\n"))
-        cur = self._cursor().execute("""
-        SELECT name, type, sql FROM sqlite_master
-        WHERE sql NOT NULL AND type=='table'
-        """)
-        for name, x, sql in cur.fetchall():
+        for name, sql in self._exportTables():
 
-            self.output(
-                red("%s " % (
-                    _("Exporting database table"),
-                ) ) + "["+blue(str(name))+"]",
-                importance = 0,
-                level = "info",
-                back = True,
-                header = "   "
-            )
-            if name.startswith("sqlite_"):
-                continue
+            self._exportTableOutput(name)
 
             t_cmd = "CREATE TABLE"
             if sql.startswith(t_cmd) and gentle_with_tables:
@@ -2101,24 +3185,43 @@ class EntropySQLiteRepository(EntropySQLRepository):
             for row in cur3:
                 dumpfile.write(toraw("%s;\n" % (row[0],)))
 
-        cur4 = self._cursor().execute("""
-        SELECT name, type, sql FROM sqlite_master
-        WHERE sql NOT NULL AND type!='table' AND type!='meta'
-        """)
-        for name, x, sql in cur4.fetchall():
+        for sql in self._exportIndexes():
             dumpfile.write(toraw("%s;\n" % sql))
 
         dumpfile.write(toraw("COMMIT;\n"))
         if hasattr(dumpfile, 'flush'):
             dumpfile.flush()
 
-        self.output(
-            red(_("Database Export complete.")),
-            importance = 0,
-            level = "info",
-            header = "   "
-        )
-        # remember to close the file
+    def _exportBinaryRepository(self, dumpfile):
+        """
+        Export the repository to the given file object using the binary
+        dump format (see entropy.db.binarydump). Table rows are streamed,
+        memory usage does not depend on the repository size.
+
+        @param dumpfile: dump file object to write to
+        @type dumpfile: file object
+        """
+        writer = binarydump.RepositoryDumpWriter(dumpfile)
+        for name, sql in self._exportTables():
+
+            self._exportTableOutput(name)
+            writer.statement(sql)
+
+            cur = self._cursor().execute(
+                "PRAGMA table_info('%s')" % (name,))
+            columns = len(cur.fetchall())
+
+            writer.table(name, columns)
+            # lossless text decoding, the writer encodes it back
+            self._connection().unicode()
+            cur = self._cursor().execute('SELECT * FROM "%s"' % (name,))
+            for row in cur:
+                writer.row(row)
+            writer.end_table()
+
+        for sql in self._exportIndexes():
+            writer.statement(sql)
+        writer.close()
 
     def _listAllTables(self):
         """
@@ -2141,7 +3244,14 @@ class EntropySQLiteRepository(EntropySQLRepository):
             return 0.0
         if self._is_memory():
             return 0.0
-        return os.path.getmtime(self._db)
+        mtime = os.path.getmtime(self._db)
+        # with WAL, committed data may not have reached the
+        # main database file yet.
+        try:
+            mtime = max(mtime, os.path.getmtime(self._db + "-wal"))
+        except (OSError, IOError):
+            pass
+        return mtime
 
     def checksum(self, do_order = False, strict = True,
                  include_signatures = False, include_dependencies = False):
@@ -2156,7 +3266,14 @@ class EntropySQLiteRepository(EntropySQLRepository):
                          self).checksum(
                 do_order = do_order,
                 strict = strict,
-                include_signatures = include_signatures)
+                include_signatures = include_signatures,
+                include_dependencies = include_dependencies)
+
+        if not do_order:
+            result = self._maintainedChecksum(
+                strict, include_signatures, include_dependencies)
+            if result is not None:
+                return result
 
         # backward compatibility
         # !!! keep aligned !!!
@@ -2172,7 +3289,7 @@ class EntropySQLiteRepository(EntropySQLRepository):
         category_order = ""
         license_order = ""
         flags_order = ""
-        depenenciesref_order = ""
+        dependenciesref_order = ""
         dependencies_order = ""
         if do_order:
             package_id_order = "order by idpackage"
@@ -2385,9 +3502,11 @@ class EntropySQLiteRepository(EntropySQLRepository):
         """
         Reimplemented from EntropyRepositoryBase.
         """
+        # the file ownership lookup indexes are part of the data model
         cur = self._cursor().execute("""
         SELECT name FROM SQLITE_MASTER WHERE type = "index"
         AND name NOT LIKE "sqlite_%"
+        AND tbl_name NOT IN ("contentpaths", "contentdirs")
         """)
         for index in self._cur2frozenset(cur):
             try:
@@ -2405,6 +3524,8 @@ class EntropySQLiteRepository(EntropySQLRepository):
             self.__createLicensesIndex()
             self.__createCategoriesIndex()
             self.__createCompileFlagsIndex()
+        if self._indexing:
+            self._createSearchIndex()
 
     def __createCompileFlagsIndex(self):
         try:
@@ -2426,6 +3547,42 @@ class EntropySQLiteRepository(EntropySQLRepository):
         CREATE INDEX IF NOT EXISTS licensesindex ON licenses ( license )
         """)
 
+    def _createSearchIndex(self):
+        """
+        Create, or regenerate if stale, the full-text search index used
+        by searchPackages(), searchDescription() and searchName().
+        This requires SQLite FTS5 support, the search methods fall back
+        to plain LIKE queries if the index is not available.
+        """
+        if self._isSearchIndexValid():
+            return
+
+        try:
+            self._cursor().execute("DROP TABLE IF EXISTS packagesearch")
+            self._cursor().execute("""
+            CREATE VIRTUAL TABLE packagesearch USING fts5(
+                name, atom, provide, description)
+            """)
+        except OperationalError:
+            # FTS5 not available
+            return
+        finally:
+            self._clearLiveCache("_doesTableExist")
+
+        self._cursor().execute("""
+        INSERT INTO packagesearch (packagesearch, rank) VALUES ('rank', ?)
+        """, (self._SEARCH_INDEX_RANK,))
+        self._cursor().execute("""
+        INSERT INTO packagesearch (rowid, name, atom, provide, description)
+        SELECT baseinfo.idpackage, baseinfo.name, baseinfo.atom,
+            (SELECT GROUP_CONCAT(provide.atom, ' ') FROM provide
+                WHERE provide.idpackage = baseinfo.idpackage),
+            extrainfo.description
+        FROM baseinfo LEFT OUTER JOIN extrainfo
+            ON baseinfo.idpackage = extrainfo.idpackage
+        """)
+        self._setSetting("search_index_checksum", self.checksum())
+
     def _createBaseinfoIndex(self):
         """
         Reimplemented from EntropySQLRepository.
@@ -2987,6 +4144,72 @@ class EntropySQLiteRepository(EntropySQLRepository):
         self._clearLiveCache("_doesTableExist")
         self._clearLiveCache("_doesColumnInTableExist")
 
+    def _createReverseDependenciesTable(self):
+        self._cursor().execute("""
+        CREATE TABLE reversedependencies (
+            idpackage INTEGER,
+            iddependency INTEGER,
+            PRIMARY KEY(idpackage, iddependency),
+            FOREIGN KEY(idpackage)
+                REFERENCES baseinfo(idpackage) ON DELETE CASCADE
+        );
+        """)
+        self._clearLiveCache("_doesTableExist")
+        self._clearLiveCache("_doesColumnInTableExist")
+
+    def _createContentDirsTable(self):
+        self._cursor().executescript("""
+        CREATE TABLE contentdirs (
+            directory VARCHAR,
+            idpackage INTEGER,
+            PRIMARY KEY(directory, idpackage),
+            FOREIGN KEY(idpackage)
+                REFERENCES baseinfo(idpackage) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        CREATE INDEX contentdirsindex_directory
+            ON contentdirs ( directory COLLATE NOCASE );
+        CREATE INDEX contentdirsindex_idpackage
+            ON contentdirs ( idpackage );
+        """)
+        self._clearLiveCache("_doesTableExist")
+        self._clearLiveCache("_doesColumnInTableExist")
+
+        # index the already available content
+        if self._isContentBlob():
+            cur = self._cursor().execute(
+                "SELECT idpackage, data FROM contentblobs")
+            rows = ((x, path) for x, blob in cur for path, _ftype in
+                    self._decodeContentBlob(blob))
+        else:
+            rows = self._cursor().execute(
+                "SELECT idpackage, file FROM content")
+        directory = self._contentDirectory
+        directories = set((directory(y), x) for x, y in rows)
+        self._cursor().executemany("""
+        INSERT INTO contentdirs VALUES (?, ?)
+        """, directories)
+
+    def _createContentBlobsTable(self):
+        self._cursor().executescript("""
+        CREATE TABLE IF NOT EXISTS contentblobs (
+            idpackage INTEGER PRIMARY KEY,
+            data BLOB,
+            FOREIGN KEY(idpackage)
+                REFERENCES baseinfo(idpackage) ON DELETE CASCADE
+        );
+        CREATE TABLE IF NOT EXISTS contentpaths (
+            idpackage INTEGER,
+            hash INTEGER,
+            PRIMARY KEY(idpackage, hash),
+            FOREIGN KEY(idpackage)
+                REFERENCES baseinfo(idpackage) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS contentpathsindex_hash
+            ON contentpaths ( hash );
+        """)
+        self._clearLiveCache("_doesTableExist")
+        self._clearLiveCache("_doesColumnInTableExist")
+
     def _createContentSafetyTable(self):
         self._cursor().execute("""
         CREATE TABLE contentsafety (
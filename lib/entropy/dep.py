@@ -12,6 +12,7 @@
 
 """
 import re
+import functools
 from entropy.exceptions import InvalidAtom, EntropyException
 from entropy.const import etpConst, const_cmp
 
@@ -75,30 +76,6 @@ def _pkgsplit(mypkg):
 
     return  (m.group('pn'), m.group('ver'), rev)
 
-def _generic_sorter(inputlist, cmp_func):
-
-    inputs = inputlist[:]
-    if len(inputs) < 2:
-        return inputs
-    max_idx = len(inputs)
-
-    while True:
-        changed = False
-        for idx in range(max_idx):
-            second_idx = idx+1
-            if second_idx == max_idx:
-                continue
-            str_a = inputs[idx]
-            str_b = inputs[second_idx]
-            if cmp_func(str_a, str_b) < 0:
-                inputs[idx] = str_b
-                inputs[second_idx] = str_a
-                changed = True
-        if not changed:
-            break
-
-    return inputs
-
 def isjustname(mypkg):
     """
     Checks to see if the depstring is only the package name (no version parts)
@@ -498,6 +475,155 @@ def remove_package_operators(atom):
     """
     return atom.lstrip("><=~")
 
+class Atom(object):
+    """
+    Immutable parsed representation of an atom (or dependency) string,
+    as used by EntropyRepositoryBase.atomMatch(). Atom objects are built
+    through Atom.parse(), which interns them, so that each atom string is
+    parsed once.
+
+    Attributes:
+        - atom: the atom string
+        - operator: version operator (">=", "~", "=", ...) or ""
+        - category: package category, "null" if not given
+        - name: package name
+        - key: package key (category/name)
+        - version: package version, including the SPM revision and the
+          "*" wildcard, "" if not given
+        - cpv: atom without operators, slot, tag, USE dependencies and
+          Entropy revision
+        - justname: True if the atom does not contain a version
+        - slot: package slot, see dep_getslot()
+        - tag: package tag, see dep_gettag()
+        - use: USE dependencies, see dep_getusedeps()
+        - revision: Entropy revision, see dep_get_entropy_revision()
+        - repositories: list of repositories given with "@", see
+          dep_get_match_in_repos(), or None
+        - matchable: False if the atom has no package part to look up
+    """
+
+    __slots__ = ("atom", "operator", "category", "name", "key", "version",
+                 "cpv", "justname", "slot", "tag", "use", "revision",
+                 "repositories", "matchable")
+
+    # Atom.parse() cache, cleared once it exceeds _CACHE_SIZE
+    _cache = {}
+    _CACHE_SIZE = 100000
+
+    def __init__(self, atom):
+        """
+        Atom constructor, parse the given atom string. Use Atom.parse()
+        to get interned objects.
+
+        @param atom: atom string
+        @type atom: string
+        """
+        try:
+            use = dep_getusedeps(atom)
+        except InvalidAtom:
+            use = ()
+
+        scan_atom = remove_usedeps(atom)
+        scan_atom = remove_tag(scan_atom)
+        scan_atom = remove_slot(scan_atom)
+        scan_atom = remove_entropy_revision(scan_atom)
+
+        operator = ""
+        justname = True
+        key = ""
+        name = ""
+        category = ""
+        version = ""
+        cpv = ""
+        while scan_atom:
+            scan_cpv = dep_getcpv(scan_atom)
+            cpv = scan_cpv
+            wildcard = ""
+            if scan_atom.endswith("*"):
+                wildcard = "*"
+                cpv += wildcard
+            operator = scan_atom[0:-len(cpv)]
+
+            justname = isjustname(scan_cpv)
+            key = cpv
+            if not justname:
+                data = catpkgsplit(scan_cpv)
+                if data is None:
+                    break # badly formatted
+                version = data[2] + wildcard + "-" + data[3]
+                key = dep_getkey(cpv)
+
+            split_key = key.split("/")
+            if len(split_key) == 2:
+                category, name = split_key
+            else:
+                category, name = "null", split_key[0]
+            break
+
+        _atom, repositories = dep_get_match_in_repos(atom)
+        values = {
+            "atom": atom,
+            "operator": operator,
+            "category": category,
+            "name": name,
+            "key": key,
+            "version": version,
+            "cpv": cpv,
+            "justname": justname,
+            "slot": dep_getslot(atom),
+            "tag": dep_gettag(atom),
+            "use": use,
+            "revision": dep_get_entropy_revision(atom),
+            "repositories": repositories,
+            "matchable": bool(scan_atom),
+        }
+        for attr, value in values.items():
+            object.__setattr__(self, attr, value)
+
+    @classmethod
+    def parse(cls, atom):
+        """
+        Return the interned Atom object for the given atom string.
+
+        @param atom: atom string
+        @type atom: string
+        @return: the Atom object
+        @rtype: Atom
+        """
+        obj = cls._cache.get(atom)
+        if obj is None:
+            obj = cls(atom)
+            # avoid memleaks
+            if len(cls._cache) > cls._CACHE_SIZE:
+                cls._cache.clear()
+            cls._cache[atom] = obj
+        return obj
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("Atom objects are immutable")
+
+    def __delattr__(self, attr):
+        raise AttributeError("Atom objects are immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, Atom):
+            return NotImplemented
+        return self.atom == other.atom
+
+    def __ne__(self, other):
+        if not isinstance(other, Atom):
+            return NotImplemented
+        return self.atom != other.atom
+
+    def __hash__(self):
+        return hash(self.atom)
+
+    def __str__(self):
+        return self.atom
+
+    def __repr__(self):
+        return "<Atom %r>" % (self.atom,)
+
 def compare_versions(ver1, ver2):
     """
     docstring_title
@@ -615,6 +741,111 @@ def compare_versions(ver1, ver2):
         r2 = 0
     return r1 - r2
 
+# version_key() cache, cleared once it exceeds _VERSION_KEYS_CACHE_SIZE
+_version_keys_cache = {}
+_VERSION_KEYS_CACHE_SIZE = 100000
+
+def _version_key(version):
+    """
+    version_key() implementation, without caching.
+    """
+    match = None
+    if version:
+        match = ver_regexp.match(version)
+    if not match:
+        return (0, version or "")
+
+    # see compare_versions(): components with a leading zero are compared
+    # as decimal fractions and always sort before the others, whose
+    # fraction is >= 0.1.
+    components = []
+    if match.group(3):
+        for component in match.group(3)[1:].split("."):
+            if component[0] == "0":
+                components.append((1, float("0." + component)))
+            else:
+                components.append((2, int(component)))
+
+    letter = 0
+    if match.group(5):
+        letter = ord(match.group(5))
+
+    # missing suffixes compare as "_p0", which then is neutral: strip the
+    # trailing ones and mark the others with the direction of the next
+    # different suffix, so that tuple comparison gives the same result.
+    neutral = (suffix_value["p"], 0)
+    suffixes = []
+    for suffix in match.group(6).split("_")[1:]:
+        name, number = suffix_regexp.match(suffix).groups()
+        suffixes.append((suffix_value[name], int(number or 0)))
+    while suffixes and suffixes[-1] == neutral:
+        suffixes.pop()
+    suffix_keys = []
+    for idx, suffix in enumerate(suffixes):
+        direction = 0
+        if suffix == neutral:
+            direction = -1
+            for next_suffix in suffixes[idx + 1:]:
+                if next_suffix != neutral:
+                    if next_suffix > neutral:
+                        direction = 1
+                    break
+        suffix_keys.append(suffix + (direction,))
+    suffix_keys.append(neutral + (0,))
+
+    revision = 0
+    if match.group(10):
+        revision = int(match.group(10))
+
+    return (1, int(match.group(2)), tuple(components), letter,
+            tuple(suffix_keys), revision)
+
+def version_key(version):
+    """
+    Return a totally ordered and hashable key for the given version
+    string, following the same rules of compare_versions(): keys of
+    versions that compare_versions() considers equal are equal. Invalid
+    version strings sort before valid ones. Suffixes without a number
+    compare like their "0" numbered counterpart ("_p" and "_p0"), while
+    compare_versions() considers such versions equal regardless of what
+    follows.
+    Keys are cached per version string.
+
+    @param version: version string (for example: "1.2.3_rc1-r2")
+    @type version: string
+    @return: version key
+    @rtype: tuple
+    """
+    key = _version_keys_cache.get(version)
+    if key is None:
+        key = _version_key(version)
+        # avoid memleaks
+        if len(_version_keys_cache) > _VERSION_KEYS_CACHE_SIZE:
+            _version_keys_cache.clear()
+        _version_keys_cache[version] = key
+    return key
+
+def entropy_version_key(ver_data):
+    """
+    Return a totally ordered and hashable key for the given Entropy
+    package versioning data, composed by version, tag and revision.
+    Package tags are compared first, then versions (see version_key())
+    and revisions. This matches entropy_compare_versions() when both
+    packages are tagged or none is. When only one is,
+    entropy_compare_versions() compares versions first, which is not a
+    total order, the key sorts non-tagged packages first instead.
+    For this reason, the key must only be used on lists of packages
+    that are either all tagged or all non-tagged (like atomMatch()
+    candidates), use entropy_compare_versions() otherwise.
+
+    @param ver_data: (version, tag, revision) tuple
+    @type ver_data: tuple
+    @return: version key
+    @rtype: tuple
+    """
+    version, tag, revision = ver_data
+    return (tag or "", version_key(version), revision)
+
 tag_regexp = re.compile("^([A-Za-z0-9+_.-]+)?$")
 def is_valid_package_tag(tag):
     """
@@ -703,7 +934,7 @@ def get_newer_version(versions):
     @return: sorted version list
     @rtype: list
     """
-    return _generic_sorter(versions, compare_versions)
+    return sorted(versions, key = version_key, reverse = True)
 
 def get_entropy_newer_version(versions):
     """
@@ -714,7 +945,8 @@ def get_entropy_newer_version(versions):
     @return: sorted list
     @rtype: list
     """
-    return _generic_sorter(versions, entropy_compare_versions)
+    return sorted(versions, key = functools.cmp_to_key(
+            entropy_compare_versions), reverse = True)
 
 sha1_re = re.compile(r"(.*)\.([a-f\d]{40})(.*)")
 def get_entropy_package_sha1(package_name):
@@ -23,12 +23,13 @@ import shutil
 import time
 import bz2
 import codecs
+import json
 import threading
 
 from entropy.const import etpConst, const_setup_file, const_mkdtemp, \
     const_mkstemp, const_convert_to_unicode, const_file_readable
 from entropy.core import Singleton
-from entropy.db import EntropyRepository
+from entropy.db import EntropyRepository, changeset
 from entropy.transceivers import EntropyTransceiver
 from entropy.output import red, darkgreen, bold, brown, blue, darkred, teal, \
     purple
@@ -1390,6 +1391,100 @@ Name:    %s
                 f_out.flush()
             f_out.close()
 
+    def _create_repository_changesets(self, dbconn, upload_data,
+                                      to_sign_files):
+        """
+        Create the changeset leading from the last uploaded repository
+        revision to the current one and add the available changesets,
+        together with their index, to upload_data.
+        Only the last etpConst['etpdatabasechangesetsmax'] changesets are
+        kept.
+        """
+        repo_dir = self._entropy._get_local_repository_dir(
+            self._repository_id)
+        state_path = os.path.join(repo_dir,
+            etpConst['etpdatabasechangesetsstatefile'])
+        index_path = os.path.join(repo_dir,
+            etpConst['etpdatabasechangesetsfile'])
+        revision = self._entropy.local_repository_revision(
+            self._repository_id)
+        package_ids = set(dbconn.listAllPackageIds())
+
+        state = None
+        try:
+            with open(state_path, "r") as state_f:
+                state = json.load(state_f)
+        except (OSError, IOError) as err:
+            if err.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            state = None
+        if state is not None and 'fingerprints' not in state:
+            # older state files cannot tell modified packages apart
+            state = None
+
+        fingerprints = None
+        if state is None or state['revision'] != revision:
+            fingerprints = changeset.package_fingerprints(
+                dbconn, package_ids)
+
+        entries = []
+        if state is not None and os.path.isfile(index_path):
+            try:
+                entries = changeset.read_changeset_index(index_path)
+            except changeset.ChangesetError:
+                entries = []
+
+        if state is not None and state['revision'] < revision:
+            old_fingerprints = dict((int(package_id), fingerprint) \
+                for package_id, fingerprint in state['fingerprints'].items())
+            old_package_ids = set(old_fingerprints)
+            # packages whose metadata changed in place are removed
+            # and added again
+            modified_ids = set(x for x in package_ids & old_package_ids \
+                if fingerprints[x] != old_fingerprints[x])
+            name = etpConst['etpdatabasechangesetfile'] % (revision,)
+            path = os.path.join(repo_dir, name)
+            changeset.write_changeset(dbconn, path, self._repository_id,
+                state['revision'], revision,
+                (package_ids - old_package_ids) | modified_ids,
+                (old_package_ids - package_ids) | modified_ids)
+            entries = [x for x in entries if x[1] <= state['revision']]
+            entries.append((state['revision'], revision, name,
+                entropy.tools.md5sum(path)))
+        elif state is None or state['revision'] > revision:
+            # unknown or reset repository history
+            entries = []
+
+        if state is None or state['revision'] != revision:
+            tmp_path = state_path + ".tmp"
+            with open(tmp_path, "w") as state_f:
+                json.dump({'revision': revision,
+                           'fingerprints': dict(
+                               (str(x), y) for x, y in \
+                                   fingerprints.items())}, state_f)
+            os.rename(tmp_path, state_path)
+
+        entries = entries[-etpConst['etpdatabasechangesetsmax']:]
+        changeset.write_changeset_index(index_path, entries)
+
+        # drop changesets no longer listed
+        names = set(x[2] for x in entries)
+        prefix, suffix = etpConst['etpdatabasechangesetfile'].split("%d")
+        for name in os.listdir(repo_dir):
+            if name in names:
+                continue
+            if name.startswith(prefix) and name.endswith(suffix) and \
+                    name[len(prefix):-len(suffix)].isdigit():
+                os.remove(os.path.join(repo_dir, name))
+
+        upload_data['changesets_index'] = index_path
+        to_sign_files.append(index_path)
+        for from_revision, to_revision, name, md5 in entries:
+            path = os.path.join(repo_dir, name)
+            upload_data['changeset_%d' % (to_revision,)] = path
+            to_sign_files.append(path)
+
     def _create_upload_gpg_signatures(self, upload_data, to_sign_files):
         """
         This method creates .asc files for every path that is going to be
@@ -1508,6 +1603,8 @@ Name:    %s
         self._show_package_sets_messages()
 
         dbconn.commit()
+        self._create_repository_changesets(dbconn, upload_data,
+            gpg_to_sign_files)
         # now we can safely copy it
 
         # backup current database to avoid re-indexing
@@ -1549,7 +1646,8 @@ Name:    %s
             # opener = cmethod[0]
             f_out = cmethod[0](upload_data['dump_path_light'], "wb")
             try:
-                eapi2_tmp_dbconn.exportRepository(f_out)
+                eapi2_tmp_dbconn.exportRepository(
+                    f_out, dump_format = srv_set['database_dump_format'])
             finally:
                 f_out.close()
                 eapi2_tmp_dbconn.close()
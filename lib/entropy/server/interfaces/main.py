@@ -40,7 +40,7 @@ from entropy.core.settings.base import SystemSettings
 from entropy.core.settings.plugins.skel import SystemSettingsPlugin
 from entropy.transceivers import EntropyTransceiver
 from entropy.db import EntropyRepository
-from entropy.db.skel import EntropyRepositoryPlugin
+from entropy.db.skel import EntropyRepositoryPlugin, EntropyRepositoryBase
 from entropy.server.interfaces.db import ServerRepositoryStatus, \
     ServerPackagesRepository
 from entropy.spm.plugins.factory import get_default_instance as get_spm, \
@@ -1086,6 +1086,8 @@ class ServerSystemSettingsPlugin(SystemSettingsPlugin):
             'packages_expiration_days': etpConst['packagesexpirationdays'],
             'database_file_format': const_convert_to_unicode(
                 etpConst['etpdatabasefileformat']),
+            'database_dump_format': const_convert_to_unicode(
+                EntropyRepositoryBase.DUMP_FORMAT_SQL),
             'disabled_eapis': set(),
             'broken_revdeps_qa_check': True,
             'exp_based_scope': etpConst['expiration_based_scope'],
@@ -1195,6 +1197,11 @@ class ServerSystemSettingsPlugin(SystemSettingsPlugin):
             if setting in etpConst['etpdatabasesupportedcformats']:
                 data['database_file_format'] = setting
 
+        def _database_dump_format(line, setting):
+            if setting in (EntropyRepositoryBase.DUMP_FORMAT_SQL,
+                           EntropyRepositoryBase.DUMP_FORMAT_BINARY):
+                data['database_dump_format'] = setting
+
         def _syncspeedlimit(line, setting):
             try:
                 speed_limit = int(setting)
@@ -1263,6 +1270,7 @@ class ServerSystemSettingsPlugin(SystemSettingsPlugin):
             'server-basic-languages': _server_basic_lang,
             'repository': _repository_func,
             'database-format': _database_format,
+            'database-dump-format': _database_dump_format,
             # backward compatibility
             'sync-speed-limit': _syncspeedlimit,
             'syncspeedlimit': _syncspeedlimit,
@@ -6169,8 +6177,13 @@ class Server(Client):
         trashing_counters = set()
 
         for myrepo in myserver_repos:
-            mydbconn = self.open_server_repository(myrepo, read_only = True,
-                no_upload = True)
+            if myrepo == repository_id:
+                # changes may not be committed yet, when running
+                # inside a bulkImport() transaction.
+                mydbconn = dbconn
+            else:
+                mydbconn = self.open_server_repository(myrepo,
+                    read_only = True, no_upload = True)
             mylist = mydbconn.getPackagesToRemove(
                     mydata['name'],
                     mydata['category'],
@@ -6540,31 +6553,33 @@ class Server(Client):
             missing_deps = self.__user_filter_out_missing_deps(pkg_repo,
                 dbconn, missing_map, ask)
 
-            for (pkg_id, missing_pkg_repo), missing in missing_deps.items():
-                if pkg_repo != missing_pkg_repo:
-                    # with current API, this never happens!
-                    # but since this is a critical region, better being
-                    # safe than sorry.
-                    # pkg_repo is always the same...
-                    raise AssertionError(
-                        "pkg_repo and missing_pkg_repo must be equal")
-
-                if bump_packages:
-                    # in this case, a new package should be generated, with
-                    # bumped revision
-                    pkg_data = dbconn.getPackageData(pkg_id)
-                    # also bump injected packages properly
-                    original_injected = pkg_data['injected']
-                    pkg_data['injected'] = False
-                    pkg_id = dbconn.handlePackage(pkg_data)
-                    if original_injected:
-                        dbconn.setInjected(pkg_id)
-                    # make sure that info have been written to disk
-                    dbconn.commit()
-
-                # NOTE that missing is a list here, so no fancy
-                # dependency type is set.
-                dbconn.insertDependencies(pkg_id, missing)
+            # packages are bumped within a single transaction
+            with dbconn.bulkImport(drop_indexes = False):
+                for (pkg_id, missing_pkg_repo), missing in missing_deps.items():
+                    if pkg_repo != missing_pkg_repo:
+                        # with current API, this never happens!
+                        # but since this is a critical region, better being
+                        # safe than sorry.
+                        # pkg_repo is always the same...
+                        raise AssertionError(
+                            "pkg_repo and missing_pkg_repo must be equal")
+
+                    if bump_packages:
+                        # in this case, a new package should be generated, with
+                        # bumped revision
+                        pkg_data = dbconn.getPackageData(pkg_id)
+                        # also bump injected packages properly
+                        original_injected = pkg_data['injected']
+                        pkg_data['injected'] = False
+                        pkg_id = dbconn.handlePackage(pkg_data)
+                        if original_injected:
+                            dbconn.setInjected(pkg_id)
+                        # make sure that info have been written to disk
+                        dbconn.commit()
+
+                    # NOTE that missing is a list here, so no fancy
+                    # dependency type is set.
+                    dbconn.insertDependencies(pkg_id, missing)
 
             if missing_deps:
                 # save changes here again
@@ -6795,76 +6810,80 @@ class Server(Client):
         maxcount = len(packages_data)
         package_ids_added = set()
         to_be_injected = set()
+        moved_files = []
 
-        for package_filepaths, inject in packages_data:
-
-            mycount += 1
-            for package_filepath in package_filepaths:
-                header = blue(" @@ ")
-                count = (mycount, maxcount,)
-                if package_filepaths[0] != package_filepath:
-                    self.output(
-                        "%s" % (
-                            brown(os.path.basename(package_filepath)),
-                        ),
-                        importance = 1,
-                        level = "info",
-                        header = teal("     # ")
-                    )
-                else:
-                    self.output(
-                        "[%s] %s: %s" % (
-                            darkgreen(repository_id),
-                            blue(_("adding package")),
-                            darkgreen(os.path.basename(package_filepath)),
-                        ),
-                        importance = 1,
-                        level = "info",
-                        header = blue(" @@ "),
+        dbconn = self.open_server_repository(repository_id, read_only = False,
+            no_upload = True)
+        try:
+            # add all the packages within a single transaction, indexes
+            # are kept since handlePackage() looks up the packages to
+            # replace.
+            with dbconn.bulkImport(drop_indexes = False):
+                for package_filepaths, inject in packages_data:
+
+                    mycount += 1
+                    for package_filepath in package_filepaths:
+                        header = blue(" @@ ")
                         count = (mycount, maxcount,)
-                    )
+                        if package_filepaths[0] != package_filepath:
+                            self.output(
+                                "%s" % (
+                                    brown(os.path.basename(package_filepath)),
+                                ),
+                                importance = 1,
+                                level = "info",
+                                header = teal("     # ")
+                            )
+                        else:
+                            self.output(
+                                "[%s] %s: %s" % (
+                                    darkgreen(repository_id),
+                                    blue(_("adding package")),
+                                    darkgreen(
+                                        os.path.basename(package_filepath)),
+                                ),
+                                importance = 1,
+                                level = "info",
+                                header = blue(" @@ "),
+                                count = (mycount, maxcount,)
+                            )
 
-            if inject and len(package_filepaths) == 1:
-                # just make sure user is aware of the fact that no separate
-                # debug packages will be made.
-                self.output(
-                    "%s" % (
-                        brown(_("injected package, no separate debug package")),
-                    ),
-                    importance = 1,
-                    level = "info",
-                    header = teal("     !! ")
-                )
+                    if inject and len(package_filepaths) == 1:
+                        # just make sure user is aware of the fact that no
+                        # separate debug packages will be made.
+                        self.output(
+                            "%s" % (
+                                brown(_("injected package, no separate "
+                                        "debug package")),
+                            ),
+                            importance = 1,
+                            level = "info",
+                            header = teal("     !! ")
+                        )
 
-            try:
-                # add to database
-                package_id, destination_paths = self._package_injector(
-                    repository_id, package_filepaths, inject = inject)
-                package_ids_added.add(package_id)
-                to_be_injected.add((package_id, destination_paths[0]))
-            except Exception as err:
-                entropy.tools.print_traceback()
-                self.output(
-                    "[%s] %s: %s" % (
-                        darkgreen(repository_id),
-                        darkred(_("Exception caught, closing tasks")),
-                        darkgreen(str(err)),
-                    ),
-                    importance = 1,
-                    level = "error",
-                    header = bold(" !!! "),
-                    count = (mycount, maxcount,)
-                )
-                # reinit librarypathsidpackage table
-                if package_ids_added:
-                    self._add_packages_qa_tests(
-                        [(x, repository_id) for x in package_ids_added],
-                        ask = ask)
-                if to_be_injected:
-                    self._inject_database_into_packages(repository_id,
-                        to_be_injected)
-                self.close_repositories()
-                raise
+                    package_id, destination_paths = self._package_injector(
+                        repository_id, package_filepaths, inject = inject)
+                    moved_files.append((package_filepaths, destination_paths))
+                    package_ids_added.add(package_id)
+                    to_be_injected.add((package_id, destination_paths[0]))
+
+        except Exception as err:
+            entropy.tools.print_traceback()
+            self.output(
+                "[%s] %s: %s" % (
+                    darkgreen(repository_id),
+                    darkred(_("Exception caught, closing tasks")),
+                    darkgreen(str(err)),
+                ),
+                importance = 1,
+                level = "error",
+                header = bold(" !!! "),
+                count = (mycount, maxcount,)
+            )
+            # the whole transaction has been rolled back
+            self._restore_package_files(moved_files)
+            self.close_repositories()
+            raise
 
         # make sure packages are really available, it can happen
         # after a previous failure to have garbage here
@@ -6881,6 +6900,34 @@ class Server(Client):
 
         return package_ids_added
 
+    def _restore_package_files(self, moved_files):
+        """
+        Move package files back to their original directory, after the
+        repository transaction adding them has been rolled back.
+
+        @param moved_files: list of (original paths, destination paths)
+            tuples, as handled by _package_injector()
+        @type moved_files: list
+        """
+        for package_filepaths, destination_paths in moved_files:
+            for package_filepath, destination_path in zip(
+                    package_filepaths, destination_paths):
+                original_path = os.path.join(
+                    os.path.dirname(package_filepath),
+                    os.path.basename(destination_path))
+                try:
+                    shutil.move(destination_path, original_path)
+                except (IOError, OSError) as err:
+                    self.output(
+                        "%s: %s" % (
+                            darkred(_("Cannot restore package file")),
+                            err,
+                        ),
+                        importance = 1,
+                        level = "error",
+                        header = bold(" !!! ")
+                    )
+
     def _taint_database(self, repository_id):
 
         # taint the database status
@@ -19,6 +19,7 @@ from entropy.output import set_mute
 from entropy.core.settings.base import SystemSettings
 from entropy.db import EntropyRepository
 from entropy.exceptions import RepositoryError, EntropyPackageException
+import entropy.dep
 import entropy.tools
 import tests._misc as _misc
 
@@ -193,6 +194,137 @@ class EntropyClientTest(unittest.TestCase):
             set_mute(False)
         self.assertRaises(RepositoryError, test_load)
 
+    def test_mask_filter_bitmap(self):
+        dbconn = self.Client._init_generic_temp_repository(
+            self.mem_repoid, self.mem_repo_desc, temp_file = ":memory:")
+        dbconn.enable_mask_filter = True
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        idpackage = dbconn.addPackage(data)
+        data['keywords'] = set(["-*"])
+        idpackage_masked = dbconn.addPackage(data)
+
+        package_ids = [idpackage, idpackage_masked]
+        results = [dbconn._maskFilter_evaluate(x, True) for x in package_ids]
+        self.assertEqual(dbconn.maskFilterMany(package_ids), results)
+        self.assertEqual([dbconn.maskFilter(x) for x in package_ids],
+            results)
+        self.assertEqual(results[1][0], -1)
+
+        bitmap = dbconn.maskFilterBitmap()
+        self.assertEqual(bitmap.is_visible(idpackage), results[0][0] != -1)
+        self.assertFalse(bitmap.is_visible(idpackage_masked))
+        self.assertTrue(bitmap is dbconn.maskFilterBitmap())
+
+        dbconn.removePackage(idpackage_masked)
+        self.assertFalse(bitmap is dbconn.maskFilterBitmap())
+        self.assertEqual(
+            dbconn.maskFilterBitmap().result(idpackage_masked), None)
+        self.Client.remove_repository(self.mem_repoid)
+
+    def test_calculate_updates_packages(self):
+        dbconn = self.Client._init_generic_temp_repository(
+            self.mem_repoid, self.mem_repo_desc, temp_file = ":memory:")
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        idpackage = dbconn.addPackage(data)
+
+        inst_repo = self.Client.installed_repository()
+        inst_idpackage = inst_repo.addPackage(data)
+        data['version'] = "0"
+        inst_idpackage_old = inst_repo.addPackage(data)
+
+        package_ids = [inst_idpackage, inst_idpackage_old]
+        strict_data = inst_repo.getStrictDataMany(package_ids)
+        kwargs = {
+            'match_repos': (self.mem_repoid,),
+            'empty': False,
+            'ignore_spm_downgrades': False,
+        }
+        outcome = self.Client._calculate_updates_packages(
+            package_ids, strict_data, **kwargs)
+        self.assertEqual(outcome['update'], [(idpackage, self.mem_repoid)])
+        self.assertEqual(outcome['fine'],
+            [inst_repo.retrieveAtom(inst_idpackage)])
+        self.assertEqual(outcome['remove'], [])
+
+        # in-memory repositories cannot be shared with worker processes
+        self.assertEqual(self.Client._calculate_updates_parallel(
+                2, package_ids, strict_data, kwargs, lambda x: None), None)
+        self.Client.remove_repository(self.mem_repoid)
+
+    def test_calculate_updates_fast(self):
+        dbconn = self.Client._init_generic_temp_repository(
+            self.mem_repoid, self.mem_repo_desc, temp_file = ":memory:")
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        dbconn.addPackage(data)
+
+        inst_repo = self.Client.installed_repository()
+        package_ids = [inst_repo.addPackage(data)]
+        data['version'] = "0"
+        package_ids.append(inst_repo.addPackage(data))
+        data['versiontag'] = "foo"
+        package_ids.append(inst_repo.addPackage(data))
+        data['versiontag'] = ""
+        data['slot'] = "foo"
+        package_ids.append(inst_repo.addPackage(data))
+        data['name'] = "foo"
+        package_ids.append(inst_repo.addPackage(data))
+        strict_data = inst_repo.getStrictDataMany(package_ids)
+
+        for empty in (False, True):
+            kwargs = {
+                'match_repos': (self.mem_repoid,),
+                'empty': empty,
+                'ignore_spm_downgrades': False,
+            }
+            expected = self.Client._calculate_updates_packages(
+                package_ids, strict_data, **kwargs)
+            outcome, slow_package_ids = self.Client._calculate_updates_fast(
+                package_ids, strict_data, **kwargs)
+            self.assertTrue(len(slow_package_ids) < len(package_ids))
+            slow_outcome = self.Client._calculate_updates_packages(
+                slow_package_ids, strict_data, **kwargs)
+            for key, value in expected.items():
+                self.assertEqual(sorted(value),
+                    sorted(outcome[key] + slow_outcome[key]))
+
+        self.Client.remove_repository(self.mem_repoid)
+
+    def test_dependency_solver_session(self):
+        from entropy.client.interfaces.dep import _DependencySolverSession
+
+        dbconn = self.Client._init_generic_temp_repository(
+            self.mem_repoid, self.mem_repo_desc, temp_file = ":memory:")
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        idpackage = dbconn.addPackage(data)
+        key = entropy.dep.dep_getkey(dbconn.retrieveAtom(idpackage))
+
+        session = _DependencySolverSession(self.Client)
+        for count in range(2):
+            self.assertEqual(session.atom_match(key),
+                (idpackage, self.mem_repoid))
+            self.assertEqual(
+                session.retrieve_key_slot(idpackage, self.mem_repoid),
+                dbconn.retrieveKeySlot(idpackage))
+        stats = session.stats()
+        self.assertTrue("atom_match: 1/2 hits" in stats)
+        self.assertTrue("keyslot: 1/2 hits" in stats)
+
+        # not installed, thus unsatisfied, the second time from cache
+        for count in range(2):
+            unsatisfied = self.Client._get_unsatisfied_dependencies(
+                [key], session = session)
+            self.assertEqual(unsatisfied, set([key]))
+        self.assertEqual(
+            session.unsatisfied_cache(False, False, None), {key: key})
+
+        self.assertTrue("unsatisfied: 1/2 hits" in session.stats())
+
+        self.Client.remove_repository(self.mem_repoid)
+
     def test_package_repository(self):
         test_pkg = _misc.get_test_entropy_package()
         # this might fail on 32bit arches
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+calculate_updates() benchmarks.
+
+Usage (from lib/tests): python client_benchmark.py [<jobs>]
+
+Compare the serial and the parallel (process pool based) calculation of
+package updates on the running system, using the installed packages
+repository and the enabled, already synced, repositories. Both paths
+must return the same results. Repositories are only read.
+"""
+import sys
+sys.path.insert(0, '.')
+sys.path.insert(0, '../')
+import time
+
+from entropy.client.interfaces import Client
+from entropy.const import const_get_cpus
+
+
+def _merge(outcomes):
+    merged = {
+        'update': [],
+        'remove': [],
+        'fine': [],
+        'spm_fine': [],
+    }
+    for outcome in outcomes:
+        for key, value in outcome.items():
+            merged[key].extend(value)
+    return merged
+
+
+def main(jobs):
+    client = Client(xcache = False, repo_validation = False)
+    try:
+        misc_settings = client.ClientSettings()['misc']
+        inst_repo = client.installed_repository()
+        enabled_repos = client.filter_repositories(client.repositories())
+        kwargs = {
+            'match_repos': tuple([
+                x for x in client.Settings()['repositories']['order']
+                if x in enabled_repos]),
+            'empty': False,
+            'ignore_spm_downgrades': misc_settings['ignore_spm_downgrades'],
+        }
+
+        package_ids = list(reversed(list(inst_repo.listAllPackageIds())))
+        strict_data = inst_repo.getStrictDataMany(package_ids)
+
+        with client.repository_snapshots():
+            # the parallel path only handles what the fast path leaves
+            _outcome, package_ids = client._calculate_updates_fast(
+                package_ids, strict_data, **kwargs)
+
+            t1 = time.time()
+            serial = client._calculate_updates_packages(
+                package_ids, strict_data, **kwargs)
+            serial_time = time.time() - t1
+
+            t1 = time.time()
+            outcomes = client._calculate_updates_parallel(
+                jobs, package_ids, strict_data, kwargs, lambda x: None)
+            parallel_time = time.time() - t1
+    finally:
+        client.shutdown()
+
+    if outcomes is None:
+        sys.stderr.write("parallel calculation not available\n")
+        return 1
+    if _merge(outcomes) != _merge([serial]):
+        sys.stderr.write("serial and parallel results differ\n")
+        return 1
+
+    sys.stdout.write("%d packages, %d jobs\n" % (len(package_ids), jobs))
+    sys.stdout.write("serial:    %.2fs\n" % (serial_time,))
+    sys.stdout.write("parallel:  %.2fs (%.1fx)\n" % (
+            parallel_time, serial_time / max(parallel_time, 0.001)))
+    return 0
+
+
+if __name__ == "__main__":
+    jobs = const_get_cpus()
+    if len(sys.argv) > 1:
+        jobs = int(sys.argv[1])
+    raise SystemExit(main(max(2, jobs)))
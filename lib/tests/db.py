@@ -4,16 +4,18 @@ sys.path.insert(0, '.')
 sys.path.insert(0, '../')
 import unittest
 import os
+import shutil
 import time
 import threading
 
 from entropy.client.interfaces import Client
 from entropy.const import etpConst, const_convert_to_unicode, \
-    const_convert_to_rawstring, const_mkstemp
+    const_convert_to_rawstring, const_mkstemp, const_mkdtemp
 from entropy.output import set_mute
 from entropy.core.settings.base import SystemSettings
 from entropy.misc import ParallelTask
 from entropy.db import EntropyRepository
+from entropy.db.skel import EntropyRepositoryBase
 import tests._misc as _misc
 
 import entropy.dep
@@ -148,6 +150,43 @@ class EntropyRepositoryTest(unittest.TestCase):
             db_needed = self.test_db.retrieveNeededLibraries(idpackage)
             self.assertEqual(db_needed, data['needed_libs'])
 
+    def test_soname_index(self):
+        test_pkg = _misc.get_test_package4()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        data['provided_libs'] = set([
+            ("libfoo.so.1", "/usr/lib64/libfoo.so.1", 2),
+            ("libfoo.so.1", "/usr/lib/libfoo.so.1", 1)])
+        idpackage = self.test_db.addPackage(data)
+
+        def lookups():
+            result = [self.test_db.retrieveProvidedLibraries(idpackage)]
+            for elfclass in (-1, 1, 2):
+                result.append(self.test_db.resolveNeeded(
+                    "libfoo.so.1", elfclass = elfclass, extended = True))
+                result.append(self.test_db.resolveNeeded(
+                    "libfoo.so.1", elfclass = elfclass))
+            for _x, _x, soname, elfclass, _x in data['needed_libs']:
+                result.append(self.test_db.searchNeeded(
+                    soname, elfclass = elfclass))
+                result.append(self.test_db.searchNeeded(soname))
+            return result
+
+        self.test_db._SONAME_INDEX_THRESHOLD = 10**6
+        expected = lookups()
+        self.assertEqual(self.test_db._sonameIndex(), None)
+        self.assertEqual(expected[0], data['provided_libs'])
+
+        self.test_db._SONAME_INDEX_THRESHOLD = 1
+        self.assertNotEqual(self.test_db._sonameIndex(), None)
+        self.assertEqual(lookups(), expected)
+
+        # the index must follow repository changes
+        self.test_db.removePackage(idpackage)
+        self.assertEqual(self.test_db.resolveNeeded("libfoo.so.1"),
+            frozenset())
+        self.assertEqual(self.test_db.retrieveProvidedLibraries(idpackage),
+            frozenset())
+
     def test_dependencies(self):
         test_pkg = _misc.get_test_package3()
         data = self.Spm.extract_package_metadata(test_pkg)
@@ -242,6 +281,72 @@ class EntropyRepositoryTest(unittest.TestCase):
             content,
             tuple(sorted(orig_content, key = lambda x: x[0])))
 
+    def test_content_blob(self):
+        test_pkg = _misc.get_test_package3()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        idpackage = self.test_db.addPackage(data)
+        content = self.test_db.retrieveContent(
+            idpackage, extended = True, order_by="file")
+
+        self.test_db.setContentFormat(self.test_db.CONTENT_FORMAT_BLOB)
+        self.assertEqual(self.test_db.contentFormat(),
+                         self.test_db.CONTENT_FORMAT_BLOB)
+        self.assertEqual(content, self.test_db.retrieveContent(
+                idpackage, extended = True, order_by="file"))
+        self.assertEqual(content, tuple(
+                self.test_db.retrieveContentIter(idpackage,
+                                                 order_by="file")))
+        self.assertEqual(self.test_db.listAllFiles(count = True),
+                         len(content))
+        self.assertEqual(self.test_db.isFileAvailable(
+                "/usr/sbin/htpasswd", get_id = True),
+                         frozenset([idpackage]))
+        self.assertEqual(self.test_db.searchBelongs("/usr/sbin/ht%",
+                                                    like = True),
+                         frozenset([idpackage]))
+        self.assertFalse(self.test_db.isFileAvailable("/usr/sbin/foo"))
+
+        # new packages are stored as blobs too
+        self.test_db.removePackage(idpackage)
+        self.assertFalse(self.test_db.isFileAvailable("/usr/sbin/htpasswd"))
+        idpackage = self.test_db.addPackage(data)
+        self.assertEqual(content, self.test_db.retrieveContent(
+                idpackage, extended = True, order_by="file"))
+
+        self.test_db.setContentFormat(self.test_db.CONTENT_FORMAT_ROWS)
+        self.assertEqual(content, self.test_db.retrieveContent(
+                idpackage, extended = True, order_by="file"))
+        self.assertFalse(self.test_db._doesTableExist("contentblobs"))
+
+    def test_content_belongs(self):
+        test_pkg = _misc.get_test_package3()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        idpackage = self.test_db.addPackage(data)
+        pkg_ids = frozenset([idpackage])
+
+        self.assertEqual(self.test_db.searchBelongs("/usr/sbin/htpasswd"),
+                         pkg_ids)
+        self.assertEqual(self.test_db.searchBelongs("/usr/SBIN/ht%",
+                                                    like = True), pkg_ids)
+        self.assertEqual(self.test_db.searchBelongs("/usr/SBIN/ht*",
+                                                    glob = True),
+                         frozenset())
+        self.assertEqual(self.test_db.searchBelongs("/usr/sbin/ht[a-d]*",
+                                                    glob = True), pkg_ids)
+        self.assertEqual(self.test_db.searchBelongs("/usr/sbin/ht[^a-z]*",
+                                                    glob = True),
+                         frozenset())
+        self.assertEqual(self.test_db.searchBelongsDirectory("/usr/share"),
+                         pkg_ids)
+        self.assertEqual(self.test_db.searchBelongsDirectory("/usr/lib"),
+                         frozenset())
+        self.assertEqual(self.test_db.searchBelongsDirectory(
+                "/usr/share/man/", recursive = True), pkg_ids)
+
+        self.test_db.removePackage(idpackage)
+        self.assertEqual(self.test_db.searchBelongsDirectory(
+                "/usr", recursive = True), frozenset())
+
     def test_db_creation(self):
         self.assertTrue(isinstance(self.test_db, EntropyRepository))
         self.assertEqual(self.test_db_name, self.test_db.repository_id())
@@ -423,6 +528,31 @@ class EntropyRepositoryTest(unittest.TestCase):
         self.assertTrue(isinstance(results, set))
         self.assertTrue(rc == 1)
 
+    def test_atom_match_many(self):
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        self.test_db.addPackage(data)
+        data['slot'] = "foo"
+        self.test_db.addPackage(data)
+
+        key = data['category'] + "/" + data['name']
+        atoms = [
+            "", "slib", data['name'], key, key + ":foo",
+            ">=" + key + "-0", "<" + key + "-0", "=" + key + "-" +
+            data['version'], key + "#tag", "slib;" + key + "?",
+            "virtual/foo", _misc.get_test_package_atom(),
+            ]
+        self.assertEqual(self.test_db.searchNameMany([data['name'], "slib"]),
+            {data['name']: frozenset(self.test_db.searchName(
+                        data['name'], sensitive = True, just_id = True))})
+
+        for kwargs in ({}, {'multiMatch': True},
+                       {'extendedResults': True}, {'matchSlot': "foo"}):
+            results = self.test_db.atomMatchMany(atoms, **kwargs)
+            for atom in atoms:
+                self.assertEqual(results[atom],
+                    self.test_db.atomMatch(atom, **kwargs))
+
     def test_db_insert_compare_match_utf(self):
 
         # insert/compare
@@ -713,6 +843,286 @@ class EntropyRepositoryTest(unittest.TestCase):
         self.assertEqual(len(cur_cache), 0) # nothing left
         os.remove(_tmp_data['path'])
 
+    def test_db_key_slot_candidates(self):
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+
+        dbs = []
+        db_paths = []
+        try:
+            for count in range(2):
+                fd, db_path = const_mkstemp()
+                os.close(fd)
+                db_paths.append(db_path)
+                db = self.Client.open_generic_repository(db_path)
+                db.initializeRepository()
+                dbs.append(db)
+
+            package_id = dbs[0].addPackage(data)
+            candidate_id = dbs[1].addPackage(data)
+            data['slot'] = "foo"
+            dbs[0].addPackage(data)
+            dbs[0].commit()
+            dbs[1].commit()
+
+            repositories = {"candidates": dbs[1]}
+            expected = {
+                package_id: [("candidates", candidate_id, data['version'],
+                              data['versiontag'], data['revision'])],
+                }
+            self.assertEqual(
+                dbs[0].searchKeySlotCandidates(repositories), expected)
+            self.assertEqual(
+                EntropyRepositoryBase.searchKeySlotCandidates(
+                    dbs[0], repositories), expected)
+        finally:
+            for db in dbs:
+                db.close()
+            for db_path in db_paths:
+                os.remove(db_path)
+
+    def test_db_connection_pool(self):
+        from entropy.db.sql import SQLConnectionReaper
+
+        fd, db_path = const_mkstemp()
+        os.close(fd)
+        db = self.Client.open_generic_repository(db_path)
+        db.initializeRepository()
+        db.commit()
+
+        def select_pkg():
+            db.listAllPackageIds()
+
+        try:
+            for count in range(3):
+                th = ParallelTask(select_pkg)
+                th.start()
+                th.join()
+                SQLConnectionReaper.get().reap()
+
+            stats = db.connectionPoolStats()
+            # connections of terminated threads are reused
+            self.assertTrue(stats['reused'] >= 2)
+            self.assertEqual(stats['idle'], 1)
+
+            db._CONNECTION_POOL_IDLE_TIMEOUT = 0.0
+            SQLConnectionReaper.get().reap()
+            self.assertEqual(db.connectionPoolStats()['idle'], 0)
+        finally:
+            db.close()
+            os.remove(db_path)
+
+    def test_db_connection_pool_bounded(self):
+        from entropy.db.exceptions import OperationalError
+        from entropy.db.sql import SQLConnectionReaper
+
+        fd, db_path = const_mkstemp()
+        os.close(fd)
+        db = self.Client.open_generic_repository(db_path)
+        db.initializeRepository()
+        db.commit()
+        # the main thread connection and another one
+        db._CONNECTION_POOL_MAX_SIZE = 2
+        db._CONNECTION_POOL_WAIT_TIMEOUT = 0.5
+
+        release = threading.Event()
+        results = []
+
+        def hold_connection():
+            db._connection()
+            release.wait()
+
+        def get_connection():
+            try:
+                db._connection()
+                results.append(True)
+            except OperationalError:
+                results.append(False)
+
+        try:
+            holder = ParallelTask(hold_connection)
+            holder.start()
+            while db.connectionPoolStats()['size'] < 2:
+                time.sleep(0.05)
+
+            th = ParallelTask(get_connection)
+            th.start()
+            th.join()
+            self.assertEqual(results, [False])
+
+            release.set()
+            holder.join()
+            SQLConnectionReaper.get().reap()
+            th = ParallelTask(get_connection)
+            th.start()
+            th.join()
+            self.assertEqual(results, [False, True])
+        finally:
+            release.set()
+            db.close()
+            os.remove(db_path)
+
+    def test_db_connection_scope(self):
+        fd, db_path = const_mkstemp()
+        os.close(fd)
+        db = self.Client.open_generic_repository(db_path)
+        db.initializeRepository()
+        db.commit()
+        db._CONNECTION_POOL_MAX_SIZE = 2
+        db._CONNECTION_POOL_WAIT_TIMEOUT = 0.5
+
+        released = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def scoped_connection():
+            with db.connectionScope():
+                with db.connectionScope():
+                    db.listAllPackageIds()
+                # still bound to this thread
+                results.append(db.connectionPoolStats()['size'])
+            released.set()
+            # the thread is alive, its connection is back in the pool
+            release.wait()
+
+        def get_connection():
+            db.listAllPackageIds()
+            results.append(db.connectionPoolStats()['reused'])
+
+        try:
+            db.listAllPackageIds()
+            holder = ParallelTask(scoped_connection)
+            holder.start()
+            released.wait()
+            self.assertEqual(db.connectionPoolStats()['idle'], 1)
+
+            th = ParallelTask(get_connection)
+            th.start()
+            th.join()
+            self.assertEqual(results, [2, 1])
+        finally:
+            release.set()
+            db.close()
+            os.remove(db_path)
+
+    def test_db_live_cache_lru(self):
+        from entropy.db.cache import EntropyRepositoryCacher
+        cacher = EntropyRepositoryCacher()
+        budget = cacher.budget()
+        try:
+            cacher.clear()
+            value = tuple(range(50))
+            item_size = EntropyRepositoryCacher._sizeof(value)
+            cacher.set_budget(item_size * 10)
+
+            for count in range(10):
+                cacher.set("a_%d" % (count,), value, partition = "a_")
+            # mark as most recently used
+            self.assertEqual(cacher.get("a_0"), value)
+
+            # the biggest partition gets evicted first
+            cacher.set("b_0", value, partition = "b_")
+            self.assertEqual(cacher.get("b_0"), value)
+            self.assertEqual(cacher.get("a_1"), None)
+            self.assertEqual(cacher.get("a_0"), value)
+            self.assertTrue(cacher.usage() <= cacher.budget())
+            self.assertEqual(cacher.usage("b_"), item_size)
+
+            cacher.discard("a_")
+            self.assertEqual(cacher.keys(), ["b_0"])
+        finally:
+            cacher.set_budget(budget)
+            cacher.clear()
+
+    def test_db_snapshot(self):
+        from entropy.db.snapshot import EntropyRepositorySnapshot
+
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        data['pkg_dependencies'] += ((
+                _misc.get_test_package_atom2(),
+                etpConst['dependency_type_ids']['rdepend_id']),)
+        package_id = self.test_db.addPackage(data)
+        key, slot = self.test_db.retrieveKeySlot(package_id)
+        atom = self.test_db.retrieveAtom(package_id)
+
+        snapshot = EntropyRepositorySnapshot(self.test_db)
+        self.assertEqual(snapshot.listAllPackageIds(),
+                         frozenset(self.test_db.listAllPackageIds()))
+        self.assertEqual(snapshot.getStrictData(package_id),
+                         self.test_db.getStrictData(package_id))
+        self.assertEqual(snapshot.retrieveUseflags(package_id),
+                         self.test_db.retrieveUseflags(package_id))
+        self.assertEqual(snapshot.retrieveConflicts(package_id),
+                         self.test_db.retrieveConflicts(package_id))
+        self.assertEqual(
+            snapshot.retrieveDependencies(package_id, extended = True),
+            self.test_db.retrieveDependencies(package_id, extended = True))
+        self.assertEqual(snapshot.retrieveDependenciesList(package_id),
+                         self.test_db.retrieveDependenciesList(package_id))
+        self.assertEqual(snapshot.atomMatch(key, matchSlot = slot),
+                         self.test_db.atomMatch(key, matchSlot = slot))
+        self.assertEqual(snapshot.atomMatch("=" + atom),
+                         (package_id, 0))
+        self.assertEqual(snapshot.atomMatchMany([key]),
+                         {key: self.test_db.atomMatch(key)})
+        self.assertEqual(snapshot.searchKeySlot(key, slot),
+                         self.test_db.searchKeySlot(key, slot))
+        self.assertEqual(snapshot.retrieveDigest(package_id),
+                         self.test_db.retrieveDigest(package_id))
+        # delegated to the snapshotted repository
+        self.assertEqual(snapshot.retrieveDescription(package_id),
+                         self.test_db.retrieveDescription(package_id))
+
+        # snapshots are frozen
+        self.test_db.removePackage(package_id)
+        self.assertEqual(snapshot.atomMatch(key, matchSlot = slot),
+                         (package_id, 0))
+
+    def test_db_bulk_import(self):
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+
+        package_ids = []
+        with self.test_db.bulkImport():
+            package_ids.append(self.test_db.addPackage(data.copy()))
+            package_ids.append(self.test_db.addPackage(data2.copy()))
+            # intermediate commits are deferred
+            self.test_db.commit()
+        package_ids2 = [self.test_db2.addPackage(data.copy()),
+                        self.test_db2.addPackage(data2.copy())]
+        self.assertEqual(package_ids, package_ids2)
+
+        for package_id in package_ids:
+            db_data = self.test_db.getPackageData(package_id)
+            db_data2 = self.test_db2.getPackageData(package_id)
+            _misc.clean_pkg_metadata(db_data)
+            _misc.clean_pkg_metadata(db_data2)
+            self.assertEqual(db_data, db_data2)
+        self.assertEqual(self.test_db.checksum(), self.test_db2.checksum())
+
+        # a failing import is rolled back
+        def _import():
+            with self.test_db.bulkImport():
+                self.test_db.removePackage(package_ids[0])
+                raise ValueError("rollback")
+        self.assertRaises(ValueError, _import)
+        self.assertTrue(self.test_db.isPackageIdAvailable(package_ids[0]))
+
+        # indexes can be kept while importing
+        def _indexes():
+            cur = self.test_db._cursor().execute("""
+            SELECT name FROM SQLITE_MASTER WHERE type = "index"
+            """)
+            return self.test_db._cur2frozenset(cur)
+        indexes = _indexes()
+        with self.test_db.bulkImport(drop_indexes = False):
+            self.test_db.removePackage(package_ids[0])
+            self.assertEqual(_indexes(), indexes)
+        self.assertFalse(self.test_db.isPackageIdAvailable(package_ids[0]))
+
     def test_db_reverse_deps(self):
 
         test_pkg = _misc.get_test_package()
@@ -752,6 +1162,214 @@ class EntropyRepositoryTest(unittest.TestCase):
         pkg_data = self.test_db.retrieveUnusedPackageIds()
         self.assertEqual(pkg_data, tuple())
 
+    def test_db_reverse_deps_index(self):
+
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+        data2['pkg_dependencies'] += ((
+                _misc.get_test_package_atom(),
+                etpConst['dependency_type_ids']['rdepend_id']),)
+
+        idpackage = self.test_db.addPackage(data)
+        idpackage2 = self.test_db.addPackage(data2)
+
+        rev_deps = self.test_db.retrieveReverseDependencies(idpackage)
+        self.assertEqual(rev_deps, frozenset([idpackage2]))
+        # the persistent index must have been generated
+        self.assertTrue(self.test_db._isReverseDependenciesIndexValid())
+        self.assertEqual(self.test_db.retrieveUnusedPackageIds(),
+            (idpackage2,))
+
+        self.test_db.removePackage(idpackage2)
+        rev_deps = self.test_db.retrieveReverseDependencies(idpackage)
+        self.assertEqual(rev_deps, frozenset())
+        self.assertEqual(self.test_db.retrieveUnusedPackageIds(),
+            (idpackage,))
+
+    def test_db_reverse_deps_index_incremental(self):
+
+        def _index():
+            cur = self.test_db._cursor().execute("""
+            SELECT idpackage, iddependency FROM reversedependencies
+            """)
+            return sorted(cur)
+
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+        data2['pkg_dependencies'] += ((
+                _misc.get_test_package_atom(),
+                etpConst['dependency_type_ids']['rdepend_id']),)
+
+        idpackage2 = self.test_db.addPackage(data2)
+        # generate the index before adding the dependency
+        self.assertEqual(
+            self.test_db.retrieveReverseDependencies(idpackage2),
+            frozenset())
+
+        idpackage = self.test_db.addPackage(data)
+        self.assertEqual(
+            self.test_db.getSetting("reverse_dependencies_checksum"),
+            self.test_db.checksum(include_dependencies = True))
+        self.assertEqual(
+            self.test_db.retrieveReverseDependencies(idpackage),
+            frozenset([idpackage2]))
+
+        incremental = _index()
+        self.test_db._regenerateReverseDependenciesIndex()
+        self.assertEqual(incremental, _index())
+
+        # tracked modifications not touching dependencies keep it valid
+        self.test_db.setDigest(idpackage, "0")
+        self.assertTrue(self.test_db._isReverseDependenciesIndexValid())
+
+        # a repository state not known to the index invalidates it
+        self.test_db._setSetting(self.test_db._CHECKSUM_SETTING, "foo")
+        self.test_db.clearCache()
+        self.assertFalse(self.test_db._isReverseDependenciesIndexValid())
+
+        # and tracked modifications must not make it valid again
+        self.test_db.setDigest(idpackage, "1")
+        self.assertFalse(self.test_db._isReverseDependenciesIndexValid())
+        self.test_db.setCategory(idpackage2, "foo-bar")
+        self.assertFalse(self.test_db._isReverseDependenciesIndexValid())
+
+    def test_db_bulk_retrieve(self):
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        idpackage = self.test_db.addPackage(data)
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+        idpackage2 = self.test_db.addPackage(data2)
+
+        package_ids = [idpackage, idpackage2, -1]
+        self.assertEqual(
+            self.test_db.getStrictDataMany(package_ids),
+            dict((x, self.test_db.getStrictData(x)) for x in \
+                     package_ids if x != -1))
+        self.assertEqual(
+            self.test_db.retrieveKeySlotMany(package_ids),
+            dict((x, self.test_db.retrieveKeySlot(x)) for x in \
+                     package_ids if x != -1))
+        self.assertEqual(
+            self.test_db.retrieveAtomMany(package_ids),
+            dict((x, self.test_db.retrieveAtom(x)) for x in \
+                     package_ids if x != -1))
+
+    def test_db_checksum(self):
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        initial = self.test_db.checksum()
+        idpackage = self.test_db.addPackage(data)
+
+        checksum = self.test_db.checksum()
+        self.assertNotEqual(initial, checksum)
+        self.assertEqual(checksum, self.test_db.checksum())
+
+        # the same content has the same content based checksum
+        self.test_db2.addPackage(data)
+        self.assertEqual(
+            self.test_db.checksum(do_order = True, strict = False),
+            self.test_db2.checksum(do_order = True, strict = False))
+
+        self.test_db.setSlot(idpackage, "1")
+        self.assertNotEqual(checksum, self.test_db.checksum())
+        checksum = self.test_db.checksum()
+
+        self.test_db.removePackage(idpackage)
+        self.assertNotEqual(checksum, self.test_db.checksum())
+        self.assertTrue(self.test_db._getChecksumDigest() is not None)
+
+        # writers not maintaining the digest are detected through the
+        # consistency stamp, the content based checksum is used instead
+        idpackage = self.test_db.addPackage(data)
+        self.test_db._cursor().execute(
+            "DELETE FROM baseinfo WHERE idpackage = ?", (idpackage,))
+        self.test_db.clearCache()
+        self.assertEqual(self.test_db._getChecksumDigest(), None)
+        self.assertEqual(self.test_db.checksum(),
+            self.test_db.checksum(do_order = True))
+
+    def test_db_match_cache(self):
+        from entropy.db.cache import EntropyRepositoryMatchCache
+        cache_dir = const_mkdtemp(prefix="entropy.tests.db")
+        try:
+            store = EntropyRepositoryMatchCache.get(
+                self.test_db_name, cache_dir = cache_dir)
+            self.assertTrue(store is EntropyRepositoryMatchCache.get(
+                self.test_db_name, cache_dir = cache_dir))
+
+            store.store("key1", "hash1", (1, 0))
+            # buffered results are visible before being flushed
+            self.assertEqual(store.fetch("key1", "hash1"), (1, 0))
+            store.flush()
+            self.assertEqual(store.fetch("key1", "hash1"), (1, 0))
+            self.assertEqual(store.fetch("key1", "hash2"), None)
+
+            # results of different validation keys live together
+            self.assertEqual(store.fetch("key2", "hash1"), None)
+            store.store("key2", "hash1", (2, 0))
+            store.flush()
+            self.assertEqual(store.fetch("key1", "hash1"), (1, 0))
+            self.assertEqual(store.fetch("key2", "hash1"), (2, 0))
+
+            # users that cannot write the store still get cache hits
+            reader = EntropyRepositoryMatchCache(store._path)
+            conn = reader._connection()
+            conn.execute("PRAGMA query_only = 1")
+            self.assertEqual(reader.fetch("key2", "hash1"), (2, 0))
+            self.assertTrue(reader._connection() is conn)
+            reader._close()
+
+            # least recently used validation keys are pruned
+            max_keys = EntropyRepositoryMatchCache._MAX_VALIDATION_KEYS
+            for count in range(max_keys):
+                store.store("key%d" % (count + 3,), "hash1", (count, 0))
+            store.flush()
+            self.assertEqual(
+                store.fetch("key%d" % (max_keys + 2,), "hash1"),
+                (max_keys - 1, 0))
+            self.assertEqual(store.fetch("key1", "hash1"), None)
+
+            store.clear()
+            self.assertEqual(store.fetch("key2", "hash1"), None)
+        finally:
+            EntropyRepositoryMatchCache.get(
+                self.test_db_name, cache_dir = cache_dir).clear()
+            shutil.rmtree(cache_dir, True)
+
+    def test_db_wal_mode(self):
+        tmp_dir = const_mkdtemp(prefix="entropy.tests.db")
+        db_path = os.path.join(tmp_dir, "wal.db")
+        journal_mode = etpConst['sqlitejournalmode']
+        etpConst['sqlitejournalmode'] = "wal"
+        try:
+            repo = EntropyRepository(readOnly = False, dbFile = db_path,
+                name = self.test_db_name, skipChecks = True,
+                indexing = False)
+            repo.initializeRepository()
+            test_pkg = _misc.get_test_package()
+            data = self.Spm.extract_package_metadata(test_pkg)
+            package_id = repo.addPackage(data)
+            repo.commit()
+            self.assertTrue(os.path.isfile(db_path + "-wal"))
+            repo.close()
+            # checkpointed and truncated on close
+            self.assertFalse(os.path.isfile(db_path + "-wal"))
+
+            repo = EntropyRepository(readOnly = True, dbFile = db_path,
+                name = self.test_db_name, skipChecks = True,
+                indexing = False, readonly_uri = True)
+            self.assertEqual(repo.listAllPackageIds(),
+                frozenset([package_id]))
+            repo.close()
+        finally:
+            etpConst['sqlitejournalmode'] = journal_mode
+            shutil.rmtree(tmp_dir, True)
+
     def test_similar(self):
         test_pkg = _misc.get_test_package()
         data = self.Spm.extract_package_metadata(test_pkg)
@@ -783,6 +1401,35 @@ class EntropyRepositoryTest(unittest.TestCase):
             slot = "0", just_id = True)
         self.assertEqual(out, (1,))
 
+    def test_search_index(self):
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        idpackage = self.test_db.addPackage(data)
+
+        self.test_db._createSearchIndex()
+        if not self.test_db._isSearchIndexValid():
+            # SQLite built without FTS5 support
+            return
+
+        out = self.test_db.searchPackages(_misc.get_test_package_name())
+        self.assertEqual(out, (('sys-libs/zlib-1.2.3-r1', 1, '5'),))
+        out = self.test_db.searchPackages("sys-libs/zli",
+            slot = "0", just_id = True)
+        self.assertEqual(out, (1,))
+        out = self.test_db.searchName(_misc.get_test_package_name(),
+            just_id = True)
+        self.assertEqual(out, (idpackage,))
+        out = self.test_db.searchDescription(
+            data['description'].split()[0], just_id = True)
+        self.assertEqual(out, frozenset([idpackage]))
+
+        # the index is not used anymore once the repository changes
+        self.test_db.setSlot(idpackage, "1")
+        self.assertFalse(self.test_db._isSearchIndexValid())
+        out = self.test_db.searchPackages(_misc.get_test_package_name(),
+            slot = "1", just_id = True)
+        self.assertEqual(out, (1,))
+
     def test_list_packages(self):
         test_pkg = _misc.get_test_package()
         data = self.Spm.extract_package_metadata(test_pkg)
@@ -899,6 +1546,133 @@ class EntropyRepositoryTest(unittest.TestCase):
         os.remove(buf_file)
         os.remove(new_db_path)
 
+    def test_db_import_export_binary(self):
+        from entropy.db import binarydump
+
+        test_pkg = _misc.get_test_package2()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        data['changelog'] = const_convert_to_unicode(
+            "#248083).\n\n  06 Feb 2009; Ra\xc3\xbal Porcel")
+        idpackage = self.test_db.addPackage(data)
+        db_data = self.test_db.getPackageData(idpackage)
+        _misc.clean_pkg_metadata(db_data)
+
+        set_mute(True)
+        fd, buf_file = const_mkstemp()
+        os.close(fd)
+        with open(buf_file, "wb") as buf:
+            self.test_db.exportRepository(
+                buf, dump_format = self.test_db.DUMP_FORMAT_BINARY)
+        set_mute(False)
+        self.assertTrue(binarydump.is_binary_dump(buf_file))
+
+        fd, new_db_path = const_mkstemp()
+        os.close(fd)
+        rc = self.test_db.importRepository(buf_file, new_db_path)
+        self.assertEqual(rc, 0)
+        new_db = self.Client.open_generic_repository(new_db_path)
+        new_db_data = new_db.getPackageData(idpackage)
+        _misc.clean_pkg_metadata(new_db_data)
+        new_db.close()
+        self.assertEqual(new_db_data, db_data)
+
+        # truncated dumps are rejected
+        with open(buf_file, "rb") as buf:
+            dump_data = buf.read()
+        with open(buf_file, "wb") as buf:
+            buf.write(dump_data[:len(dump_data) // 2])
+        self.assertEqual(
+            self.test_db.importRepository(buf_file, new_db_path), 1)
+
+        os.remove(buf_file)
+        os.remove(new_db_path)
+
+    def test_db_lazy_package_data(self):
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        package_id = self.test_db.addPackage(data)
+
+        lazy_data = self.test_db.getLazyPackageData(package_id)
+        self.assertFalse("useflags" in lazy_data.resolved())
+        self.assertEqual(lazy_data['useflags'],
+            self.test_db.retrieveUseflags(package_id))
+        self.assertTrue("useflags" in lazy_data.resolved())
+        self.assertFalse("content" in lazy_data.resolved())
+        self.assertEqual(dict(lazy_data),
+            self.test_db.getPackageData(package_id))
+
+        del lazy_data['content']
+        self.assertFalse("content" in lazy_data)
+        lazy_data['content'] = {}
+        self.assertEqual(lazy_data['content'], {})
+
+        lazy_data = self.test_db.getLazyPackageData(package_id,
+            prefetch = ["dependencies"])
+        self.assertTrue("pkg_dependencies" in lazy_data.resolved())
+        self.assertEqual(self.test_db.getLazyPackageData(package_id + 1),
+            None)
+
+    def test_db_changeset(self):
+        from entropy.db import changeset
+
+        test_pkg = _misc.get_test_package()
+        data = self.Spm.extract_package_metadata(test_pkg)
+        old_package_id = self.test_db.addPackage(data)
+        self.test_db2.addPackage(data, package_id = old_package_id)
+
+        test_pkg2 = _misc.get_test_package2()
+        data2 = self.Spm.extract_package_metadata(test_pkg2)
+        package_id = self.test_db.addPackage(data2)
+        self.test_db.removePackage(old_package_id)
+        self.test_db.insertPackageSets({"myset": set(["app-foo/bar"])})
+        self.test_db.commit()
+
+        fd, changeset_file = const_mkstemp()
+        os.close(fd)
+        changeset.write_changeset(self.test_db, changeset_file,
+            self.test_db_name, 1, 2, [package_id], [old_package_id])
+
+        # changesets must be consecutive
+        self.assertRaises(changeset.ChangesetError,
+            changeset.apply_changesets, self.test_db2,
+            self.test_db_name, [changeset_file], 2)
+        self.assertEqual(self.test_db2.listAllPackageIds(),
+            [old_package_id])
+
+        revision = changeset.apply_changesets(self.test_db2,
+            self.test_db_name, [changeset_file], 1)
+        self.assertEqual(revision, 2)
+        self.assertEqual(self.test_db2.listAllPackageIds(), [package_id])
+        self.assertEqual(self.test_db2.retrievePackageSets(),
+            self.test_db.retrievePackageSets())
+        self.assertEqual(
+            self.test_db2.checksum(do_order = True, strict = False,
+                include_signatures = True),
+            self.test_db.checksum(do_order = True, strict = False,
+                include_signatures = True))
+
+        db_data = self.test_db.getPackageData(package_id,
+            get_content = False, get_changelog = False)
+        new_db_data = self.test_db2.getPackageData(package_id,
+            get_content = False, get_changelog = False)
+        _misc.clean_pkg_metadata(db_data)
+        _misc.clean_pkg_metadata(new_db_data)
+        self.assertEqual(new_db_data, db_data)
+
+        # in place metadata changes must show up in the fingerprints
+        fingerprints = changeset.package_fingerprints(
+            self.test_db, [package_id])
+        self.assertEqual(fingerprints, changeset.package_fingerprints(
+            self.test_db2, [package_id]))
+        self.test_db.setDigest(package_id, "0" * 32)
+        self.assertNotEqual(fingerprints, changeset.package_fingerprints(
+            self.test_db, [package_id]))
+
+        entries = [(1, 2, "c2", "md5"), (2, 4, "c4", "md5")]
+        self.assertEqual(changeset.changeset_chain(entries, 1, 4), entries)
+        self.assertEqual(changeset.changeset_chain(entries, 2, 3), None)
+        os.remove(changeset_file)
+
     def test_use_defaults(self):
         test_pkg = _misc.get_test_package()
         data = self.Spm.extract_package_metadata(test_pkg)
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Repository write benchmarks.
+
+Usage (from lib/tests): python db_benchmark.py [<packages count>]
+
+Compare the import of synthetic packages into a server-side repository
+through plain addPackage() calls, committing after every package, and
+inside EntropySQLRepository.bulkImport().
+"""
+import sys
+sys.path.insert(0, '.')
+sys.path.insert(0, '../')
+import os
+import shutil
+import time
+
+from entropy.const import etpConst, const_mkdtemp
+from entropy.db import EntropyRepository
+
+
+def _package_data(index):
+    """
+    Return synthetic package metadata, each package depends on the
+    previous ones and ships a few files.
+    """
+    name = "pkg%d" % (index,)
+    version = "1.%d" % (index % 7,)
+    rdepend_id = etpConst['dependency_type_ids']['rdepend_id']
+    dependencies = ["app-misc/pkg%d" % (x,) for x in
+                    range(max(0, index - 3), index)]
+    dependencies.append(">=sys-libs/zlib-1.2")
+    content = dict(("/usr/share/%s/file%d" % (name, x), "obj")
+                   for x in range(20))
+    content["/usr/share/%s" % (name,)] = "dir"
+
+    return {
+        'revision': 0,
+        'category': "app-misc",
+        'name': name,
+        'version': version,
+        'versiontag': "",
+        'branch': "5",
+        'slot': "0",
+        'license': "GPL-2",
+        'etpapi': 3,
+        'trigger': "",
+        'chost': "x86_64-pc-linux-gnu",
+        'cflags': "-O2",
+        'cxxflags': "-O2",
+        'config_protect': "/etc",
+        'config_protect_mask': "",
+        'description': "synthetic package %s" % (name,),
+        'homepage': "http://www.sabayon.org",
+        'download': "packages/app-misc:%s-%s.tbz2" % (name, version),
+        'size': "1024",
+        'digest': "0" * 32,
+        'datecreation': "1300000000",
+        'needed_libs': [],
+        'pkg_dependencies': tuple((x, rdepend_id) for x in dependencies),
+        'sources': set(["http://www.sabayon.org/%s.tar.xz" % (name,)]),
+        'useflags': set(["nls", "-doc"]),
+        'keywords': set(["amd64", "~amd64"]),
+        'licensedata': {},
+        'mirrorlinks': [],
+        'content': content,
+        'counter': -1,
+        'injected': False,
+        'disksize': 4096,
+        'conflicts': set(),
+        'provide_extended': set(),
+        'systempackage': False,
+        'provided_libs': set(),
+        'spm_phases': None,
+    }
+
+
+def _open_repository(path):
+    repo = EntropyRepository(readOnly = False, dbFile = path,
+        name = "benchmark", xcache = False, indexing = True,
+        skipChecks = True, temporary = False)
+    repo.initializeRepository()
+    return repo
+
+
+def _import(path, count, bulk):
+    repo = _open_repository(path)
+    t1 = time.time()
+    if bulk:
+        with repo.bulkImport():
+            for index in range(count):
+                repo.addPackage(_package_data(index))
+                repo.commit()
+    else:
+        for index in range(count):
+            repo.addPackage(_package_data(index))
+            repo.commit()
+        repo.createAllIndexes()
+        repo.commit()
+    elapsed = time.time() - t1
+    repo.close()
+    return elapsed
+
+
+def main(count):
+    tmp_dir = const_mkdtemp(prefix="entropy.db_benchmark")
+    try:
+        plain = _import(os.path.join(tmp_dir, "plain.db"), count, False)
+        bulk = _import(os.path.join(tmp_dir, "bulk.db"), count, True)
+    finally:
+        shutil.rmtree(tmp_dir, True)
+
+    sys.stdout.write("%d packages\n" % (count,))
+    sys.stdout.write("addPackage():  %.2fs\n" % (plain,))
+    sys.stdout.write("bulkImport():  %.2fs (%.1fx)\n" % (bulk, plain / bulk))
+    return 0
+
+
+if __name__ == "__main__":
+    packages = 3000
+    if len(sys.argv) > 1:
+        packages = int(sys.argv[1])
+    raise SystemExit(main(packages))
@@ -111,6 +111,34 @@ class DepTest(unittest.TestCase):
         result = "app-foo/foo-1.2.3:2.3.4~1"
         self.assertEqual(result, et.remove_package_operators(pkg))
 
+    def test_atom(self):
+        pkg = ">=app-foo/foo-1.2.3-r1#2.6.3-foo~1:2.3[bar,-baz]@foorepo"
+        atom = et.Atom.parse(pkg)
+        self.assertTrue(atom is et.Atom.parse(pkg))
+        self.assertEqual(atom.operator, ">=")
+        self.assertEqual(atom.key, "app-foo/foo")
+        self.assertEqual(atom.category, "app-foo")
+        self.assertEqual(atom.name, "foo")
+        self.assertEqual(atom.version, "1.2.3-r1")
+        self.assertEqual(atom.tag, et.dep_gettag(pkg))
+        self.assertEqual(atom.slot, et.dep_getslot(pkg))
+        self.assertEqual(atom.use, ("bar", "-baz"))
+        self.assertEqual(atom.repositories, ["foorepo"])
+        self.assertFalse(atom.justname)
+        self.assertRaises(AttributeError, setattr, atom, "name", "bar")
+
+        atom = et.Atom.parse("=app-foo/foo-1.2.3#2.6.3-foo~1")
+        self.assertEqual(atom.revision, 1)
+        self.assertEqual(atom.tag, "2.6.3-foo")
+        self.assertEqual(atom.version, "1.2.3-r0")
+        self.assertEqual(atom.repositories, None)
+
+        atom = et.Atom.parse("foo")
+        self.assertEqual(atom.key, "foo")
+        self.assertEqual(atom.category, "null")
+        self.assertEqual(atom.version, "")
+        self.assertTrue(atom.justname)
+
     def test_compare_versions(self):
         ver_a = ("1.0.0", "1.0.0", 0,)
         ver_b = ("1.0.1", "1.0.0", 0.10000000000000001,)
@@ -120,6 +148,24 @@ class DepTest(unittest.TestCase):
         self.assertEqual(et.compare_versions(ver_b[0], ver_b[1]), ver_b[2])
         self.assertEqual(et.compare_versions(ver_c[0], ver_c[1]), ver_c[2])
 
+    def test_version_key(self):
+        vers = ["1.0", "1.0.0", "1.0a", "1.02", "1.1", "1.10", "1.0_rc1",
+            "1.0_p1", "1.0_p0_alpha1", "1.0-r1", "1.0_beta2_p1", "invalid"]
+        for ver_a in vers:
+            for ver_b in vers:
+                if "invalid" in (ver_a, ver_b):
+                    continue
+                cmp_rc = et.compare_versions(ver_a, ver_b)
+                key_a, key_b = et.version_key(ver_a), et.version_key(ver_b)
+                self.assertEqual(cmp_rc > 0, key_a > key_b)
+                self.assertEqual(cmp_rc == 0, key_a == key_b)
+        self.assertEqual(min(vers, key = et.version_key), "invalid")
+
+        ver_data = [("1.0", "2222", 1,), ("3.4", "2222", 0,),
+            ("1.0", "2223", 1,), ("1.0", "2223", 0,)]
+        self.assertEqual(max(ver_data, key = et.entropy_version_key),
+            ("1.0", "2223", 1,))
+
     def test_get_newer_version(self):
         vers = ["1.0", "3.4", "0.5", "999", "9999", "10.0"]
         out_vers = ['9999', '999', '10.0', '3.4', '1.0', '0.5']
@@ -132,6 +178,11 @@ class DepTest(unittest.TestCase):
             ('3.4', '2222', 0), ('1.0', '2222', 1)]
         self.assertEqual(et.get_entropy_newer_version(vers), out_vers)
 
+        # versions are compared first when only one package is tagged
+        vers = [("1.0", "2223", 1,), ("3.4", "", 0,)]
+        out_vers = [('3.4', '', 0), ('1.0', '2223', 1)]
+        self.assertEqual(et.get_entropy_newer_version(vers), out_vers)
+
     def test_create_package_filename(self):
         package_category = "app-foo"
         package_name = "foo"